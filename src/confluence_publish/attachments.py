@@ -0,0 +1,118 @@
+"""local assets (images, files) referenced by rendered docs
+
+Assets are files next to the scripts referenced by <img src> or
+<a href> in Litterate.body: they become page attachments, and the body
+is rewritten to point at them in Confluence storage format.
+
+The sha256 of each asset is stored in the attachment comment, so an
+attachment is uploaded only when its content changed; files are hashed
+and uploaded from memory mapped reads, never loaded whole.
+"""
+import hashlib
+import html
+import mmap
+import os
+import re
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+
+COMMENT_PREFIX = "sha256:"
+
+_IMG_RE = re.compile(r"<img\s[^>]*?src=\"([^\"]+)\"[^>]*?/?>", re.IGNORECASE)
+# a link (href, text) and a href (or src) not pointing to a local file
+LINK_RE = re.compile(
+    r"<a\s[^>]*?href=\"([^\"]+)\"[^>]*>(.*?)</a>", re.IGNORECASE | re.DOTALL
+)
+REMOTE_RE = re.compile(r"^([a-z][a-z0-9+.-]*:|/|#)", re.IGNORECASE)
+
+# (path, size, mtime_ns) -> hexdigest
+_digests: Dict[Tuple[str, int, int], str] = {}
+
+
+def _local(src: str, basedir: Path) -> Optional[Path]:
+    src = html.unescape(src)
+    if REMOTE_RE.match(src) or src.endswith(".py"):
+        return None
+    path = basedir / src
+    try:
+        # never upload a file from outside basedir (../, absolute paths)
+        path.resolve().relative_to(basedir.resolve())
+    except ValueError:
+        return None
+    return path if path.is_file() else None
+
+
+def find_assets(body: str, basedir: Path) -> Tuple[str, List[Path]]:
+    """finds local assets in body and rewrites their references
+
+    Args:
+        body: the rendered (html) body
+        basedir: directory relative references are resolved from (those
+            pointing outside of it are left alone)
+    Returns:
+        str, list: the rewritten body and the (unique) asset paths
+    """
+    assets: Dict[Path, None] = {}
+
+    def image(match):
+        path = _local(match.group(1), basedir)
+        if path is None:
+            return match.group(0)
+        assets[path] = None
+        name = html.escape(path.name, quote=True)
+        return f'<ac:image><ri:attachment ri:filename="{name}" /></ac:image>'
+
+    def link(match):
+        path = _local(match.group(1), basedir)
+        if path is None:
+            return match.group(0)
+        assets[path] = None
+        name = html.escape(path.name, quote=True)
+        text = html.unescape(re.sub(r"<[^>]+>", "", match.group(2)))
+        text = text.replace("]]>", "]]]]><![CDATA[>")
+        return (
+            f'<ac:link><ri:attachment ri:filename="{name}" />'
+            f"<ac:plain-text-link-body><![CDATA[{text}]]></ac:plain-text-link-body>"
+            "</ac:link>"
+        )
+
+    body = LINK_RE.sub(link, _IMG_RE.sub(image, body))
+    return body, list(assets)
+
+
+def stamp(paths: Iterable[Path]) -> str:
+    """a cheap (stat based) signature of paths, to detect changed assets"""
+    result = []
+    for path in paths:
+        try:
+            stat = path.stat()
+            result.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            result.append(f"{path}:-")
+    return "\n".join(result)
+
+
+def file_digest(path: Path) -> str:
+    """sha256 of path, memoized on (path, size, mtime)"""
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _digests:
+        digest = hashlib.sha256()
+        if stat.st_size:
+            with path.open("rb") as fp, mmap.mmap(
+                fp.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                digest.update(data)
+        _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+
+async def chunks(path: Path, size: int = 256 * 1024) -> AsyncIterator[bytes]:
+    """yields the content of path in chunks, from a memory mapped read"""
+    if not os.path.getsize(path):
+        return
+    with path.open("rb") as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset in range(0, len(data), size):
+                yield data[offset : offset + size]
@@ -0,0 +1,258 @@
+"""batch extraction of __doc__ from large script libraries
+
+Example:
+    for result in batch.load_docs(batch.discover(["scripts/"]), workers=4):
+        if result.error:
+            print(f"{result.path}: {result.error}")
+"""
+import collections
+import contextlib
+import dataclasses as dc
+import functools
+import glob
+import hashlib
+import itertools
+import logging
+import os
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple,
+    Union,
+)
+
+from . import doc2lit, stats
+
+if TYPE_CHECKING:
+    import concurrent.futures as cf
+
+
+log = logging.getLogger(__name__)
+
+
+@dc.dataclass
+class DocResult:
+    path: Path
+    doc: str = ""
+    error: Optional[str] = None
+    lit: Optional[doc2lit.Litterate] = None
+    cached: bool = False
+    timings: Dict[str, float] = dc.field(default_factory=dict)
+    sha256: str = ""  # of the file content (render_docs only)
+
+
+def glob_base(pattern: str) -> str:
+    """the leading directories of pattern without glob characters"""
+    parts = []
+    for part in Path(pattern).parts:
+        if any(c in part for c in "*?["):
+            break
+        parts.append(part)
+    return str(Path(*parts)) if parts else "."
+
+
+def discover(
+    sources: Iterable[Union[str, Path]], pattern: str = "*.py"
+) -> Iterator[Path]:
+    """expands sources (files, directories or globs) into script paths
+
+    Directories are walked recursively for files matching pattern, globs
+    are expanded (** is supported) and plain files are passed through;
+    every path is reported once, in a stable (sorted) order per source.
+
+    Args:
+        sources: files, directories or glob expressions
+        pattern: file pattern used when walking directories
+    Returns:
+        iterator of Path
+    """
+    seen = set()
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            found = sorted(p for p in path.rglob(pattern) if p.is_file())
+        elif path.exists():
+            found = [path]
+        else:
+            found = sorted(Path(p) for p in glob.glob(str(source), recursive=True))
+            if not found:
+                log.warning("no match for %s", source)
+        for item in found:
+            if item in seen:
+                continue
+            seen.add(item)
+            yield item
+
+
+def _load(path: Path) -> DocResult:
+    with stats.collect() as timings:
+        try:
+            with stats.timer("load_doc"):
+                result = DocResult(path, doc2lit.load_doc(path))
+        except Exception as exc:
+            result = DocResult(path, error=f"{exc.__class__.__name__}: {exc}")
+    result.timings = timings
+    return result
+
+
+def _load_chunk(paths: List[Path]) -> List[DocResult]:
+    return [_load(path) for path in paths]
+
+
+def _accounted(results: Iterable[DocResult]) -> Iterator[DocResult]:
+    for result in results:
+        if stats.STATS.enabled:
+            stats.STATS.merge(result.timings, str(result.path))
+            stats.STATS.count("files")
+            stats.STATS.count("errors", bool(result.error))
+            stats.STATS.count("cache_hits", result.cached)
+        yield result
+
+
+def imap(
+    func: Callable[[List], List],
+    items: Iterable,
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    executor: Optional["cf.Executor"] = None,
+) -> Iterator:
+    """maps func over chunks of items on a process pool, yielding in order
+
+    Unlike Executor.map this doesn't consume items upfront: at most
+    2 * workers chunks are in flight at any time, so memory stays bounded
+    for arbitrarily long inputs.
+
+    Args:
+        func: picklable callable taking a list of items and returning a list
+        items: input items
+        workers: number of processes (0, or a single chunk of items, runs in process)
+        chunksize: items sent to a worker at once
+        executor: use this executor instead of creating a new one
+    Returns:
+        iterator over the (flattened) func results
+    """
+    source = iter(items)
+    chunks = iter(lambda: list(itertools.islice(source, chunksize)), [])
+    if workers == 0:
+        for chunk in chunks:
+            yield from func(chunk)
+        return
+
+    # a single chunk (eg. a hook publishing a few files) doesn't pay for a pool
+    head = list(itertools.islice(chunks, 2))
+    if len(head) < 2 and executor is None:
+        for chunk in head:
+            yield from func(chunk)
+        return
+    chunks = itertools.chain(head, chunks)
+
+    import concurrent.futures as cf  # multiprocessing is slow to import
+
+    with (
+        contextlib.nullcontext(executor)
+        if executor
+        else cf.ProcessPoolExecutor(workers)
+    ) as pool:
+        inflight = 2 * (workers or os.cpu_count() or 1)
+        pending: Deque[cf.Future] = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.submit(func, chunk))
+            if len(pending) >= inflight:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def load_docs(
+    paths: Iterable[Path], workers: Optional[int] = None, chunksize: int = 16
+) -> Iterator[DocResult]:
+    """extracts the __doc__ part from many paths on a process pool
+
+    Results are streamed back in the same order as paths; a file that
+    cannot be read or parsed reports its error in DocResult.error and
+    doesn't stop the run.
+
+    Args:
+        paths: script locations
+        workers: number of processes (None uses os.cpu_count(), 0 runs serially)
+        chunksize: number of paths handed to a worker at once
+    Returns:
+        iterator of DocResult
+    """
+    yield from _accounted(
+        imap(_load_chunk, paths, workers=workers, chunksize=chunksize)
+    )
+
+
+def _render_chunk(
+    paths: List[Path],
+    kind: doc2lit.LitterateType,
+    cachedir: Optional[Path],
+    extras: Optional[Tuple[str, ...]] = None,
+    keep_raw: bool = True,
+) -> List[DocResult]:
+    from .cache import Cache
+
+    cache = Cache(cachedir) if cachedir else None
+    results = []
+    for path in paths:
+        with stats.collect() as timings:
+            try:
+                with stats.timer("read"):
+                    content = path.read_bytes()
+                with stats.timer("cache"):
+                    key = cache.key(content, kind, extras or ()) if cache else ""
+                    lit = cache.get(key) if cache else None
+                result = DocResult(path, cached=lit is not None)
+                result.sha256 = hashlib.sha256(content).hexdigest()
+                if lit is None:
+                    with stats.timer("get_doc"):
+                        doc = doc2lit.get_doc(doc2lit.decode_source(content))
+                    lit = doc2lit.render(doc, kind, extras)
+                    if cache:
+                        with stats.timer("cache"):
+                            cache.put(key, lit)
+                result.doc, result.lit = lit.raw, lit
+                if not keep_raw:
+                    result.doc = lit.raw = ""
+            except Exception as exc:
+                result = DocResult(path, error=f"{exc.__class__.__name__}: {exc}")
+        result.timings = timings
+        results.append(result)
+    return results
+
+
+def render_docs(
+    paths: Iterable[Path],
+    kind: doc2lit.LitterateType = doc2lit.LitterateType.MD,
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    cachedir: Optional[Path] = None,
+    extras: Optional[Iterable[str]] = None,
+    keep_raw: bool = True,
+) -> Iterator[DocResult]:
+    """extracts and renders the __doc__ part from many paths
+
+    Like load_docs, but each DocResult carries the rendered Litterate too;
+    with a cachedir, files whose content didn't change are served from
+    the cache (see cache.Cache) without being parsed or rendered.
+
+    Args:
+        paths: script locations
+        kind: renderer to use
+        workers: number of processes (None uses os.cpu_count(), 0 runs serially)
+        chunksize: number of paths handed to a worker at once
+        cachedir: cache directory
+        extras: markdown2 extras (see doc2lit.md2lit)
+        keep_raw: keep the doc text (DocResult.doc and Litterate.raw), the
+                  pages only need the rendered body
+    Returns:
+        iterator of DocResult
+    """
+    func = functools.partial(
+        _render_chunk,
+        kind=kind,
+        cachedir=cachedir,
+        extras=None if extras is None else tuple(extras),
+        keep_raw=keep_raw,
+    )
+    yield from _accounted(imap(func, paths, workers=workers, chunksize=chunksize))
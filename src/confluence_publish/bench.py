@@ -0,0 +1,286 @@
+"""benchmarks for the doc2lit extraction and rendering hot paths
+
+Runs get_doc, popmeta, detect, md2lit and rst2lit over a synthetic corpus (from
+small docstrings to multi-MB ones, with growing meta blocks) reporting
+throughput (docs/s, MB/s) and peak memory for each function and size,
+optionally comparing against a saved baseline.
+
+Examples:
+    python -m confluence_publish.bench --save build/bench.json
+    python -m confluence_publish.bench --baseline build/bench.json --tolerance 0.2
+"""
+import argparse
+import dataclasses as dc
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import doc2lit
+
+
+# name -> (docstring size in bytes, meta keys, number of docs)
+TIERS: Dict[str, Tuple[int, int, int]] = {
+    "small": (1024, 4, 200),
+    "medium": (64 * 1024, 16, 20),
+    "large": (1024 * 1024, 64, 3),
+    "huge": (4 * 1024 * 1024, 256, 1),
+}
+
+_WORDS = (
+    "script publish confluence page title summary body render meta the a of "
+    "to and in for with data value option parser library tree root"
+).split()
+
+
+def _sentence(rng: random.Random, words: int = 12) -> str:
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def make_meta(rng: random.Random, keys: int) -> str:
+    lines = []
+    for index in range(keys):
+        if index % 4 == 3:
+            lines.append(f"key{index}: >")
+            lines.extend(f"  {_sentence(rng)}" for _ in range(3))
+        else:
+            lines.append(f"key{index}: {_sentence(rng, 4)}")
+    return "\n".join(lines)
+
+
+def _md_block(rng: random.Random, index: int) -> str:
+    kind = index % 5
+    if kind == 0:
+        return f"## Section {index}"
+    if kind == 1:
+        return "\n".join(f"* {_sentence(rng, 6)}" for _ in range(4))
+    if kind == 2:
+        return "```\n" + "\n".join(f"x{i} = {i}" for i in range(4)) + "\n```"
+    if kind == 3:
+        rows = [f"| {rng.randint(0, 999)} | {rng.choice(_WORDS)} |" for _ in range(4)]
+        return "| a | b |\n|---|---|\n" + "\n".join(rows)
+    return " ".join(_sentence(rng) for _ in range(4))
+
+
+def _rst_block(rng: random.Random, index: int) -> str:
+    kind = index % 4
+    if kind == 0:
+        title = f"Section {index}"
+        return f"{title}\n{'-' * len(title)}"
+    if kind == 1:
+        return "\n".join(f"* {_sentence(rng, 6)}" for _ in range(4))
+    if kind == 2:
+        return "::\n\n" + "\n".join(f"    x{i} = {i}" for i in range(4))
+    return " ".join(_sentence(rng) for _ in range(4))
+
+
+def make_doc(
+    size: int,
+    meta: int = 4,
+    kind: doc2lit.LitterateType = doc2lit.LitterateType.MD,
+    seed: int = 0,
+) -> str:
+    """returns a docstring of about size bytes, with meta keys
+
+    Args:
+        size: target size in bytes (the meta block is extra)
+        meta: number of keys in the meta block
+        kind: markdown or rst body
+        seed: random seed (the result is deterministic)
+    Returns:
+        str - meta block, endmeta tag and body
+    """
+    rng = random.Random(seed)
+    block = _md_block if kind == doc2lit.LitterateType.MD else _rst_block
+    title = "Document title"
+    parts = [make_meta(rng, meta), "== endmeta ==", f"{title}\n{'=' * len(title)}"]
+    total = 0
+    index = 1
+    while total < size:
+        parts.append(block(rng, index))
+        total += len(parts[-1]) + 2
+        index += 1
+    return "\n\n".join(parts[:2]) + "\n" + "\n\n".join(parts[2:]) + "\n"
+
+
+def make_script(doc: str, functions: int = 50) -> str:
+    """wraps doc into a python script"""
+    code = "".join(
+        f"def func{i}(a, b):\n    return a + b * {i}\n\n" for i in range(functions)
+    )
+    return f'"""\n{doc.replace(chr(92), chr(92) * 2)}"""\n\n{code}'
+
+
+def corpus(
+    tier: str, kind: doc2lit.LitterateType = doc2lit.LitterateType.MD
+) -> List[str]:
+    size, meta, count = TIERS[tier]
+    return [make_doc(size, meta, kind, seed) for seed in range(count)]
+
+
+@dc.dataclass
+class Result:
+    name: str
+    tier: str
+    docs: int
+    bytes: int
+    seconds: float
+    peak: int
+
+    @property
+    def docs_per_s(self) -> float:
+        return self.docs / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.bytes / 2 ** 20 / self.seconds if self.seconds else 0.0
+
+
+def measure(
+    name: str,
+    tier: str,
+    func: Callable[[str], object],
+    docs: List[str],
+    repeat: int = 3,
+) -> Result:
+    """times func over docs (best of repeat) and tracks its peak memory"""
+    func(docs[0])  # warm up (imports, caches)
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for doc in docs:
+            func(doc)
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for doc in docs:
+            func(doc)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    size = sum(len(doc.encode("utf-8")) for doc in docs)
+    return Result(name, tier, len(docs), size, best, peak)
+
+
+def _uncached_popmeta(txt: str):
+    doc2lit._parse_meta.cache_clear()
+    return doc2lit.popmeta(txt)
+
+
+@dc.dataclass
+class Benchmark:
+    func: Callable[[str], object]
+    kind: doc2lit.LitterateType = doc2lit.LitterateType.MD
+    script: bool = False  # the input is a python script
+    tiers: Tuple[str, ...] = tuple(TIERS)  # the default tiers
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "get_doc": Benchmark(doc2lit.get_doc, script=True),
+    "popmeta": Benchmark(_uncached_popmeta),
+    "detect": Benchmark(doc2lit.detect),
+    # the renderers are superlinear on large docs (markdown2 lists in
+    # particular): the large and huge tiers are run only on request
+    "md2lit": Benchmark(doc2lit.md2lit, tiers=("small", "medium")),
+    "rst2lit": Benchmark(
+        doc2lit.rst2lit, doc2lit.LitterateType.RST, tiers=("small", "medium")
+    ),
+}
+
+
+def run(
+    names: Optional[List[str]] = None,
+    tiers: Optional[List[str]] = None,
+    repeat: int = 3,
+    scale: float = 1.0,
+) -> Iterator[Result]:
+    """runs the benchmarks (all by default) over the tiers
+
+    Args:
+        names: benchmark names (see BENCHMARKS)
+        tiers: corpus tiers (see TIERS, defaults to each benchmark tiers)
+        repeat: timing repetitions (best is kept)
+        scale: scales the number of docs per tier (at least one)
+    Returns:
+        iterator of Result
+    """
+    for name in names or list(BENCHMARKS):
+        bench = BENCHMARKS[name]
+        for tier in tiers or bench.tiers:
+            docs = corpus(tier, bench.kind)
+            docs = docs[: max(1, int(len(docs) * scale))]
+            if bench.script:
+                docs = [make_script(doc) for doc in docs]
+            yield measure(name, tier, bench.func, docs, repeat)
+
+
+def compare(
+    results: List[Result], baseline: Dict[str, Dict], tolerance: float = 0.2
+) -> List[str]:
+    """returns the regressions (throughput below baseline by over tolerance)"""
+    regressions = []
+    for result in results:
+        old = baseline.get(f"{result.name}/{result.tier}")
+        if not old or not old.get("docs_per_s"):
+            continue
+        ratio = result.docs_per_s / old["docs_per_s"]
+        if ratio < 1 - tolerance:
+            regressions.append(
+                f"{result.name}/{result.tier}: {result.docs_per_s:.1f} docs/s"
+                f" vs {old['docs_per_s']:.1f} ({ratio - 1:+.0%})"
+            )
+    return regressions
+
+
+def to_json(results: List[Result]) -> Dict[str, Dict]:
+    return {
+        f"{r.name}/{r.tier}": dict(
+            dc.asdict(r), docs_per_s=r.docs_per_s, mb_per_s=r.mb_per_s
+        )
+        for r in results
+    }
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-b", "--bench", action="append", choices=list(BENCHMARKS))
+    parser.add_argument("-t", "--tier", action="append", choices=list(TIERS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--save", type=Path, help="write results as json")
+    parser.add_argument("--baseline", type=Path, help="compare with saved results")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    options = parser.parse_args(args)
+
+    results = []
+    print(f"{'benchmark':<20} {'docs/s':>10} {'MB/s':>8} {'peak MB':>8}")
+    for result in run(options.bench, options.tier, options.repeat, options.scale):
+        results.append(result)
+        print(
+            f"{result.name + '/' + result.tier:<20} {result.docs_per_s:>10.1f}"
+            f" {result.mb_per_s:>8.2f} {result.peak / 2 ** 20:>8.2f}"
+        )
+
+    if options.save:
+        options.save.parent.mkdir(parents=True, exist_ok=True)
+        options.save.write_text(json.dumps(to_json(results), indent=2, sort_keys=True))
+    if options.baseline:
+        regressions = compare(
+            results, json.loads(options.baseline.read_text()), options.tolerance
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
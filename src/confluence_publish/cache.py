@@ -0,0 +1,138 @@
+"""on disk cache for rendered Litterate objects
+
+Entries are keyed by the sha256 of the source file content, the renderer
+kind, its version and options (eg. markdown extras): an unchanged file is
+never parsed or rendered twice.
+
+Example:
+    cache = Cache(Path("~/.cache/confluence-publish").expanduser())
+    key = cache.key(path.read_bytes(), LitterateType.MD)
+    lit = cache.get(key)
+    if lit is None:
+        lit = doc2lit.render(doc2lit.load_doc(path), LitterateType.MD)
+        cache.put(key, lit)
+"""
+import dataclasses as dc
+import functools
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+from .doc2lit import Litterate, LitterateType, renderer_version
+
+
+log = logging.getLogger(__name__)
+
+
+def dump(lit: Litterate) -> dict:
+    """serializes a Litterate into a json compatible dict"""
+    result = dc.asdict(lit)
+    result["kind"] = lit.kind.name if lit.kind else None
+    return result
+
+
+def load(data: dict) -> Litterate:
+    """builds a Litterate from dump() output"""
+    data = dict(data)
+    data["kind"] = LitterateType[data["kind"]] if data.get("kind") else None
+    if data.get("meta"):
+        data["meta"] = {sys.intern(k): v for k, v in data["meta"].items()}
+    return Litterate(**data)
+
+
+_renderer_version = functools.lru_cache(maxsize=None)(renderer_version)
+
+
+class Cache:
+    """a directory of json serialized Litterate
+
+    Writes go to a temporary file that is atomically renamed in place, so
+    concurrent writers (threads, processes or CI jobs sharing the
+    directory) never expose partial entries: the last writer wins and all
+    writers store the same content for the same key anyway.
+
+    Args:
+        path: cache directory (created on demand)
+        maxsize: evict() trims the cache down to this many bytes
+        maxage: evict() removes entries not used for maxage seconds
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        maxsize: int = 512 * 2 ** 20,
+        maxage: float = 30 * 24 * 3600,
+    ):
+        self.path = Path(path)
+        self.maxsize = maxsize
+        self.maxage = maxage
+
+    @staticmethod
+    def key(content: bytes, kind: LitterateType, options: Iterable[str] = ()) -> str:
+        digest = hashlib.sha256(content)
+        digest.update(f"\0{kind.name}\0{_renderer_version(kind)}".encode())
+        digest.update("\0".join(sorted(options)).encode())
+        return digest.hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Litterate]:
+        entry = self._entry(key)
+        try:
+            data = json.loads(entry.read_text())
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(entry)  # keeps track of usage for evict()
+        except OSError:
+            pass
+        return load(data)
+
+    def put(self, key: str, lit: Litterate) -> None:
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(dump(lit), fp)
+            os.replace(tmp, entry)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def evict(self) -> int:
+        """removes expired entries, then the least recently used over maxsize
+
+        Returns:
+            int - number of removed entries
+        """
+        entries = []
+        for entry in self.path.glob("*/*.json"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort(reverse=True)
+
+        removed = 0
+        total = 0
+        limit = time.time() - self.maxage
+        for mtime, size, entry in entries:
+            total += size
+            if mtime >= limit and total <= self.maxsize:
+                continue
+            try:
+                entry.unlink()
+                removed += 1
+            except OSError:
+                pass
+        log.debug("evicted %i entries from %s", removed, self.path)
+        return removed
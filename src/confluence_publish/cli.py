@@ -1,5 +1,9 @@
 import argparse
+import functools
 import logging
+import os
+from copy import deepcopy
+from typing import Any, Dict, Tuple
 
 
 class Argument:
@@ -52,7 +56,7 @@ class ArgumentParser(argparse.ArgumentParser):
             self._xarguments[-1].add_arguments(self, **kwargs)
             return
         argument = super(ArgumentParser, self).add_argument(*args, **kwargs)
-        if kwargs.get("action") in { "append_const"}:
+        if kwargs.get("action") in {"append", "append_const"}:
             argument.default.asiterable = True
         return argument
 
@@ -60,7 +64,10 @@ class ArgumentParser(argparse.ArgumentParser):
         args, argv = super(ArgumentParser, self).parse_known_args(args, namespace)
 
         if self._xarguments and isinstance(self._xarguments[0], ConfigArgument):
-            args = self._xarguments[0].process(args) or args
+            try:
+                args = self._xarguments[0].process(args) or args
+            except (OSError, KeyError, ValueError) as e:
+                self.error(f"config: {e}")
             self._xarguments[0].remove(args)
             del self._xarguments[0]
 
@@ -79,23 +86,111 @@ class ArgumentParser(argparse.ArgumentParser):
         return args, argv
 
 
+# path -> ((mtime_ns, size), parsed content)
+_configs: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+
+
+def load_config(path):
+    """loads a json (or .toml) config file, cached until the file changes
+
+    The result is shared between calls: don't modify it.
+
+    Raises:
+        FileNotFoundError: path doesn't exist
+        ValueError: path is not valid (or toml is not supported)
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if path in _configs and _configs[path][0] == stamp:
+        return _configs[path][1]
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib  # type: ignore
+            except ImportError:
+                raise ValueError(f"{path}: toml configs need python 3.11 or tomli")
+        with open(path, "rb") as fp:
+            config = tomllib.load(fp)
+    else:
+        from json import load
+        with open(path) as fp:
+            config = load(fp)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path}: not a mapping")
+    _configs[path] = (stamp, config)
+    return config
+
+
+def _merge_into(target, source):
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_into(target[key], value)
+        else:
+            target[key] = value
+
+
+@functools.lru_cache(maxsize=32)
+def _merge(files, confkey):
+    # files is a tuple of (path, stamp): a changed file is a new cache entry
+    config = {}
+    for path, _ in files:
+        _merge_into(config, deepcopy(load_config(path)))
+    for key in confkey.split(".") if confkey else []:
+        config = config[key]
+    return config
+
+
+def merge_configs(paths, confkey=None, layers=()):
+    """merges the layers then the paths config files (later ones win), memoized
+
+    Nested mappings are merged key by key, confkey selects a (dotted)
+    section of the result.
+
+    Args:
+        paths: config files (json or toml)
+        confkey: a dotted key, as "publish.staging"
+        layers: config files read before paths, skipped when missing
+    Returns:
+        dict - a new dictionary for each call
+    """
+    files = []
+    candidates = [(p, True) for p in layers] + [(p, False) for p in paths]
+    for path, optional in candidates:
+        path = os.path.abspath(os.path.expanduser(path))
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if optional:
+                continue
+            raise
+        files.append((path, (stat.st_mtime_ns, stat.st_size)))
+    return deepcopy(_merge(tuple(files), confkey or None))
+
+
 class ConfigArgument(Argument):
-    """Adds support for a configuration file
+    """Adds support for layered configuration files
 
-    This adds a new -c|--config argument to fetch default values from a
-    json file.
+    This adds a new -c|--config argument to fetch default values from
+    json (or toml) files: the layers files (eg. system, user and project
+    ones, skipped when missing) are read first, then each --config file,
+    and later ones win. Parsed files and merged results are cached until a
+    file changes, so building many parsers is cheap.
 
     Example:
 
         In the main script
           p = cli.ArgumentParser()
           p.add_argument("--foo")
-          p.add_argument(cli.ConfigArgument)
+          p.add_argument(cli.ConfigArgument, layers=["~/.blah.json"])
           print(p.parse_args().foo)
 
         In a config.json file
           {
             "foo" : "bar",
+            "staging": { "foo": "baz" }
           }
 
         Usage
@@ -103,31 +198,33 @@ class ConfigArgument(Argument):
           > bar
           blah -c config.json --foo 1
           > 1
+          blah -c config.json -k staging
+          > baz
     """
     def __init__(self):
         super(ConfigArgument, self).__init__(remove={"config", "config_key"})
+        self.layers = ()
 
     def add_arguments(self, parser, **kwargs):
-        parser.add_argument("-c", "--config")
-        parser.add_argument("-k", "--config-key")
+        parser.add_argument(
+            "-c", "--config", action="append", help="config file (json or toml)"
+        )
+        parser.add_argument("-k", "--config-key", help="config section (dotted)")
+        self.layers = tuple(kwargs.pop("layers", self.layers))
 
     def process(self, options):
-        conffile = options.config
+        conffiles = options.config
         if isinstance(options.config, ArgumentParser.NotAssigned):
-            conffile = options.config.value
+            conffiles = options.config.value
         confkey = options.config_key
         if isinstance(options.config_key, ArgumentParser.NotAssigned):
             confkey = options.config_key.value
 
-        if conffile:
-            from json import load
-            with open(conffile) as fp:
-                config = load(fp)
-            if confkey:
-                config = config[confkey]
-            for key, value in config.items():
-                if isinstance(options.__dict__.get(key), ArgumentParser.NotAssigned):
-                    options.__dict__[key] = value
+        config = merge_configs(conffiles or [], confkey, self.layers)
+        for key, value in config.items():
+            key = key.replace("-", "_")
+            if isinstance(options.__dict__.get(key), ArgumentParser.NotAssigned):
+                options.__dict__[key] = value
 
 
 class LoggingArguments(Argument):
@@ -158,5 +255,3 @@ class LoggingArguments(Argument):
         else:
             level = logging.DEBUG
         logging.basicConfig(level=level)
-
-
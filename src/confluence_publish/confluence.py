@@ -0,0 +1,376 @@
+"""asyncio client for the Confluence REST api
+
+Example:
+    auth = ("me", "token")
+    async with Client("https://wiki.example.com", "SPACE", auth=auth) as client:
+        root = await client.find_page("A root page title")
+        await client.publish_page("A page", "<p>hello</p>", parent=root)
+"""
+import dataclasses as dc
+import logging
+import random
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Tuple
+
+from .limiter import AdaptiveLimiter
+
+
+log = logging.getLogger(__name__)
+
+
+class ConfluenceError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super(ConfluenceError, self).__init__(message)
+        self.status = status
+
+
+@dc.dataclass
+class Page:
+    id: str
+    title: str
+    version: int = 1
+    # the parent page id, when known (it's not part of the page identity)
+    parent: Optional[str] = dc.field(default=None, compare=False)
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any], parent: Optional[str] = None) -> "Page":
+        ancestors = data.get("ancestors")
+        if ancestors:
+            parent = ancestors[-1]["id"]
+        return cls(data["id"], data["title"], data["version"]["number"], parent)
+
+
+@dc.dataclass
+class Attachment:
+    id: str
+    title: str
+    comment: str = ""
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    """parses a Retry-After header (seconds or http date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    from datetime import datetime, timezone
+
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        # a date without a zone (or -0000) is in UTC
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class PageIndex:
+    """an in memory index of pages by title (and id)
+
+    Built once with a bulk listing (see Client.descendants) it answers the
+    create vs update questions without a request per page.
+    """
+
+    def __init__(self, pages: Iterable[Page] = ()):
+        self.titles: Dict[str, Page] = {}
+        self.ids: Dict[str, Page] = {}
+        for page in pages:
+            self.add(page)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, title: str) -> bool:
+        return title in self.titles
+
+    def get(self, title: str) -> Optional[Page]:
+        return self.titles.get(title)
+
+    def add(self, page: Page) -> None:
+        old = self.ids.get(page.id)
+        if old and self.titles.get(old.title) is old:
+            del self.titles[old.title]
+        self.ids[page.id] = self.titles[page.title] = page
+
+    def remove(self, page: Page) -> None:
+        old = self.ids.pop(page.id, None)
+        if old and self.titles.get(old.title) is old:
+            del self.titles[old.title]
+
+
+class Client:
+    """a Confluence client with pooled connections and adaptive concurrency
+
+    All the requests share one aiohttp session (keep-alive connections are
+    reused) and the requests in flight are bounded by an AdaptiveLimiter:
+    it starts at concurrency, backs off on throttling (429, 503, growing
+    latency) and grows back up to max_concurrency. 429 and 5xx replies
+    (and connection errors) are retried with exponential backoff, honoring
+    the Retry-After header when present (which pauses all the requests).
+    A POST may have been processed despite the error, so it's retried only
+    when the server refused it (429, 503) or the connection failed.
+
+    Args:
+        url: the Confluence base url (eg. https://example.atlassian.net/wiki)
+        space: space key pages are published into
+        auth: (user, token) for basic authentication
+        concurrency: initial number of requests in flight
+        retries: max number of retries for a request
+        backoff: base delay in seconds for the exponential backoff
+        max_concurrency: the limit grows up to this (defaults to concurrency)
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    THROTTLE_STATUS = {429, 503}
+
+    def __init__(
+        self,
+        url: str,
+        space: str,
+        auth: Optional[Tuple[str, str]] = None,
+        concurrency: int = 8,
+        retries: int = 5,
+        backoff: float = 0.5,
+        timeout: float = 60.0,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.url = url.rstrip("/")
+        self.space = space
+        self.auth = auth
+        self.concurrency = concurrency
+        self.max_concurrency = max(max_concurrency or concurrency, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session: Any = None
+        self.limiter = AdaptiveLimiter(concurrency, self.max_concurrency)
+        self.stats: Dict[str, int] = {"requests": 0, "retries": 0}
+
+    async def __aenter__(self):
+        import aiohttp
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            auth=aiohttp.BasicAuth(*self.auth) if self.auth else None,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"Accept": "application/json"},
+        )
+        return self
+
+    async def __aexit__(self, *args):
+        await self.session.close()
+        self.session = None
+
+    def delay(self, attempt: int, hint: Optional[float] = None) -> float:
+        if hint is not None:
+            return hint
+        return self.backoff * 2 ** attempt * (0.5 + random.random() / 2)
+
+    async def request(self, method: str, path: str, **kwargs) -> Any:
+        """sends a request to the rest api, returning the decoded json reply
+
+        Args:
+            method: http method
+            path: path relative to the base url (eg. /rest/api/content)
+            kwargs: passed to aiohttp.ClientSession.request (a callable data
+                    is called for each attempt, for bodies that can't be re-sent)
+        Returns:
+            the json reply (None for empty replies)
+        Raises:
+            ConfluenceError: on errors, or when retries are exhausted
+        """
+        import asyncio
+        import aiohttp
+
+        assert self.session, "use the client as a context manager"
+        url = f"{self.url}{path}"
+        error = ConfluenceError(f"{method} {path}: no attempt made")
+        idempotent = method.upper() != "POST"
+        for attempt in range(self.retries + 1):
+            hint = None
+            status: Optional[int] = None
+            token = await self.limiter.acquire()
+            try:
+                self.stats["requests"] += 1
+                args = dict(kwargs)
+                if callable(args.get("data")):
+                    args["data"] = args["data"]()
+                async with self.session.request(method, url, **args) as response:
+                    status = response.status
+                    if response.status < 400:
+                        if response.status == 204:
+                            return None
+                        return await response.json(content_type=None)
+                    text = await response.text()
+                    if response.status not in self.RETRY_STATUS or not (
+                        idempotent or response.status in self.THROTTLE_STATUS
+                    ):
+                        raise ConfluenceError(
+                            f"{method} {path}: {response.status} {text[:200]}",
+                            response.status,
+                        )
+                    hint = retry_after(response.headers.get("Retry-After"))
+                    error = ConfluenceError(
+                        f"{method} {path}: {response.status}", response.status
+                    )
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                error = ConfluenceError(f"{method} {path}: {exc!r}")
+                # unless it was never sent
+                if not (idempotent or isinstance(exc, aiohttp.ClientConnectorError)):
+                    raise error from exc
+            finally:
+                await self.limiter.release(
+                    token,
+                    throttled=status in self.THROTTLE_STATUS,
+                    retry_after=hint,
+                    # errors (but the throttling ones) don't tell about the load
+                    neutral=status is None or status >= 400,
+                )
+            if attempt == self.retries:
+                break
+            self.stats["retries"] += 1
+            delay = self.delay(attempt, hint)
+            log.debug("%s (retrying in %.2fs)", error, delay)
+            await asyncio.sleep(delay)
+        raise error
+
+    async def find_page(self, title: str) -> Optional[Page]:
+        """looks up a page in the space by title"""
+        reply = await self.request(
+            "GET",
+            "/rest/api/content",
+            params={"spaceKey": self.space, "title": title, "expand": "version"},
+        )
+        for result in reply.get("results", []):
+            return Page.from_json(result)
+        return None
+
+    async def get_page(self, id: str) -> Optional[Page]:
+        """fetches the page id (its current version), None if it's gone"""
+        try:
+            reply = await self.request(
+                "GET", f"/rest/api/content/{id}", params={"expand": "version,ancestors"}
+            )
+        except ConfluenceError as exc:
+            if exc.status != 404:
+                raise
+            return None
+        return Page.from_json(reply)
+
+    async def create_page(
+        self, title: str, body: str, parent: Optional[Page] = None
+    ) -> Page:
+        data: Dict[str, Any] = {
+            "type": "page",
+            "title": title,
+            "space": {"key": self.space},
+            "body": {"storage": {"value": body, "representation": "storage"}},
+        }
+        if parent:
+            data["ancestors"] = [{"id": parent.id}]
+        reply = await self.request("POST", "/rest/api/content", json=data)
+        return Page.from_json(reply, parent.id if parent else None)
+
+    async def update_page(
+        self, page: Page, body: str, parent: Optional[Page] = None, title: str = ""
+    ) -> Page:
+        data: Dict[str, Any] = {
+            "type": "page",
+            "title": title or page.title,
+            "version": {"number": page.version + 1},
+            "body": {"storage": {"value": body, "representation": "storage"}},
+        }
+        if parent:
+            data["ancestors"] = [{"id": parent.id}]
+        reply = await self.request("PUT", f"/rest/api/content/{page.id}", json=data)
+        return Page.from_json(reply, parent.id if parent else page.parent)
+
+    async def descendants(self, page: Page, limit: int = 200) -> AsyncIterator[Page]:
+        """lists all the pages below page, limit pages per request
+
+        This follows the paginated /descendant/page listing (with expanded
+        version and ancestors info), so a tree of N pages costs N / limit
+        requests.
+        """
+        path: Optional[str] = f"/rest/api/content/{page.id}/descendant/page"
+        params: Optional[Dict[str, Any]] = {
+            "expand": "version,ancestors",
+            "limit": limit,
+        }
+        while path:
+            reply = await self.request("GET", path, params=params)
+            for result in reply.get("results", []):
+                yield Page.from_json(result)
+            # next is relative to the base url and carries all the parameters
+            path, params = reply.get("_links", {}).get("next"), None
+
+    async def index(self, page: Page, limit: int = 200) -> PageIndex:
+        """returns a PageIndex with page and all its descendants"""
+        index = PageIndex([page])
+        async for child in self.descendants(page, limit):
+            index.add(child)
+        return index
+
+    async def attachments(self, page: Page, limit: int = 200) -> Dict[str, Attachment]:
+        """returns the attachments of page by file name"""
+        result = {}
+        path: Optional[str] = f"/rest/api/content/{page.id}/child/attachment"
+        params: Optional[Dict[str, Any]] = {"limit": limit}
+        while path:
+            reply = await self.request("GET", path, params=params)
+            for item in reply.get("results", []):
+                comment = item.get("metadata", {}).get("comment", "")
+                result[item["title"]] = Attachment(item["id"], item["title"], comment)
+            path, params = reply.get("_links", {}).get("next"), None
+        return result
+
+    async def upload_attachment(
+        self,
+        page: Page,
+        path: Path,
+        comment: str = "",
+        existing: Optional[Attachment] = None,
+    ) -> Attachment:
+        """creates (or updates existing) attachment streaming path content"""
+        import aiohttp
+        from .attachments import chunks
+
+        def data():
+            writer = aiohttp.MultipartWriter("form-data")
+            part = writer.append(
+                chunks(path), {"Content-Type": "application/octet-stream"}
+            )
+            part.set_content_disposition("form-data", name="file", filename=path.name)
+            for name, value in [("comment", comment), ("minorEdit", "true")]:
+                writer.append(value).set_content_disposition("form-data", name=name)
+            return writer
+
+        url = f"/rest/api/content/{page.id}/child/attachment"
+        if existing:
+            url += f"/{existing.id}/data"
+        reply = await self.request(
+            "POST", url, data=data, headers={"X-Atlassian-Token": "nocheck"}
+        )
+        item = reply["results"][0] if "results" in reply else reply
+        return Attachment(item["id"], item["title"], comment)
+
+    async def add_labels(self, page: Page, labels: Iterable[str]) -> None:
+        """adds (global) labels to page, existing ones are left alone"""
+        data = [{"prefix": "global", "name": label} for label in labels]
+        await self.request("POST", f"/rest/api/content/{page.id}/label", json=data)
+
+    async def delete_page(self, page: Page) -> None:
+        await self.request("DELETE", f"/rest/api/content/{page.id}")
+
+    async def publish_page(
+        self, title: str, body: str, parent: Optional[Page] = None
+    ) -> Page:
+        """creates or updates the page title under parent"""
+        page = await self.find_page(title)
+        if page is None:
+            return await self.create_page(title, body, parent)
+        return await self.update_page(page, body, parent)
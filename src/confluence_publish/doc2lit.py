@@ -1,9 +1,21 @@
 import ast
+import inspect
+import io
 import logging
 import dataclasses as dc
 from pathlib import Path
 import enum
-from typing import Tuple, Dict, Union, Optional, Any, List
+import functools
+import itertools
+import re
+import sys
+import threading
+import tokenize
+from typing import (
+    TYPE_CHECKING, Tuple, Dict, Union, Optional, Any, List, Pattern, Iterable
+)
+
+from .stats import timer
 
 
 log = logging.getLogger()
@@ -20,10 +32,44 @@ class InvalidLitteralValue(LitteralException):
 class LitterateType(enum.IntEnum):
     RST = enum.auto()
     MD = enum.auto()
+    AUTO = enum.auto()  # detect() picks one of the above for each doc
+
+
+def _slotted(cls):
+    """rebuilds the dataclass cls with __slots__ for its fields
+
+    dataclass(slots=True) needs python 3.10: the field defaults live in
+    the generated __init__, so the class attributes can go. The state is
+    pickled as a list (frozen instances can't be unpickled by setattr).
+    """
+    names = tuple(f.name for f in dc.fields(cls))
+    body = {k: v for k, v in cls.__dict__.items() if k not in names}
+    body.pop("__dict__", None)
+    body.pop("__weakref__", None)
+    body["__slots__"] = names
+
+    def __getstate__(self):
+        return [getattr(self, name) for name in names]
+
+    def __setstate__(self, state):
+        for name, value in zip(names, state):
+            object.__setattr__(self, name, value)
+
+    body["__getstate__"], body["__setstate__"] = __getstate__, __setstate__
+    return type(cls)(cls.__name__, cls.__bases__, body)
 
 
+@_slotted
 @dc.dataclass
 class Litterate:
+    """a rendered doc string
+
+    Instances are slotted (no per instance __dict__) and meta keys are
+    interned, so holding many of them is cheap: 10k docs with a 512 chars
+    body and raw and 3 meta keys take 16MB (19MB as a plain dataclass), and
+    11MB without raw (see render(keep_raw=False)); test_litterate_compact
+    checks these figures.
+    """
     title : str = ""
     summary : str = ""
     body : str = ""  # <- generated by md2litterate (md or html) or rst2litterate (html)
@@ -31,24 +77,115 @@ class Litterate:
     meta : dict = dc.field(default_factory=dict)
     kind : Optional[LitterateType] = None
 
+    def freeze(self) -> "FrozenLitterate":
+        """returns a read only copy (meta is shared, not copied)"""
+        return FrozenLitterate(*self.__getstate__())  # type: ignore
+
+
+if TYPE_CHECKING:
+    # the type checkers can't follow make_dataclass: same fields anyway
+    FrozenLitterate = Litterate
+else:
+    FrozenLitterate = _slotted(
+        dc.make_dataclass(
+            "FrozenLitterate",
+            [
+                (
+                    f.name,
+                    f.type,
+                    dc.field(default=f.default, default_factory=f.default_factory),
+                )
+                for f in dc.fields(Litterate)
+            ],
+            frozen=True,
+            namespace={"__module__": __name__, "__doc__": "a read only Litterate"},
+        )
+    )
+
+
+def _ast_doc(txt: str) -> str:
+    return ast.get_docstring(ast.parse(txt)) or ""
+
+
+# a (u or r prefixed) string statement after blank/comment lines, matched at
+# C speed: the pure python tokenizer is quadratic on multi-MB docstrings
+_DOC_STRING_RES = [
+    r'"""[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*"""',
+    r"'''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''",
+    r'"[^"\\\r\n]*(?:\\.[^"\\\r\n]*)*"',
+    r"'[^'\\\r\n]*(?:\\.[^'\\\r\n]*)*'",
+]
+_DOC_BLANK_RE = r"[ \t\f]*(?:#[^\r\n]*)?"
+_DOC_RE = re.compile(
+    rf"(?:{_DOC_BLANK_RE}(?:\r\n|\r|\n))*"
+    rf"(?P<doc>[rRuU]?(?:{'|'.join(_DOC_STRING_RES)}))"
+    rf"{_DOC_BLANK_RE}(?:\r\n|\r|\n|\Z)",
+    re.DOTALL,
+)
+
+
+def _fast_doc(txt: str) -> Optional[str]:
+    """extracts the module docstring looking only at the first statement
+
+    Returns None when the first statement is something ast would treat in a
+    non obvious way (byte or f-strings, implicit concatenations, parenthesized
+    strings, indentation errors, BOMs etc.): the caller falls back to ast.
+    """
+    if txt.startswith("\ufeff"):
+        return None
+    match = _DOC_RE.match(txt)
+    if match:
+        return inspect.cleandoc(ast.literal_eval(match.group("doc")))
+    tokens = tokenize.generate_tokens(io.StringIO(txt).readline)
+    try:
+        first = next(t for t in tokens if t.type not in _DOC_SKIP_TOKENS)
+        if first.type == tokenize.ENDMARKER:
+            return ""
+        if first.type != tokenize.STRING:
+            if first.type in {tokenize.NAME, tokenize.NUMBER}:
+                return ""
+            return "" if first.type == tokenize.OP and first.string != "(" else None
+        quoted = first.string.lstrip("rRuUbBfF")
+        prefix = first.string[: len(first.string) - len(quoted)]
+        if set(prefix.lower()) & {"b", "f"}:
+            return None
+        after = next(t for t in tokens if t.type not in _DOC_SKIP_TOKENS)
+        if after.type not in {tokenize.NEWLINE, tokenize.ENDMARKER}:
+            return None
+    except (tokenize.TokenError, SyntaxError, StopIteration):
+        return None
+    return inspect.cleandoc(ast.literal_eval(first.string))
+
+
+_DOC_SKIP_TOKENS = {tokenize.NL, tokenize.COMMENT, tokenize.ENCODING}
+
 
 def get_doc(txt: str) -> str:
     """extracts the __doc__ part in a txt (python code)
 
+    This tokenizes only up to the first statement, so the rest of the
+    module is never parsed (and syntax errors past the docstring are not
+    reported); unusual first statements fall back to a full ast.parse.
+
     Args:
         txt (str): string to be parsed as python script
 
     Returrns:
         str - string extracted from __doc__
     """
-    class MyVisitor(ast.NodeVisitor):
-        def visit_Module(self, node):
-            self.doc = ast.get_docstring(node)
+    doc = _fast_doc(txt)
+    return _ast_doc(txt) if doc is None else doc
 
-    visitor = MyVisitor()
-    visitor.visit(ast.parse(txt))
-    doc = getattr(visitor, 'doc', None) or ''
-    return doc
+
+def decode_source(content: bytes) -> str:
+    """decodes a python script as the interpreter does
+
+    The encoding comes from the PEP 263 coding cookie or the BOM (utf-8
+    otherwise) and newlines are translated.
+    """
+    from importlib.util import decode_source as decode
+
+    return decode(content)
 
 
 def load_doc(path: Path) -> str:
@@ -59,76 +196,396 @@ def load_doc(path: Path) -> str:
     Returns:
         str - docstring from path
     """
-    return get_doc(path.read_text())
+    return get_doc(decode_source(path.read_bytes()))
+
+
+@functools.lru_cache(maxsize=16)
+def _endmeta_re(tag: str) -> Pattern:
+    return re.compile(r"^[^\S\n]*" + re.escape(tag) + r"[^\S\n]*$", re.MULTILINE)
+
+
+_META_BLOCK_RE = re.compile(r"^([^\s:][^:]*?)\s*:\s*>\s*$")
+_META_KEYVAL_RE = re.compile(r"^([^\s:][^:]*?)\s*:(.*)$")
+# longer meta sections (eg. a whole doc without the endmeta tag) aren't cached
+_META_CACHE_SIZE = 4096
+
+
+def _scan_meta(txt: str) -> Tuple[Tuple[str, str], ...]:
+    items: Dict[str, str] = {}
+    key: Optional[str] = None
+    block: List[str] = []
+    for line in txt.split("\n"):
+        if key is not None:
+            if not line.strip() or line[:1].isspace():
+                block.append(line)
+                continue
+            items[key] = "\n".join(block).strip()
+            key = None
+        if line.strip() == "---":
+            continue
+        match = _META_BLOCK_RE.match(line)
+        if match:
+            key, block = sys.intern(match.group(1)), []
+            items[key] = ""
+            continue
+        match = _META_KEYVAL_RE.match(line)
+        if match:
+            items[sys.intern(match.group(1))] = match.group(2).strip()
+    if key is not None:
+        items[key] = "\n".join(block).strip()
+    return tuple(items.items())
+
+
+_parse_meta = functools.lru_cache(maxsize=1024)(_scan_meta)
+
+
+def parse_meta(txt: str) -> Dict[str, str]:
+    """parses the meta section into a dictionary
+
+    This understands the markdown2 "metadata" subset: "key: value" lines
+    and "key: >" followed by indented lines (the value is the stripped
+    block); anything else is ignored. Results are cached for sections
+    up to _META_CACHE_SIZE characters.
+
+    Args:
+        txt: the meta section (as returned by popmeta(txt, parse=False))
+    Returns:
+        dict - a new dictionary for each call
+    """
+    if len(txt) > _META_CACHE_SIZE:
+        return dict(_scan_meta(txt))
+    return dict(_parse_meta(txt))
 
 
 def popmeta(txt: str, parse:bool = True, tag="== endmeta ==") -> Tuple[Union[None,str,Dict[Any, Any]], str]:
     """extract from str all lines up to endmeta
-    
+
+    The first line equal to tag (ignoring surrounding blanks) splits txt
+    into meta and text; without a tag everything is meta, and a tag on the
+    first line means there's no meta at all (None).
+
     Args:
         txt: text to extract from
         parse: process meta into a dictionary
         tag: marks the end of the "meta" section
     Returns:
-        dict, str: tuple of metadata dict and text    
+        dict, str: tuple of metadata dict and text
     """
-    from markdown2 import Markdown
+    metapart: Optional[str]
+    match = _endmeta_re(tag).search(txt)
+    if match is None:
+        metapart, textpart = txt, ""
+    else:
+        metapart = txt[: match.start() - 1] if match.start() else None
+        textpart = txt[match.end() + 1 :]
 
-    meta : Union[None, List[str]] = None
-    text : List[str] = []
-    status = None
-    for line in txt.split("\n"):
-        if status is None:
-            if line.strip() == tag:
-                status = "text"
-            else:
-                status = "meta"
-                meta = [line]
-        elif status == "text":
-            text.append(line)
-        else:
-            if line.strip() == tag:
-                status = "text"
-            else:
-                meta.append(line)
-    textpart = "\n".join(text)
-
-    metapart = meta
-    if meta is not None:
-        if parse:
-            md = Markdown(extras=['metadata'])
-            md.convert("\n".join(["---", *(meta or []), "---"]))
-            metapart = getattr(md, "metadata", "")  # type: ignore
-        else:
-            metapart = "\n".join(meta or [])  # type: ignore
-    return metapart, textpart  # type: ignore
-
-
-def md2lit(txt: str) -> Litterate:
-    """process a markdown doc string into metadata and html"""
-    from markdown2 import Markdown
-    md = Markdown(extras=['metadata'])
+    if metapart is not None and parse:
+        return parse_meta(metapart), textpart
+    return metapart, textpart
+
+
+MD_EXTRAS: Tuple[str, ...] = ("metadata",)
+
+_renderers = threading.local()
+
+
+def get_markdown(extras: Optional[Iterable[str]] = None) -> Any:
+    """returns a configured markdown2.Markdown from a per thread pool
+
+    Building a Markdown instance is expensive compared to converting
+    a small document, so instances are reused: there's one for each set of
+    extras in each thread (and so in each process).
+
+    Args:
+        extras: markdown2 extras (defaults to MD_EXTRAS)
+    Returns:
+        markdown2.Markdown
+    """
+    key = MD_EXTRAS if extras is None else tuple(sorted(set(extras)))
+    pool = getattr(_renderers, "markdown", None)
+    if pool is None:
+        pool = _renderers.markdown = {}
+    if key not in pool:
+        from markdown2 import Markdown
+        pool[key] = Markdown(extras=list(key))
+    return pool[key]
+
+
+def md2lit(txt: str, extras: Optional[Iterable[str]] = None) -> Litterate:
+    """process a markdown doc string into metadata and html
+
+    Args:
+        txt: the markdown doc string
+        extras: markdown2 extras (defaults to MD_EXTRAS)
+    Returns:
+        Litterate
+    """
+    md = get_markdown(extras)
 
     lit = Litterate()
-    lit.meta, lit.raw = popmeta(txt, parse=True)  # type: ignore
-    lit.body = md.convert(lit.raw)
+    with timer("popmeta"):
+        lit.meta, lit.raw = popmeta(txt, parse=True)  # type: ignore
+    try:
+        with timer("md2lit"):
+            lit.body = md.convert(lit.raw)
+    finally:
+        md.reset()  # don't hold on to the document state
     lit.kind = LitterateType.MD
     return lit
 
 
+def get_rst_publisher() -> Tuple[Any, Any]:
+    """returns a docutils Publisher (and its settings) from a per thread pool
+
+    Setting up docutils (components, option parsing, settings) dominates
+    the cost for small documents, so it's done once per thread: the
+    publisher is then reused for each document with a copy of the settings.
+
+    Returns:
+        docutils.core.Publisher, optparse.Values
+    """
+    cached = getattr(_renderers, "rst", None)
+    if cached is None:
+        from docutils.core import Publisher
+        from docutils.io import StringInput, StringOutput
+        from docutils.parsers.rst import Parser
+        from docutils.readers.standalone import Reader
+        from docutils.writers.html4css1 import Writer
+
+        publisher = Publisher(
+            Reader(),
+            Parser(),
+            Writer(),
+            source_class=StringInput,
+            destination_class=StringOutput,
+        )
+        settings = publisher.get_settings(
+            input_encoding="unicode",
+            output_encoding="unicode",
+            report_level=5,
+            halt_level=5,
+            _disable_config=True,
+        )
+        cached = _renderers.rst = (publisher, settings)
+    return cached
+
+
 def rst2lit(txt: str) -> Litterate:
     """process txt (rst) into a data and html
-    """
-    from docutils.core import publish_parts, publish_doctree
-    root = publish_doctree(source=txt)
 
+    A single docutils pass renders the html body and gives the doctree,
+    the document title is the (promoted) top section title and the summary
+    is the first paragraph.
+
+    Args:
+        txt: the rst doc string
+    Returns:
+        Litterate
+    """
+    from copy import copy
+    from docutils import nodes
 
     lit = Litterate()
-    lit.raw = txt
+    with timer("popmeta"):
+        lit.meta, lit.raw = popmeta(txt, parse=True)  # type: ignore
+
+    publisher, settings = get_rst_publisher()
+    publisher.settings = copy(settings)
+    publisher.set_source(lit.raw)
+    publisher.set_destination()
+    try:
+        with timer("rst2lit"):
+            publisher.publish()
+        parts, document = publisher.writer.parts, publisher.document
+    finally:
+        publisher.document = publisher.writer.document = None
+
+    title = document.next_node(nodes.title)
+    paragraph = document.next_node(nodes.paragraph)
+    lit.title = title.astext() if title else ""
+    lit.summary = " ".join(paragraph.astext().split()) if paragraph else ""
+    lit.body = parts["body"]
+    lit.kind = LitterateType.RST
+    return lit
+
+
+# the meta key naming the doc format (it takes precedence over detection)
+FORMAT_KEY = "format"
+_FORMATS = {
+    "md": LitterateType.MD,
+    "markdown": LitterateType.MD,
+    "rst": LitterateType.RST,
+    "restructuredtext": LitterateType.RST,
+}
+
+# only the head of a doc is looked at: detection costs the same for any size
+DETECT_SIZE = 4096
+
+# (pattern, weight): constructs only (or mostly) found in one format
+_RST_SIGNS = [
+    (r"^\.\. [\w:-]+::", 3),  # directives
+    (r"^\.\. _[^:\n]+:", 3),  # link targets
+    (r":[\w:-]+:`[^`\n]+`", 3),  # roles
+    (r"`[^`<\n]+ <[^>\n]+>`__?", 3),  # links
+    (r"^:\w[\w ]*:(?: |$)", 2),  # field lists (eg. :param x:)
+    (r"::[ \t]*$", 2),  # literal blocks
+    (r"``[^`\n]+``", 1),  # inline literals
+]
+_MD_SIGNS = [
+    (r"^#{1,6} \S", 3),  # atx headers
+    (r"!?\[[^\]\n]+\]\([^)\s]+\)", 3),  # inline links and images
+    (r"^\|[^\n]*\|[ \t]*\n\|?[ \t]*:?-{3,}", 3),  # tables
+    (r"^\[[^\]\n]+\]: \S", 2),  # reference links
+    (r"^> \S", 1),  # quotes
+    (r"(?<![`:])`[^`\n]+`(?![`_])", 1),  # inline code
+]
+_SIGNS = [
+    (re.compile(pattern, re.MULTILINE), weight, kind)
+    for signs, kind in [(_RST_SIGNS, LitterateType.RST), (_MD_SIGNS, LitterateType.MD)]
+    for pattern, weight in signs
+]
+
+
+_ADORNMENT_RE = re.compile(r"([!-/:-@\[-`{-~])\1{2,}[ \t]*")
+_FENCE_RE = re.compile(r"(`{3,}|~{3,})[^`]*")
+
 
-    #lit, lines = any2litterate(txt)
-    # we extract the body part (it should have all the __doc__ rendered
-    #root = publish_parts(source=txt, writer_name="html")
-    #lit.body = root["body"]
-    #lit.mode = "html"
+def _title_signs(head: str) -> Tuple[int, int]:
+    """counts the rst section titles and the md fences in head
+
+    The setext titles (underlined by = or -) are valid in both formats and
+    don't count, unless overlined (rst only).
+    """
+    lines = [line.rstrip() for line in head.split("\n")]
+    titles = fences = 0
+    fence = ""
+    for index, line in enumerate(lines):
+        if fence:
+            if line.lstrip().startswith(fence) and not line.strip(fence[0]):
+                fence = ""
+            continue
+        text = lines[index - 1] if index else ""
+        if _ADORNMENT_RE.fullmatch(line):
+            under = text.strip() and len(line) >= len(text)
+            over = index + 2 < len(lines) and lines[index + 2] == line
+            if over and lines[index + 1].strip() and len(lines[index + 1]) <= len(line):
+                continue  # counted with its underline
+            if under:
+                overline = index > 1 and lines[index - 2] == line
+                titles += line[0] not in "=-" or overline
+                continue
+        match = _FENCE_RE.fullmatch(line)
+        if match:
+            fence = match.group(1)
+            fences += 1
+    return titles, fences
+
+
+def classify(
+    txt: str, default: LitterateType = LitterateType.MD
+) -> LitterateType:
+    """guesses the format (md or rst) of txt (a doc without its meta)
+
+    Each construct specific to one format found in the first DETECT_SIZE
+    chars scores its weight (up to 3 occurrences), the higher total wins;
+    constructs shared by both (emphasis, bullets, setext titles) don't
+    count and a tie returns default.
+
+    Args:
+        txt: the doc text
+        default: the format when there's no evidence either way
+    Returns:
+        LitterateType - MD or RST
+    """
+    head = txt[:DETECT_SIZE]
+    titles, fences = _title_signs(head)
+    scores = {
+        LitterateType.MD: 3 * min(fences, 3),
+        LitterateType.RST: 3 * min(titles, 3),
+    }
+    for pattern, weight, kind in _SIGNS:
+        found = sum(1 for _ in itertools.islice(pattern.finditer(head), 3))
+        scores[kind] += weight * found
+    if scores[LitterateType.MD] == scores[LitterateType.RST]:
+        return default
+    return max(scores, key=scores.__getitem__)
+
+
+def detect(txt: str, default: LitterateType = LitterateType.MD) -> LitterateType:
+    """the format of txt (a doc string): its meta FORMAT_KEY, or classify()
+
+    The text after the meta is classified; a doc without the endmeta tag
+    in its first DETECT_SIZE chars is only read (meta and text) up to
+    there, so a large tagless doc costs no more than a small one.
+
+    Args:
+        txt: the doc string
+        default: the format when there's no evidence either way
+    Returns:
+        LitterateType - MD or RST
+    """
+    head = txt[:DETECT_SIZE]
+    if _endmeta_re("== endmeta ==").search(head) is None:
+        txt = head
+    meta, text = popmeta(txt)
+    value = ""
+    if isinstance(meta, dict):
+        value = str(meta.get(FORMAT_KEY, "")).strip().lower()
+    if value in _FORMATS:
+        return _FORMATS[value]
+    if value:
+        log.warning("unknown %s %r, detecting it", FORMAT_KEY, value)
+    return classify(text or txt, default)
+
+
+# bump this when the rendering output changes (it invalidates cached renders)
+RENDER_VERSION = 3
+
+# bump this when detect() changes (it invalidates cached auto renders)
+DETECT_VERSION = 3
+
+
+def renderer_version(kind: LitterateType) -> str:
+    """returns a string identifying the renderer (and its version) for kind"""
+    if kind == LitterateType.AUTO:
+        return "-".join(
+            [
+                f"auto{DETECT_VERSION}",
+                renderer_version(LitterateType.MD),
+                renderer_version(LitterateType.RST),
+            ]
+        )
+    if kind == LitterateType.MD:
+        import markdown2
+        return f"{RENDER_VERSION}-markdown2-{markdown2.__version__}"
+    import docutils
+    return f"{RENDER_VERSION}-docutils-{docutils.__version__}"
+
+
+def render(
+    txt: str,
+    kind: LitterateType,
+    extras: Optional[Iterable[str]] = None,
+    keep_raw: bool = True,
+) -> Litterate:
+    """process txt into a Litterate using the kind renderer
+
+    With LitterateType.AUTO the renderer is picked by detect(), so each
+    doc is still rendered once.
+
+    Args:
+        txt: the doc string
+        kind: the renderer to use (or AUTO)
+        extras: markdown2 extras (md only)
+        keep_raw: keep the doc text in Litterate.raw (it's not needed once
+                  the body is rendered)
+    Returns:
+        Litterate
+    """
+    if kind == LitterateType.AUTO:
+        with timer("detect"):
+            kind = detect(txt)
+    lit = md2lit(txt, extras) if kind == LitterateType.MD else rst2lit(txt)
+    if not keep_raw:
+        lit.raw = ""
     return lit
@@ -0,0 +1,141 @@
+"""finds the scripts changed in a git revision range
+
+In CI the commit range already tells which scripts changed: publish
+--changes renders and uploads only those (and removes the pages of the
+deleted ones) instead of discovering and hashing the whole tree, so a run
+costs in proportion to the change.
+
+The range is anything git diff takes: "A..B" compares two commits and a
+single revision compares it with the working tree. The scripts are read
+from the working tree, so the range should end at the checked out commit.
+
+Example:
+    paths, removed = gitdiff.affected("origin/main..HEAD", ["scripts/"])
+"""
+import dataclasses as dc
+import fnmatch
+import logging
+import subprocess
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+from .batch import glob_base
+
+
+log = logging.getLogger(__name__)
+
+
+class GitError(Exception):
+    pass
+
+
+@dc.dataclass
+class Change:
+    status: str  # A(dded), M(odified), D(eleted), R(enamed), T(ype changed)
+    path: Path  # absolute
+    old: Optional[Path] = None  # the path before a rename
+
+
+def _git(cwd: Union[str, Path], *args: str) -> str:
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(cwd), *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+    except FileNotFoundError:
+        raise GitError("git is not installed") from None
+    except subprocess.CalledProcessError as exc:
+        message = exc.stderr.decode(errors="replace").strip()
+        raise GitError(f"git {args[0]} failed: {message}") from None
+    return result.stdout.decode("utf-8", errors="surrogateescape")
+
+
+def diff(revisions: str, cwd: Union[str, Path] = ".") -> List[Change]:
+    """the files changed in revisions (renames are detected)
+
+    Args:
+        revisions: a revision range ("A..B") or a revision (against the
+                   working tree)
+        cwd: a directory in the repository
+    Returns:
+        list of Change
+    """
+    top = Path(_git(cwd, "rev-parse", "--show-toplevel").strip())
+    output = _git(cwd, "diff", "--name-status", "-z", "-M", revisions, "--")
+    fields = iter(output.split("\0"))
+    changes = []
+    for status in fields:
+        if not status:
+            continue
+        if status[0] in "RC":
+            old, new = next(fields), next(fields)
+            changes.append(Change(status[0], top / new, top / old))
+        else:
+            changes.append(Change(status[0], top / next(fields)))
+    return changes
+
+
+def _source_path(path: Path, sources: List[str], pattern: str) -> Optional[Path]:
+    "path (absolute) named as batch.discover() would, or None if not in sources"
+    for source in sources:
+        base = Path(source)
+        if base.is_dir():
+            root = base.resolve()
+            if root in path.parents and fnmatch.fnmatch(path.name, pattern):
+                return base / path.relative_to(root)
+        elif base.exists() or glob_base(source) == str(base):
+            if path == base.resolve():
+                return base
+        else:
+            prefix = Path(glob_base(source))
+            root = prefix.resolve()
+            if root in path.parents:
+                name = prefix / path.relative_to(root)
+                if fnmatch.fnmatch(str(name), source) or fnmatch.fnmatch(
+                    str(name), source.replace("**/", "")
+                ):
+                    return name
+    return None
+
+
+def affected(
+    revisions: str,
+    sources: Iterable[Union[str, Path]],
+    pattern: str = "*.py",
+    cwd: Union[str, Path] = ".",
+) -> Tuple[List[Path], List[str]]:
+    """the scripts in sources changed or removed in revisions
+
+    A renamed script is both: the new path is published and the old one
+    removed (the manifest moves the page, see publisher.upload).
+
+    Args:
+        revisions: a revision range (see diff)
+        sources: files, directories or globs (as batch.discover)
+        pattern: file pattern in directories
+        cwd: a directory in the repository
+    Returns:
+        list of Path, list of str - the scripts to publish and the ones
+        to remove, named as batch.discover() does
+    """
+    names = [str(s) for s in sources]
+    paths: List[Path] = []
+    removed: List[str] = []
+    for change in diff(revisions, cwd):
+        if change.old:
+            old = _source_path(change.old, names, pattern)
+            if old:
+                removed.append(str(old))
+        name = _source_path(change.path, names, pattern)
+        if name is None:
+            continue
+        if name.is_file():
+            paths.append(name)
+        else:
+            removed.append(str(name))
+    log.info(
+        "%i changed and %i removed script(s) in %s", len(paths), len(removed), revisions
+    )
+    return sorted(set(paths)), sorted(set(removed))
@@ -0,0 +1,236 @@
+"""checkpoints of a publish run, to resume it after a crash
+
+The manifest is only saved once the run is over: a run killed midway (a
+network outage, a CI timeout) loses the record of the pages it published
+and starts over. The journal is an append only file of json lines written
+as the run goes:
+
+    begin    an update of a known page is about to be sent (the page id
+             and version, the new digest)
+    done     a page is published (the manifest entry)
+    deleted  a page is removed
+
+Lines are written unbuffered (a killed process loses nothing written) and
+fsync'ed every sync_every lines or sync_interval seconds, so the journal
+costs about nothing next to the requests.
+
+To resume, replay() applies the done and deleted lines to the manifest,
+so the pages already published are skipped as unchanged, and returns the
+updates begun but not done: reconcile() fetches these pages and, where
+the version number moved past the recorded one, takes the new version
+(the update landed). The remaining ones are sent again with the right
+version instead of conflicting. A begin line lost in a crash falls back
+to the stale manifest handling of publisher.upload.
+
+Example:
+    pending = journal.replay("publish.journal", manifest)
+    await journal.reconcile(client, manifest, pending)
+    with Journal("publish.journal", append=True) as checkpoint:
+        await publisher.upload(client, root, pages, manifest, journal=checkpoint)
+"""
+import dataclasses as dc
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+
+from .confluence import Page
+from .manifest import Entry, Manifest, digest
+
+if TYPE_CHECKING:
+    from .confluence import Client
+    from .store import Store
+
+
+log = logging.getLogger(__name__)
+
+BEGIN, DONE, DELETED = "begin", "done", "deleted"
+
+
+class Journal:
+    """the journal in path
+
+    Args:
+        path: journal file
+        append: keep the existing lines (resuming), else start a new journal
+        sync_every: lines between fsyncs
+        sync_interval: max seconds between fsyncs
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        append: bool = False,
+        sync_every: int = 100,
+        sync_interval: float = 1.0,
+    ):
+        self.path = Path(path)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fp = open(self.path, "ab" if append else "wb", buffering=0)
+        self.unsynced = 0
+        self.synced = time.monotonic()
+        self.stats = {"lines": 0, "syncs": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """appends record, fsync'ing when a batch is complete"""
+        self.fp.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        self.stats["lines"] += 1
+        self.unsynced += 1
+        if (
+            self.unsynced >= self.sync_every
+            or time.monotonic() - self.synced >= self.sync_interval
+        ):
+            self.sync()
+
+    def sync(self) -> None:
+        if self.unsynced:
+            os.fsync(self.fp.fileno())
+            self.stats["syncs"] += 1
+            self.unsynced = 0
+        self.synced = time.monotonic()
+
+    def close(self) -> None:
+        if not self.fp.closed:
+            self.sync()
+            self.fp.close()
+
+    def remove(self) -> None:
+        """closes and deletes the journal (the run is over)"""
+        self.close()
+        self.path.unlink()
+
+    def begin(
+        self, source: str, entry: Entry, title: str, body: str, final: bool = True
+    ) -> None:
+        """an update of the page in entry is about to be sent
+
+        final is False when more requests follow the update (labels,
+        attachments): a page updated but not done is then published again.
+        """
+        self.write(
+            {
+                "op": BEGIN,
+                "source": source,
+                "id": entry.id,
+                "version": entry.version,
+                "title": title,
+                "digest": digest(title, body) if final else "",
+            }
+        )
+
+    def done(self, source: str, page: Page, title: str, body: str) -> None:
+        """source is published to page"""
+        self.write(
+            {
+                "op": DONE,
+                "source": source,
+                "id": page.id,
+                "version": page.version,
+                "title": title,
+                "digest": digest(title, body),
+            }
+        )
+
+    def deleted(self, source: str) -> None:
+        """the page of source is removed"""
+        self.write({"op": DELETED, "source": source})
+
+
+def replay(
+    path: Union[str, Path], manifest: Union[Manifest, "Store"]
+) -> Dict[str, Dict[str, Any]]:
+    """applies the journal in path to manifest
+
+    Args:
+        path: journal file (a missing one is empty)
+        manifest: the published pages record (it's updated, not saved)
+    Returns:
+        dict - the begin lines not done, by source
+    """
+    done: Dict[str, Optional[Entry]] = {}
+    pending: Dict[str, Dict[str, Any]] = {}
+    try:
+        fp = open(path, "rb")
+    except FileNotFoundError:
+        return pending
+    with fp:
+        for number, line in enumerate(fp, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line of a killed run may be cut short
+                log.warning("%s:%i: skipping a truncated line", path, number)
+                continue
+            source = record["source"]
+            if record["op"] == BEGIN:
+                pending[source] = record
+                continue
+            pending.pop(source, None)
+            if record["op"] == DONE:
+                done[source] = Entry(
+                    record["id"], record["version"], record["title"], record["digest"]
+                )
+            else:
+                done[source] = None
+    for source, entry in done.items():
+        if entry is None:
+            manifest.pop(source)
+        else:
+            manifest.entries[source] = entry
+    log.info("%s: %i page(s) done, %i update(s) begun", path, len(done), len(pending))
+    return pending
+
+
+async def reconcile(
+    client: "Client",
+    manifest: Union[Manifest, "Store"],
+    pending: Dict[str, Dict[str, Any]],
+) -> Dict[str, int]:
+    """updates manifest with the current version of the pending pages
+
+    An update landed if the page version is past the begin one: the entry
+    takes the new version and digest (so the page is skipped if unchanged,
+    unless its labels or attachments may be missing, see Journal.begin).
+    Otherwise the entry takes the current version, and a page gone is
+    dropped from manifest (it's created again).
+
+    Args:
+        client: an open confluence.Client
+        manifest: the published pages record (it's updated, not saved)
+        pending: from replay()
+    Returns:
+        dict - statistics (updates landed, unsent, pages gone)
+    """
+    import asyncio
+
+    stats = {"landed": 0, "unsent": 0, "gone": 0}
+
+    async def check(source: str, record: Dict[str, Any]):
+        page = await client.get_page(record["id"])
+        if page is None:
+            # the source is still there: a Store keeps its doc
+            manifest.entries.pop(source, None)
+            stats["gone"] += 1
+        elif page.version > record["version"]:
+            manifest.entries[source] = Entry(
+                page.id, page.version, record["title"], record["digest"]
+            )
+            stats["landed"] += 1
+        else:
+            entry = manifest.get(source)
+            if entry is not None and entry.version != page.version:
+                manifest.entries[source] = dc.replace(entry, version=page.version)
+            stats["unsent"] += 1
+
+    await asyncio.gather(*(check(s, r) for s, r in pending.items()))
+    return stats
@@ -0,0 +1,154 @@
+"""adaptive (AIMD) limit of the requests in flight
+
+A static concurrency is either too slow or, against a throttling server
+(eg. Confluence Cloud rate limits), sets off storms of 429 replies. The
+limiter adapts it the way TCP congestion control does:
+
+    increase   each request completed while the limit was in use adds
+               1/limit (about +1 for each round of requests), up to
+               max_limit
+    decrease   a throttled reply (429, 503) or latency over
+               latency_factor times the best one seen multiplies the limit
+               by decrease, down to min_limit; once per round, so the
+               replies to requests sent before the decrease don't count
+    pause      a Retry-After header holds back every new request (not only
+               the throttled one) until it expires
+
+stats has the current and lowest limit, the throttled replies, the
+decreases and the seconds spent paused.
+
+Example:
+    limiter = AdaptiveLimiter(8, max_limit=32)
+    token = await limiter.acquire()
+    ...
+    await limiter.release(token, throttled=status == 429, retry_after=hint)
+"""
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import asyncio
+
+
+class AdaptiveLimiter:
+    """the number of requests in flight, adapted to the server replies
+
+    Args:
+        limit: the initial limit
+        max_limit: the limit never grows over this (defaults to limit)
+        min_limit: the limit never drops below this
+        decrease: factor applied to the limit on throttling
+        latency_factor: latency over this times the best one is throttling
+        latency_floor: latencies below this (seconds) are never throttling
+    """
+
+    def __init__(
+        self,
+        limit: int = 8,
+        max_limit: Optional[int] = None,
+        min_limit: int = 1,
+        decrease: float = 0.5,
+        latency_factor: float = 4.0,
+        latency_floor: float = 0.1,
+    ):
+        self.limit = float(limit)
+        self.max_limit = max(max_limit or limit, limit)
+        self.min_limit = min(min_limit, limit)
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency_floor = latency_floor
+        self.inflight = 0
+        self.epoch = 0  # bumped by each decrease
+        self.paused_until = 0.0
+        self.best: Optional[float] = None  # the lowest latency seen
+        self.latency: Optional[float] = None  # moving average
+        self.stats: Dict[str, Any] = {
+            "limit": limit,
+            "limit_min": limit,
+            "throttled": 0,
+            "decreases": 0,
+            "paused": 0.0,
+        }
+        self._condition: Optional["asyncio.Condition"] = None
+
+    async def acquire(self) -> Tuple[float, int]:
+        """waits for a free slot (and for a pause to expire)
+
+        Returns:
+            the token to pass to release()
+        """
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        while True:
+            wait = self.paused_until - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            async with self._condition:
+                if self.paused_until > loop.time():
+                    continue
+                if self.inflight < int(self.limit):
+                    self.inflight += 1
+                    return loop.time(), self.epoch
+                await self._condition.wait()
+
+    async def release(
+        self,
+        token: Tuple[float, int],
+        throttled: bool = False,
+        retry_after: Optional[float] = None,
+        neutral: bool = False,
+    ) -> None:
+        """frees the slot taken by acquire() and adapts the limit
+
+        Args:
+            token: from acquire()
+            throttled: the server throttled the request
+            retry_after: the Retry-After delay (seconds) in the reply
+            neutral: the reply says nothing about the load (eg. an error)
+        """
+        import asyncio
+
+        now = asyncio.get_event_loop().time()
+        start, epoch = token
+        assert self._condition
+        async with self._condition:
+            # only the requests of the current round may grow the limit
+            saturated = epoch == self.epoch and self.inflight >= int(self.limit)
+            self.inflight -= 1
+            if retry_after:
+                until = now + retry_after
+                if until > self.paused_until:
+                    self.stats["paused"] += until - max(self.paused_until, now)
+                    self.paused_until = until
+            if throttled:
+                self.stats["throttled"] += 1
+                self._decrease(epoch)
+            elif not neutral:
+                latency = now - start
+                self.best = latency if self.best is None else min(self.best, latency)
+                self.latency = (
+                    latency
+                    if self.latency is None
+                    else 0.8 * self.latency + 0.2 * latency
+                )
+                if self.latency > self.latency_factor * max(
+                    self.best, self.latency_floor
+                ):
+                    self._decrease(epoch)
+                elif saturated:
+                    self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+                    self.stats["limit"] = int(self.limit)
+            self._condition.notify_all()
+
+    def _decrease(self, epoch: int) -> None:
+        if epoch != self.epoch:
+            return  # sent before the last decrease
+        self.epoch += 1
+        self.limit = max(self.limit * self.decrease, self.min_limit)
+        self.latency = None
+        self.stats["decreases"] += 1
+        self.stats["limit"] = int(self.limit)
+        self.stats["limit_min"] = min(self.stats["limit_min"], int(self.limit))
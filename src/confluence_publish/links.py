@@ -0,0 +1,145 @@
+"""resolves the links between scripts into Confluence page links
+
+Docs reference other scripts by (relative) file name, eg. [ping](ping.py)
+or `ping <../net/ping.py>`_; once rendered these are <a href> to a file
+Confluence doesn't have. resolve() rewrites them into links to the page
+published from that script, by title (storage format links don't need
+the page id, so a page created later in the same run works too).
+
+The index maps each source to its page title: it's built once per run
+from the rendered pages and the manifest (for the pages not rendered in
+this run, eg. with publish --changes), and each body is rewritten in a
+single regex pass with dict lookups, so the whole pass is linear in the
+total body size. Unresolved links are collected and reported together.
+
+Example:
+    index = LinkIndex.build(items, manifest)
+    items = [index.resolve(item) for item in items]
+    index.report()
+"""
+import html
+import logging
+import os
+import re
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union
+
+from .attachments import LINK_RE, REMOTE_RE
+from .manifest import Manifest
+from .publisher import PageItem
+
+if TYPE_CHECKING:
+    from .store import Store
+
+
+log = logging.getLogger(__name__)
+
+# the reference suffixes resolved as scripts
+SCRIPT_SUFFIXES = (".py",)
+
+
+class LinkIndex:
+    """source path -> page title, plus a file name fallback
+
+    A reference is resolved relative to the referencing script first;
+    failing that a bare file name matches the one script with that name.
+    """
+
+    def __init__(self):
+        self.titles: Dict[str, str] = {}  # absolute path -> title
+        # file name -> title (None if ambiguous)
+        self.names: Dict[str, Optional[str]] = {}
+        self.unresolved: List[Tuple[str, str]] = []  # (source, reference)
+        self.resolved = 0
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, source: str, title: str) -> None:
+        path = os.path.abspath(source)
+        self.titles[path] = title
+        name = os.path.basename(path)
+        self.names[name] = title if self.names.get(name, title) == title else None
+
+    @classmethod
+    def build(
+        cls,
+        items: Iterable[PageItem],
+        manifest: Optional[Union[Manifest, "Store"]] = None,
+    ) -> "LinkIndex":
+        """the index of items (the manifest entries come first, items win)"""
+        index = cls()
+        if manifest is not None:
+            for source, entry in manifest.entries.items():
+                index.add(source, entry.title)
+        for item in items:
+            index.add(item.source, item.title)
+        return index
+
+    def lookup(self, reference: str, source: str) -> Optional[str]:
+        """the page title for reference (a path) found in source, or None"""
+        base = os.path.dirname(os.path.abspath(source))
+        title = self.titles.get(os.path.normpath(os.path.join(base, reference)))
+        if title is None and "/" not in reference:
+            title = self.names.get(reference)
+        return title
+
+    def resolve(self, item: PageItem) -> PageItem:
+        """item with its links to scripts rewritten into page links"""
+
+        def link(match):
+            href = html.unescape(match.group(1))
+            reference, _, anchor = href.partition("#")
+            if REMOTE_RE.match(href) or not reference.endswith(SCRIPT_SUFFIXES):
+                return match.group(0)
+            title = self.lookup(reference, item.source)
+            if title is None:
+                self.unresolved.append((item.source, href))
+                return match.group(0)
+            self.resolved += 1
+            attrs = f' ac:anchor="{html.escape(anchor, quote=True)}"' if anchor else ""
+            title = html.escape(title, quote=True)
+            text = html.unescape(re.sub(r"<[^>]+>", "", match.group(2)))
+            text = text.replace("]]>", "]]]]><![CDATA[>")
+            return (
+                f'<ac:link{attrs}><ri:page ri:content-title="{title}" />'
+                f"<ac:plain-text-link-body><![CDATA[{text}]]></ac:plain-text-link-body>"
+                "</ac:link>"
+            )
+
+        if "<a" not in item.body:
+            return item
+        body = LINK_RE.sub(link, item.body)
+        return item if body == item.body else item._replace(body=body)
+
+    def report(self, limit: int = 20) -> None:
+        """logs the unresolved links (once, for all the pages)"""
+        if not self.unresolved:
+            return
+        shown = ", ".join(f"{s} -> {r}" for s, r in self.unresolved[:limit])
+        more = len(self.unresolved) - limit
+        log.warning(
+            "%i unresolved link(s): %s%s",
+            len(self.unresolved),
+            shown,
+            f" (and {more} more)" if more > 0 else "",
+        )
+
+
+def resolve(
+    items: Iterable[PageItem],
+    manifest: Optional[Union[Manifest, "Store"]] = None,
+) -> List[PageItem]:
+    """items with their links to other scripts resolved (see LinkIndex)
+
+    Args:
+        items: the rendered pages (all of them: they make the index)
+        manifest: the published pages record, for the scripts not in items
+    Returns:
+        list of PageItem
+    """
+    items = list(items)
+    index = LinkIndex.build(items, manifest)
+    result = [index.resolve(item) for item in items]
+    log.debug("%i link(s) resolved", index.resolved)
+    index.report()
+    return result
@@ -8,19 +8,32 @@ Examples:
 """
 
 import logging
-import json
 
-from . import cli
+from . import cli, stats
 
 def pp(obj):
+    import json
+
     return json.dumps(obj, indent=2, sort_keys=True)
 
 
+# config files read before --config (later ones win), missing ones are skipped
+CONFIG_LAYERS = (
+    "/etc/confluence-publish/config.toml",
+    "/etc/confluence-publish/config.json",
+    "~/.config/confluence-publish/config.toml",
+    "~/.config/confluence-publish/config.json",
+    ".confluence-publish.toml",
+    ".confluence-publish.json",
+)
+
+
 def subparser(subparsers, name, cmd):
     p = subparsers.add_parser(name)
 
-    p.add_argument(cli.ConfigArgument)  # this must come first
+    p.add_argument(cli.ConfigArgument, layers=CONFIG_LAYERS)  # this must come first
     p.add_argument(cli.LoggingArguments)
+    p.add_argument(stats.StatsArguments)
     p.set_defaults(func=cmd)
     return p
 
@@ -32,21 +45,325 @@ def main():
     func(**args.__dict__)
 
 
+def add_publish_arguments(p):
+    p.add_argument("--commit", action="store_true", help="upload the pages")
+    p.add_argument("--url", help="confluence base url")
+    p.add_argument("--space", help="confluence space key")
+    p.add_argument("--user", help="confluence user")
+    p.add_argument("--token", help="api token (or CONFLUENCE_TOKEN)")
+    p.add_argument(
+        "--concurrency", type=int, default=8, help="initial requests in flight"
+    )
+    p.add_argument(
+        "--max-concurrency",
+        type=int,
+        help="the adaptive limit never grows over this (defaults to --concurrency)",
+    )
+    p.add_argument(
+        "--manifest", help="record of published pages (json, or sqlite for .db files)"
+    )
+    p.add_argument(
+        "--delete", action="store_true", help="remove pages whose source is gone"
+    )
+    p.add_argument(
+        "--kind", choices=["md", "rst", "auto"], default="md", help="doc format"
+    )
+    p.add_argument("--cache", help="directory caching rendered docs")
+    p.add_argument(
+        "--md-extra", dest="extras", action="append", help="markdown2 extras"
+    )
+    p.add_argument("root", help="root page title")
+    p.add_argument("sources", nargs="*", help="files, directories or globs")
+
+
 def parse_args(args=None):
     parser = cli.ArgumentParser()
     subparsers = parser.add_subparsers(required=True)
 
     publishp = subparser(subparsers, "publish", publish)
-    publishp.add_argument("--commit", action="store_true")
+    add_publish_arguments(publishp)
+    publishp.add_argument(
+        "--no-prefetch",
+        dest="prefetch",
+        action="store_false",
+        default=True,
+        help="look up pages one by one instead of listing the tree upfront",
+    )
+    publishp.add_argument(
+        "--buffer", type=int, default=64, help="rendered pages waiting for upload"
+    )
+    publishp.add_argument(
+        "--tree", action="store_true", help="follow the sources directories"
+    )
+    publishp.add_argument(
+        "--snapshot", help="write the rendered site here instead of uploading"
+    )
+    publishp.add_argument(
+        "--links",
+        action="store_true",
+        help="turn the links to other scripts into page links",
+    )
+    publishp.add_argument(
+        "--changes",
+        metavar="REVISIONS",
+        help="only the scripts changed in this git range (eg. origin/main..HEAD)",
+    )
+    publishp.add_argument(
+        "--journal",
+        help="checkpoints of the run (defaults to the manifest path + .journal,"
+        " none without a manifest)",
+    )
+    publishp.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the work the journal of an interrupted run has done",
+    )
+    publishp.add_argument("-j", "--workers", type=int, help="extraction processes")
+    publishp.add_argument("--chunksize", type=int, default=16)
+
+    watchp = subparser(subparsers, "watch", watch)
+    add_publish_arguments(watchp)
+    watchp.add_argument(
+        "--delay", type=float, default=0.2, help="debounce time (seconds)"
+    )
+    watchp.add_argument(
+        "--polling", action="store_true", help="poll instead of using inotify"
+    )
+    watchp.add_argument(
+        "--interval", type=float, default=1.0, help="polling interval (seconds)"
+    )
 
     args = parser.parse_args(args)
     return args
 
 
-def publish(commit):
-    logging.debug("A")
-    logging.info("B")
-    logging.warning("C")
+def get_client(url, space, user, token, concurrency, max_concurrency=None):
+    import os
+    from . import confluence
+
+    if not (url and space):
+        raise SystemExit("--url and --space are required to --commit")
+    token = token or os.getenv("CONFLUENCE_TOKEN")
+    return confluence.Client(
+        url,
+        space,
+        auth=(user, token) if user else None,
+        concurrency=concurrency,
+        max_concurrency=max_concurrency,
+    )
+
+
+def publish(
+    root,
+    commit,
+    sources=None,
+    workers=None,
+    chunksize=16,
+    kind="md",
+    cache=None,
+    extras=None,
+    url=None,
+    space=None,
+    user=None,
+    token=None,
+    concurrency=8,
+    max_concurrency=None,
+    manifest=None,
+    delete=False,
+    prefetch=True,
+    buffer=64,
+    tree=False,
+    snapshot=None,
+    changes=None,
+    links=False,
+    journal=None,
+    resume=False,
+):
+    from pathlib import Path
+    from . import doc2lit, pipeline
+
+    if commit and snapshot:
+        raise SystemExit("--snapshot is a dry run, it can't be used with --commit")
+    if changes and snapshot:
+        raise SystemExit(
+            "--snapshot needs all the pages, it can't be used with --changes"
+        )
+
+    paths, removed = None, []
+    if changes:
+        from . import gitdiff
+
+        try:
+            paths, removed = gitdiff.affected(changes, sources or [])
+        except gitdiff.GitError as exc:
+            raise SystemExit(str(exc))
+    scripts = (sources or []) if paths is None else paths
+
+    options = dict(
+        kind=doc2lit.LitterateType[kind.upper()],
+        workers=workers,
+        chunksize=chunksize,
+        cachedir=Path(cache) if cache else None,
+        extras=extras,
+        links=bool(links),
+    )
+
+    if commit:
+        import asyncio
+        from .journal import Journal, reconcile, replay
+        from .manifest import Manifest, load
+
+        if resume and not (manifest or journal):
+            raise SystemExit("--resume needs the --journal (or --manifest) of the run")
+        client = get_client(url, space, user, token, concurrency, max_concurrency)
+        record = load(manifest) if manifest else None
+        # a run without a manifest nor --journal has nothing to resume from
+        journal = journal or (f"{manifest}.journal" if manifest else None)
+        pending = {}
+        checkpoint = None
+        if journal:
+            journal = Path(journal)
+            if resume:
+                # without a manifest the journal is the whole record
+                record = Manifest() if record is None else record
+                pending = replay(journal, record)
+            elif journal.exists():
+                logging.warning("%s: starting over (see --resume)", journal)
+            checkpoint = Journal(journal, append=bool(resume))
+
+        async def upload():
+            async with client:
+                if pending:
+                    result = await reconcile(client, record, pending)
+                    logging.info(
+                        "%(landed)i update(s) landed, %(unsent)i unsent,"
+                        " %(gone)i page(s) gone",
+                        result,
+                    )
+                return await pipeline.run(
+                    client,
+                    root,
+                    sources or [],
+                    buffer=buffer,
+                    manifest=record,
+                    delete=bool(delete),
+                    prefetch=prefetch,
+                    tree=bool(tree),
+                    paths=paths,
+                    removed=removed if delete else (),
+                    journal=checkpoint,
+                    **options,
+                )
+
+        try:
+            stats = asyncio.run(upload())
+        finally:
+            if checkpoint:
+                checkpoint.close()
+            if manifest:
+                record.save()
+        # the manifest has the record now (else keep the failed pages to resume)
+        if checkpoint and (manifest or not stats["failed"]):
+            checkpoint.remove()
+        logging.info(
+            "published %(published)i page(s), %(unchanged)i unchanged,"
+            " %(deleted)i deleted, %(failed)i failed",
+            stats,
+        )
+    elif snapshot:
+        from . import snapshot as site
+        from .manifest import load
+
+        if not site.replaceable(Path(snapshot)):
+            raise SystemExit(f"{snapshot} is not a snapshot, it won't be replaced")
+        record = load(manifest) if manifest else None
+        pages = pipeline.iter_pages(sources or [], manifest=record, **options)
+        stats = site.write(Path(snapshot), pages, sources or [], root, record)
+        logging.info(
+            "%(pages)i page(s) written to %(snapshot)s", dict(stats, snapshot=snapshot)
+        )
+    elif tree:
+        from . import confluence, planner
+
+        items = list(pipeline.iter_pages(scripts, **options))
+        todo = planner.plan(items, sources or [], confluence.Page("", root))
+        for op in todo.ops:
+            logging.info(
+                "%s %s (under %s)", op.action, op.node.title, op.node.parent or root
+            )
+    else:
+        for item in pipeline.iter_pages(scripts, **options):
+            logging.debug("%s: rendered %i chars", item.source, len(item.body))
+
+    if cache:
+        from .cache import Cache
+        Cache(cache).evict()
+
+
+def watch(
+    root,
+    commit,
+    sources=None,
+    kind="md",
+    cache=None,
+    extras=None,
+    url=None,
+    space=None,
+    user=None,
+    token=None,
+    concurrency=8,
+    max_concurrency=None,
+    manifest=None,
+    delete=False,
+    delay=0.2,
+    polling=False,
+    interval=1.0,
+):
+    from pathlib import Path
+    from . import batch, doc2lit, publisher, watcher
+
+    kind = doc2lit.LitterateType[kind.upper()]
+    cachedir = Path(cache) if cache else None
+    changes = watcher.make_watcher(
+        sources or ["."], delay=delay, polling=polling, interval=interval
+    )
+
+    def preview():
+        # renders the changed scripts in process, without uploading
+        for changed in changes:
+            present = sorted(p for p in changed if p.is_file())
+            results = batch.render_docs(
+                present, kind=kind, workers=0, cachedir=cachedir, extras=extras
+            )
+            for item in publisher.iter_pages(results):
+                logging.info("%s: rendered %i chars", item.source, len(item.body))
+
+    async def run():
+        from .manifest import load
+
+        client = get_client(url, space, user, token, concurrency, max_concurrency)
+        record = load(manifest) if manifest else None
+        async with client:
+            await watcher.run(
+                client,
+                root,
+                changes,
+                manifest=record,
+                delete=bool(delete),
+                kind=kind,
+                cachedir=cachedir,
+                extras=extras,
+            )
+
+    with changes:
+        try:
+            if commit:
+                import asyncio
+                asyncio.run(run())
+            else:
+                preview()
+        except KeyboardInterrupt:
+            pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+"""local record of what has been published
+
+The manifest maps each source file to its Confluence page (id and
+version) and a digest of the title and body last published: pages whose
+digest didn't change need no request at all.
+
+Example:
+    manifest = Manifest.load(Path("manifest.json"))
+    if manifest.changed("script.py", title, body):
+        ...
+        manifest.update("script.py", page, title, body)
+    manifest.save()
+"""
+import dataclasses as dc
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union
+
+from .confluence import Page
+
+if TYPE_CHECKING:
+    from .store import Store
+
+
+@dc.dataclass
+class Entry:
+    id: str
+    version: int
+    title: str
+    digest: str
+
+    @property
+    def page(self) -> Page:
+        return Page(self.id, self.title, self.version)
+
+
+def digest(title: str, body: str) -> str:
+    return hashlib.sha256(f"{title}\0{body}".encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    def __init__(
+        self, path: Optional[Path] = None, entries: Optional[Dict[str, Entry]] = None
+    ):
+        self.path = path
+        self.entries: Dict[str, Entry] = entries or {}
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Manifest":
+        """loads the manifest in path (an empty one if path doesn't exist)"""
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+        data = json.loads(path.read_text())
+        return cls(path, {k: Entry(**v) for k, v in data["pages"].items()})
+
+    def save(self, path: Optional[Union[str, Path]] = None) -> None:
+        """atomically writes the manifest (to path or where it was loaded from)"""
+        path = Path(path or self.path)  # type: ignore
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "pages": {k: dc.asdict(v) for k, v in sorted(self.entries.items())}
+        }
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(data, fp, indent=1)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get(self, source: str) -> Optional[Entry]:
+        return self.entries.get(source)
+
+    def changed(self, source: str, title: str, body: str) -> bool:
+        entry = self.entries.get(source)
+        return entry is None or entry.digest != digest(title, body)
+
+    def update(self, source: str, page: Page, title: str, body: str) -> None:
+        self.entries[source] = Entry(page.id, page.version, title, digest(title, body))
+
+    def pop(self, source: str) -> Optional[Entry]:
+        return self.entries.pop(source, None)
+
+    def removed(self, sources: Iterable[str]) -> List[Tuple[str, Entry]]:
+        """returns the entries whose source is not in sources"""
+        sources = set(sources)
+        return [(k, v) for k, v in self.entries.items() if k not in sources]
+
+    def by_page(self, id: str) -> List[str]:
+        """the sources published to the page id"""
+        return [k for k, v in self.entries.items() if v.id == id]
+
+
+# file suffixes loaded as a store.Store
+STORE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+def load(path: Union[str, Path]) -> Union[Manifest, "Store"]:
+    """loads the record in path: a store.Store for sqlite files, else a Manifest"""
+    if Path(path).suffix in STORE_SUFFIXES:
+        from .store import Store
+        return Store.load(path)
+    return Manifest.load(path)
@@ -0,0 +1,192 @@
+"""streaming discover -> extract -> render -> upload pipeline
+
+Every stage pulls from the previous one through a bounded buffer, so
+memory stays flat regardless of the library size:
+
+    discover   lazily walks the sources (batch.discover)
+    render     extract + render on a process pool, at most 2 * workers
+               chunks in flight (batch.render_docs)
+    feed       a thread moves rendered pages into an asyncio.Queue of
+               buffer items, blocking when the uploads fall behind
+    upload     publisher.upload workers (client.concurrency requests)
+
+Example:
+    async with confluence.Client(url, space) as client:
+        stats = await pipeline.run(client, "root", ["scripts/"], workers=4)
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING, Any, AsyncIterator, Dict, Iterable, Iterator, Optional, Set, Union
+)
+
+from . import batch, confluence, doc2lit, publisher
+
+if TYPE_CHECKING:
+    from .manifest import Manifest
+    from .store import Store
+
+
+log = logging.getLogger(__name__)
+
+
+class _Raise:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+async def feed(items: Iterable, maxsize: int = 64) -> AsyncIterator:
+    """iterates a blocking iterable from a thread through a bounded queue
+
+    The producer thread runs ahead of the consumer by at most maxsize
+    items; exceptions raised by items are re-raised in the consumer.
+
+    Args:
+        items: a (blocking) iterable
+        maxsize: buffer size
+    Returns:
+        async iterator over items
+    """
+    import asyncio
+
+    loop = asyncio.get_event_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                put(item)
+        except BaseException as exc:
+            put(_Raise(exc))
+        finally:
+            if not stop.is_set():
+                put(done)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, _Raise):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+
+
+def iter_pages(
+    sources: Iterable[Union[str, Path]],
+    kind: doc2lit.LitterateType = doc2lit.LitterateType.MD,
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    cachedir: Optional[Path] = None,
+    extras: Optional[Iterable[str]] = None,
+    store: Optional["Store"] = None,
+    links: bool = False,
+    manifest: Optional[Union["Manifest", "Store"]] = None,
+    failed: Optional[Set[str]] = None,
+) -> Iterator[publisher.PageItem]:
+    """the discover, extract and render stages (see batch.render_docs)
+
+    With a store the extracted docs are recorded in it (see store.Store).
+    With links the links between scripts become page links (see links.py,
+    the manifest knows the pages not in sources): all the pages are
+    rendered before the first one is returned. The sources failing to
+    render are added to failed.
+    """
+    paths = batch.discover(sources)
+    results = batch.render_docs(
+        paths,
+        kind=kind,
+        workers=workers,
+        chunksize=chunksize,
+        cachedir=cachedir,
+        extras=extras,
+        keep_raw=False,
+    )
+    if store is not None:
+        results = store.record(results)
+    pages = publisher.iter_pages(results, failed)
+    if links:
+        from .links import resolve
+        return iter(resolve(pages, manifest))
+    return pages
+
+
+async def run(
+    client: confluence.Client,
+    root: str,
+    sources: Iterable[Union[str, Path]],
+    kind: doc2lit.LitterateType = doc2lit.LitterateType.MD,
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    cachedir: Optional[Path] = None,
+    extras: Optional[Iterable[str]] = None,
+    buffer: int = 64,
+    tree: bool = False,
+    paths: Optional[Iterable[Path]] = None,
+    links: bool = False,
+    **kwargs,
+) -> Dict[str, Any]:
+    """runs the whole pipeline, publishing sources under root
+
+    With tree the pages follow the sources directories (see planner), so
+    all of them are rendered before the upload starts.
+
+    Args:
+        client: an open confluence.Client
+        root: title of the root page
+        sources: files, directories or globs
+        buffer: rendered pages waiting for upload
+        tree: publish a page tree instead of a flat list
+        paths: the scripts to publish, if not all the ones in sources (eg.
+               from gitdiff.affected): delete is then ignored, the pages
+               not in paths are not gone (pass removed instead)
+        links: resolve the links between scripts (see iter_pages)
+        kwargs: passed to publisher.upload (manifest, delete, prefetch,
+                removed, journal)
+        (see iter_pages for the others)
+    Returns:
+        dict - statistics from publisher.upload (or planner.publish)
+    """
+    sources = list(sources)
+    manifest = kwargs.get("manifest")
+    # a script failing to render is not gone: delete keeps its page
+    failed: Set[str] = set()
+    pages = iter_pages(
+        sources if paths is None else paths,
+        kind,
+        workers,
+        chunksize,
+        cachedir,
+        extras,
+        # a store.Store records the extracted docs too
+        store=manifest if hasattr(manifest, "record") else None,
+        links=links,
+        manifest=manifest,
+        failed=failed,
+    )
+    kwargs["keep"] = failed
+    if paths is not None:
+        kwargs["delete"] = False
+    if tree:
+        import asyncio
+        from . import planner
+
+        kwargs.pop("prefetch", None)  # the planner always indexes the tree
+        items = await asyncio.get_event_loop().run_in_executor(None, list, pages)
+        return await planner.publish(client, root, items, sources, **kwargs)
+    return await publisher.upload(client, root, feed(pages, buffer), **kwargs)
@@ -0,0 +1,339 @@
+"""plans the page tree from the filesystem layout and the docs meta
+
+Scripts are published below the root page following their directories:
+each directory (relative to the source it was found in) becomes a page
+listing its children, and a script page goes under its directory page
+unless its meta names another parent page ("parent: A page title"):
+
+    scripts/net/ping.py      ->  root / net / ping
+    scripts/net/ssh/scp.py   ->  root / net / net/ssh / scp
+
+plan() compares this tree with the current one (a PageIndex from
+Client.index, which knows the parents) and the manifest, and returns the
+minimal operations: create the missing pages, move the pages found under
+another parent and update the pages whose content changed. An operation
+only waits for the one creating its parent page, so apply() uploads the
+independent branches concurrently.
+
+Example:
+    pages = list(pipeline.iter_pages(["scripts/"]))
+    todo = planner.plan(pages, ["scripts/"], root, index, manifest)
+    stats = await planner.apply(client, todo, index, manifest)
+"""
+import dataclasses as dc
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Union
+
+from . import batch, confluence
+from .manifest import Manifest
+from .publisher import PageItem, sync_attachments
+from .stats import timer
+
+if TYPE_CHECKING:
+    from .journal import Journal
+
+
+log = logging.getLogger(__name__)
+
+CREATE, MOVE, UPDATE = "create", "move", "update"
+
+# the body of directory pages (a list of the child pages)
+DIRECTORY_BODY = '<ac:structured-macro ac:name="children" />'
+
+
+@dc.dataclass
+class Node:
+    title: str
+    parent: str  # the parent page title ("" is the root page)
+    folder: str = ""  # the directory page title, the parent without meta
+    item: Optional[PageItem] = None  # None for directory pages
+
+    @property
+    def body(self) -> str:
+        return self.item.body if self.item else DIRECTORY_BODY
+
+
+@dc.dataclass
+class Op:
+    action: str
+    node: Node
+    after: Optional[str] = None  # title of the op creating the parent page
+
+
+@dc.dataclass
+class Plan:
+    root: confluence.Page
+    nodes: Dict[str, Node]  # by title, parents before children
+    ops: List[Op]
+
+    def children(self) -> Dict[str, List[str]]:
+        """the child titles of each page title ("" is the root page)"""
+        result: Dict[str, List[str]] = {}
+        for node in self.nodes.values():
+            result.setdefault(node.parent, []).append(node.title)
+        return result
+
+    def levels(self) -> List[List[Op]]:
+        """the ops in waves, each only depending on the previous ones"""
+        depth: Dict[str, int] = {}
+        result: List[List[Op]] = []
+        for op in self.ops:
+            level = depth[op.node.title] = depth[op.after] + 1 if op.after else 0
+            if level == len(result):
+                result.append([])
+            result[level].append(op)
+        return result
+
+
+def _bases(sources: Iterable[Union[str, Path]]) -> List[Path]:
+    bases = []
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            bases.append(path)
+        elif not path.exists():
+            bases.append(Path(batch.glob_base(str(source))))
+    # the longest (innermost) base wins
+    return sorted(bases, key=lambda p: len(p.parts), reverse=True)
+
+
+def _folder(source: str, bases: List[Path]) -> List[str]:
+    path = Path(source)
+    for base in bases:
+        if base in path.parents:
+            return list(path.parent.relative_to(base).parts)
+    return []
+
+
+def _ancestors(nodes: Dict[str, Node], title: str) -> List[str]:
+    "the parent titles up to the root, stopping at a cycle (reported last)"
+    result = []
+    seen = {title}
+    parent = nodes[title].parent
+    while parent in nodes:
+        result.append(parent)
+        if parent in seen:
+            break
+        seen.add(parent)
+        parent = nodes[parent].parent
+    return result
+
+
+def plan(
+    items: Iterable[PageItem],
+    sources: Iterable[Union[str, Path]],
+    root: confluence.Page,
+    index: Optional[confluence.PageIndex] = None,
+    manifest: Optional[Manifest] = None,
+) -> Plan:
+    """computes the page tree for items and the ops to get there
+
+    Args:
+        items: the rendered pages
+        sources: the sources items were discovered from (for the directories)
+        root: the root page
+        index: the current tree below root (None plans everything as created)
+        manifest: the published pages record (None updates all the pages)
+    Returns:
+        Plan
+    """
+    bases = _bases(sources)
+    nodes: Dict[str, Node] = {}
+    for item in items:
+        parts = _folder(item.source, bases)
+        for depth in range(len(parts)):
+            title = "/".join(parts[: depth + 1])
+            if title not in nodes:
+                parent = "/".join(parts[:depth])
+                nodes[title] = Node(title, parent, parent)
+        folder = "/".join(parts)
+        if item.title in nodes:
+            log.warning("duplicate page title %s (%s)", item.title, item.source)
+        nodes[item.title] = Node(item.title, item.parent or folder, folder, item)
+
+    for node in nodes.values():
+        known = node.parent in nodes or (index is not None and node.parent in index)
+        if node.parent != node.folder and not known:
+            log.warning("%s: unknown parent %s", node.title, node.parent)
+            node.parent = node.folder
+    for title, node in nodes.items():
+        if title in _ancestors(nodes, title):
+            log.warning("%s: parent %s makes a cycle", title, node.parent)
+            node.parent = node.folder
+
+    depths: Dict[str, int] = {}
+    for title in nodes:
+        depths[title] = len(_ancestors(nodes, title))
+    ordered = {t: nodes[t] for t in sorted(nodes, key=depths.__getitem__)}
+
+    ops: List[Op] = []
+    created = set()
+    for title, node in ordered.items():
+        page = index.get(title) if index is not None else None
+        after = node.parent if node.parent in created else None
+        if page is None:
+            ops.append(Op(CREATE, node, after))
+            created.add(title)
+            continue
+        if node.parent:
+            parent_page = index.get(node.parent) if index is not None else None
+        else:
+            parent_page = root
+        if after or (page.parent and parent_page and page.parent != parent_page.id):
+            ops.append(Op(MOVE, node, after))
+        elif node.item and (
+            manifest is None
+            or manifest.changed(node.item.source, title, node.item.signature)
+        ):
+            ops.append(Op(UPDATE, node))
+    return Plan(root, ordered, ops)
+
+
+async def apply(
+    client: confluence.Client,
+    plan: Plan,
+    index: confluence.PageIndex,
+    manifest: Optional[Manifest] = None,
+    workers: Optional[int] = None,
+    journal: Optional["Journal"] = None,
+) -> Dict[str, Any]:
+    """runs the plan ops, each as soon as its parent page exists
+
+    A failing op is logged and counted, and the ops below it (waiting
+    for a page that couldn't be created) fail too.
+
+    Args:
+        client: an open confluence.Client
+        plan: the plan (from plan())
+        index: the tree index, updated as pages are created and moved
+        manifest: the published pages record (it's updated, not saved)
+        workers: ops in flight (defaults to client.max_concurrency)
+        journal: checkpoints of the published pages (see journal.py)
+    Returns:
+        dict - statistics (ops, pages and attachments counters)
+    """
+    import asyncio
+
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(workers or client.max_concurrency)
+    done = {op.node.title: loop.create_future() for op in plan.ops}
+    stats: Dict[str, Any] = {
+        CREATE: 0,
+        MOVE: 0,
+        UPDATE: 0,
+        "published": 0,
+        "unchanged": sum(1 for n in plan.nodes.values() if n.item) - sum(
+            1 for op in plan.ops if op.node.item
+        ),
+        "failed": 0,
+        "attachments": 0,
+        "attachments_unchanged": 0,
+    }
+
+    async def run(op: Op):
+        node, page = op.node, None
+        try:
+            if op.after and not await done[op.after]:
+                raise confluence.ConfluenceError(f"parent {op.after} is missing")
+            parent = index.get(node.parent) if node.parent else plan.root
+            async with semaphore:
+                with timer(op.action, node.title):
+                    if op.action == CREATE:
+                        page = await client.create_page(node.title, node.body, parent)
+                    else:
+                        current = index.get(node.title)
+                        page = await client.update_page(
+                            current, node.body, parent, node.title  # type: ignore
+                        )
+                    index.add(page)
+                    if node.item and node.item.labels:
+                        await client.add_labels(page, node.item.labels)
+                    if node.item and node.item.attachments:
+                        paths = [Path(p) for p in node.item.attachments]
+                        result = await sync_attachments(client, page, paths)
+                        for key, value in result.items():
+                            stats[key] += value
+            if node.item and manifest:
+                manifest.update(node.item.source, page, node.title, node.item.signature)
+            if node.item and journal:
+                journal.done(node.item.source, page, node.title, node.item.signature)
+            stats[op.action] += 1
+            stats["published"] += bool(node.item)
+        except asyncio.CancelledError:  # an Exception before python 3.8
+            raise
+        except Exception as exc:
+            # the ops below this one fail too, the others go on
+            stats["failed"] += 1
+            log.warning(
+                "failed to %s %s: %s",
+                op.action,
+                node.title,
+                exc,
+                exc_info=not isinstance(exc, confluence.ConfluenceError),
+            )
+            page = None
+        finally:
+            done[node.title].set_result(page)
+
+    await asyncio.gather(*(run(op) for op in plan.ops))
+    stats.update(client.stats)
+    stats.update(client.limiter.stats)
+    return stats
+
+
+async def publish(
+    client: confluence.Client,
+    root: str,
+    pages: Iterable[PageItem],
+    sources: Iterable[Union[str, Path]],
+    manifest: Optional[Manifest] = None,
+    delete: bool = False,
+    workers: Optional[int] = None,
+    removed: Iterable[str] = (),
+    journal: Optional["Journal"] = None,
+    keep: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """publishes pages as a tree below root (see plan and apply)
+
+    Args:
+        client: an open confluence.Client
+        root: title of the root page
+        pages: the rendered pages
+        sources: the sources pages were discovered from
+        manifest: the published pages record (it's updated, not saved)
+        delete: remove pages whose source is gone
+        workers: ops in flight (defaults to client.max_concurrency)
+        removed: sources to remove (with a manifest) regardless of delete
+        journal: checkpoints of the run (see journal.py)
+        keep: sources never removed by delete (see publisher.upload)
+    Returns:
+        dict - statistics (see apply, and publisher.upload for deleted)
+    """
+    from .publisher import get_root, upload
+
+    parent = await get_root(client, root)
+    index = await client.index(parent)
+    todo = plan(pages, sources, parent, index, manifest)
+    log.info("%i page(s) planned, %i op(s)", len(todo.nodes), len(todo.ops))
+    stats = await apply(client, todo, index, manifest, workers, journal)
+    stats["deleted"] = 0
+    if manifest:
+        gone = list(removed)
+        if delete:
+            present = [n.item.source for n in todo.nodes.values() if n.item]
+            present.extend(keep)
+            gone.extend(source for source, _ in manifest.removed(present))
+        if gone:
+            result = await upload(
+                client,
+                parent,
+                [],
+                manifest=manifest,
+                index=index,
+                removed=list(dict.fromkeys(gone)),
+                journal=journal,
+            )
+            stats["deleted"] = result["deleted"]
+            stats["failed"] += result["failed"]
+    return stats
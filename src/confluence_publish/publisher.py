@@ -0,0 +1,317 @@
+"""uploads rendered docs into a Confluence page tree
+
+Example:
+    async with confluence.Client(url, space, auth=(user, token)) as client:
+        stats = await publisher.upload(client, "A root page title", pages)
+"""
+import logging
+import re
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING, Any, AsyncIterator, Dict, Iterable, Iterator, NamedTuple, Optional,
+    Set, Tuple, Union,
+)
+
+from . import attachments, confluence
+from .doc2lit import Litterate
+from .manifest import Entry, Manifest
+from .stats import STATS, timer
+
+if TYPE_CHECKING:
+    from .journal import Journal
+
+
+log = logging.getLogger(__name__)
+
+
+class PageItem(NamedTuple):
+    source: str
+    title: str
+    body: str
+    attachments: Tuple[str, ...] = ()
+    parent: str = ""  # the parent page title, from meta (see planner)
+    labels: Tuple[str, ...] = ()
+
+    @property
+    def signature(self) -> str:
+        "what the manifest tracks: the body, labels and the assets (stat) signature"
+        result = self.body
+        if self.labels:
+            result += f"\0labels:{','.join(self.labels)}"
+        if self.attachments:
+            result += f"\0{attachments.stamp(Path(p) for p in self.attachments)}"
+        return result
+
+
+def page_title(lit: Litterate, path: Path) -> str:
+    """returns the Confluence page title for a rendered doc"""
+    return (lit.meta or {}).get("title") or lit.title or path.stem
+
+
+def page_labels(lit: Litterate) -> Tuple[str, ...]:
+    """returns the labels in meta (comma or blank separated), sorted"""
+    value = (lit.meta or {}).get("labels") or ""
+    return tuple(sorted({label for label in re.split(r"[,\s]+", value) if label}))
+
+
+async def get_root(client: confluence.Client, title: str) -> confluence.Page:
+    """returns the root page, creating it at the top of the space if missing"""
+    root = await client.find_page(title)
+    if root is None:
+        log.info("creating root page %s", title)
+        root = await client.create_page(title, "")
+    return root
+
+
+async def sync_attachments(
+    client: confluence.Client, page: confluence.Page, paths: Iterable[Path]
+) -> Dict[str, int]:
+    """uploads the paths whose content differs from page attachments"""
+    import asyncio
+
+    loop = asyncio.get_event_loop()
+    stats = {"attachments": 0, "attachments_unchanged": 0}
+    existing = await client.attachments(page)
+    for path in paths:
+        digest = await loop.run_in_executor(None, attachments.file_digest, path)
+        comment = f"{attachments.COMMENT_PREFIX}{digest}"
+        current = existing.get(path.name)
+        if current and current.comment == comment:
+            stats["attachments_unchanged"] += 1
+            continue
+        await client.upload_attachment(page, path, comment, current)
+        stats["attachments"] += 1
+    return stats
+
+
+async def publish_indexed(
+    client: confluence.Client,
+    index: confluence.PageIndex,
+    item: PageItem,
+    parent: confluence.Page,
+) -> Optional[confluence.Page]:
+    """creates or updates item using index, None if index is out of date"""
+    known = index.get(item.title)
+    try:
+        if known is None:
+            return await client.create_page(item.title, item.body, parent)
+        return await client.update_page(known, item.body, parent, item.title)
+    except confluence.ConfluenceError as exc:
+        # the title is used elsewhere in the space or the page changed meanwhile
+        if exc.status not in {400, 404, 409}:
+            raise
+        log.debug("index out of date for %s: %s", item.title, exc)
+    return None
+
+
+async def upload(
+    client: confluence.Client,
+    root: Union[str, confluence.Page],
+    pages: Union[Iterable[PageItem], AsyncIterator[PageItem]],
+    workers: Optional[int] = None,
+    manifest: Optional[Manifest] = None,
+    delete: bool = False,
+    prefetch: bool = True,
+    index: Optional[confluence.PageIndex] = None,
+    removed: Iterable[str] = (),
+    journal: Optional["Journal"] = None,
+    keep: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """creates or updates pages under the root page
+
+    pages are consumed as they come (a bounded queue sits between pages and
+    the upload workers) and each is published by one of workers tasks, with
+    its attachments (only those whose content changed are uploaded); the
+    client limiter keeps the requests in flight under its adaptive limit. A
+    failing page is logged and counted, it doesn't stop the upload.
+
+    With a manifest, pages whose title and body didn't change since they
+    were last published are skipped, and changed pages are updated in place
+    using the recorded id and version (no lookup). With delete, pages whose
+    source is in the manifest but not in pages are removed as well.
+
+    Removals run once the pages are published, and a page still recorded
+    for another source (a renamed script) is kept, as are the pages of the
+    sources in keep (eg. scripts that failed to render, they're not gone).
+    keep is read once pages are exhausted, so it may be filled meanwhile.
+
+    With prefetch the whole tree below root is listed upfront (a request
+    every 200 pages) into a confluence.PageIndex, and the create vs update
+    decisions are taken on it instead of looking up each title.
+
+    With a journal the updates and the published and deleted pages are
+    checkpointed as they go, to resume the upload after a crash.
+
+    Args:
+        client: an open confluence.Client
+        root: title of the root page (or the root page itself)
+        pages: PageItem items, a blocking iterable runs in a thread (pipeline.feed)
+        workers: number of upload tasks (defaults to client.max_concurrency)
+        manifest: the published pages record (it's updated, not saved)
+        delete: remove pages whose source is gone
+        prefetch: index the existing tree upfront
+        index: an index kept across calls (it's updated, prefetch is ignored)
+        removed: sources to remove (with a manifest) regardless of delete
+        journal: checkpoints of the upload (see journal.py)
+        keep: sources never removed by delete
+    Returns:
+        dict - statistics (pages and attachments counters, client and limiter stats)
+    """
+    import asyncio
+    from .pipeline import feed
+
+    workers = workers or client.max_concurrency
+    parent = root if isinstance(root, confluence.Page) else await get_root(client, root)
+    if index is None and prefetch:
+        index = await client.index(parent)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2 * workers)
+    stats: Dict[str, Any] = {
+        "published": 0,
+        "unchanged": 0,
+        "deleted": 0,
+        "failed": 0,
+        "attachments": 0,
+        "attachments_unchanged": 0,
+    }
+    titles = set()
+    sources = set()
+
+    async def publish(item: PageItem):
+        entry = manifest.get(item.source) if manifest else None
+        if manifest and not manifest.changed(item.source, item.title, item.signature):
+            stats["unchanged"] += 1
+            return
+        page = None
+        if entry:
+            if journal:
+                final = not (item.labels or item.attachments)
+                journal.begin(item.source, entry, item.title, item.signature, final)
+            try:
+                page = await client.update_page(
+                    entry.page, item.body, parent, item.title
+                )
+            except confluence.ConfluenceError as exc:
+                if exc.status not in {404, 409}:
+                    raise
+                log.debug("stale manifest entry for %s: %s", item.source, exc)
+        if page is None and index is not None:
+            page = await publish_indexed(client, index, item, parent)
+        if page is None:
+            page = await client.publish_page(item.title, item.body, parent)
+        if index is not None:
+            index.add(page)
+        if item.labels:
+            await client.add_labels(page, item.labels)
+        if item.attachments:
+            paths = [Path(p) for p in item.attachments]
+            with timer("attachments", item.source):
+                result = await sync_attachments(client, page, paths)
+            for key, value in result.items():
+                stats[key] += value
+        if manifest:
+            manifest.update(item.source, page, item.title, item.signature)
+        if journal:
+            journal.done(item.source, page, item.title, item.signature)
+        stats["published"] += 1
+
+    async def remove(source: str, entry: Entry):
+        # only the entry goes first (so the page sharing check sees it gone),
+        # the rest of the record (a Store doc) once the page is deleted
+        manifest.entries.pop(source, None)  # type: ignore
+        if manifest.by_page(entry.id):  # type: ignore
+            manifest.pop(source)  # type: ignore
+            if journal:
+                journal.deleted(source)
+            return
+        try:
+            await client.delete_page(entry.page)
+        except confluence.ConfluenceError as exc:
+            if exc.status != 404:
+                manifest.entries[source] = entry  # type: ignore
+                raise
+        manifest.pop(source)  # type: ignore
+        if journal:
+            journal.deleted(source)
+        if index is not None:
+            index.remove(entry.page)
+        stats["deleted"] += 1
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            func, args = item
+            try:
+                with timer(func.__name__, args[0]):
+                    await func(*args)
+            except asyncio.CancelledError:  # an Exception before python 3.8
+                raise
+            except Exception as exc:
+                # any error (eg. a missing attachment) fails the page, not the worker
+                stats["failed"] += 1
+                log.warning(
+                    "failed to %s %s: %s",
+                    func.__name__,
+                    args[0],
+                    exc,
+                    exc_info=not isinstance(exc, confluence.ConfluenceError),
+                )
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+    try:
+        source = pages if hasattr(pages, "__aiter__") else feed(pages)
+        async for item in source:  # type: ignore
+            if item.title in titles:
+                log.warning("duplicate page title %s (%s)", item.title, item.source)
+            titles.add(item.title)
+            sources.add(item.source)
+            await queue.put((publish, (item,)))
+        if manifest and (delete or removed):
+            await queue.join()
+            gone = manifest.removed(sources.union(keep)) if delete else []
+            gone += [(s, manifest.entries[s]) for s in removed if s in manifest.entries]
+            for args in dict(gone).items():
+                await queue.put((remove, args))
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    if STATS.enabled:
+        for key, value in stats.items():
+            STATS.count(key, value)
+        # running values of the client, not of this upload
+        for key, value in {**client.stats, **client.limiter.stats}.items():
+            STATS.gauge(key, value)
+    stats.update(client.stats)
+    stats.update(client.limiter.stats)
+    return stats
+
+
+def iter_pages(
+    results: Iterable, failed: Optional[Set[str]] = None
+) -> Iterator[PageItem]:
+    """turns batch.DocResult into PageItem, skipping errors
+
+    The sources of the errors are added to failed: they're not gone, their
+    pages must be kept (see upload keep).
+    """
+    for result in results:
+        if result.error:
+            log.warning("%s: %s", result.path, result.error)
+            if failed is not None:
+                failed.add(str(result.path))
+            continue
+        body, assets = attachments.find_assets(result.lit.body, result.path.parent)
+        yield PageItem(
+            str(result.path),
+            page_title(result.lit, result.path),
+            body,
+            tuple(str(p) for p in assets),
+            ((result.lit.meta or {}).get("parent") or "").strip(),
+            page_labels(result.lit),
+        )
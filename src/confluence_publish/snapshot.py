@@ -0,0 +1,169 @@
+"""writes a rendered site snapshot to a local directory (a dry run)
+
+The snapshot holds what a publish would upload, so two snapshots (eg.
+from two commits) can be diffed to catch rendering regressions without
+any server:
+
+    pages/<title>.html   the page bodies (storage format)
+    tree.json            the page tree: parent, source, labels, attachments
+    plan.json            the changes against the manifest (create, update,
+                         unchanged, delete) by source
+
+The pages come from the same render stage as publish (pipeline.iter_pages).
+Files are written in batches (by a few threads) into a staging directory
+next to the target, which then replaces the previous snapshot with two
+renames: a reader never sees a half written snapshot. Only a previous
+snapshot (with a tree.json) or an empty directory is ever replaced.
+
+Example:
+    pages = pipeline.iter_pages(["scripts/"])
+    snapshot.write(Path("build/site"), pages, ["scripts/"], "root")
+"""
+import concurrent.futures as cf
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from . import confluence, planner
+from .manifest import Manifest
+from .publisher import PageItem
+from .stats import timer
+
+
+def slug(title: str) -> str:
+    """a file name for title"""
+    return re.sub(r"[^\w.-]+", "-", title).strip("-.") or "page"
+
+
+def _write_batch(files: List[Tuple[Path, str]]) -> None:
+    for path, text in files:
+        path.write_text(text, encoding="utf-8")
+
+
+def replaceable(directory: Path) -> bool:
+    """True if directory is absent, empty or a previous snapshot"""
+    if not directory.exists():
+        return True
+    if not directory.is_dir():
+        return False
+    return (directory / "tree.json").is_file() or not any(directory.iterdir())
+
+
+def changes(
+    items: Iterable[PageItem], manifest: Optional[Manifest]
+) -> Dict[str, List[str]]:
+    """the sources to create, update, leave alone or delete"""
+    result: Dict[str, List[str]] = {
+        "create": [], "update": [], "unchanged": [], "delete": []
+    }
+    sources = []
+    for item in items:
+        sources.append(item.source)
+        if manifest is None or manifest.get(item.source) is None:
+            result["create"].append(item.source)
+        elif manifest.changed(item.source, item.title, item.signature):
+            result["update"].append(item.source)
+        else:
+            result["unchanged"].append(item.source)
+    if manifest:
+        result["delete"] = [source for source, _ in manifest.removed(sources)]
+    return {key: sorted(value) for key, value in result.items()}
+
+
+def write(
+    directory: Path,
+    pages: Iterable[PageItem],
+    sources: Iterable[Union[str, Path]],
+    root: str,
+    manifest: Optional[Manifest] = None,
+    batch: int = 64,
+    workers: int = 4,
+) -> Dict[str, Any]:
+    """renders pages into a snapshot in directory (replacing the previous one)
+
+    Args:
+        directory: the snapshot location
+        pages: the rendered pages (see pipeline.iter_pages)
+        sources: the sources pages were discovered from (for the tree)
+        root: title of the root page
+        manifest: the published pages record, for plan.json
+        batch: files per write batch
+        workers: threads writing the batches
+    Returns:
+        dict - statistics (pages and files written)
+    Raises:
+        ValueError: directory is not replaceable (see replaceable())
+    """
+    directory = Path(directory)
+    if not replaceable(directory):
+        raise ValueError(f"{directory} is not a snapshot, it won't be replaced")
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=directory.parent, prefix=f".{directory.name}."))
+    try:
+        items: List[PageItem] = []
+        names: Dict[str, str] = {}  # title -> file name
+        used = set()
+        source = iter(pages)
+        chunks = iter(lambda: list(itertools.islice(source, batch)), [])
+        with timer("snapshot"), cf.ThreadPoolExecutor(workers) as pool:
+            (staging / "pages").mkdir()
+            futures = []
+            for chunk in chunks:
+                files = []
+                for item in chunk:
+                    items.append(item)
+                    name = base = slug(item.title)
+                    for count in itertools.count(1):
+                        if name not in used:
+                            break
+                        name = f"{base}-{count}"
+                    used.add(name)
+                    names[item.title] = name
+                    files.append((staging / "pages" / f"{name}.html", item.body))
+                futures.append(pool.submit(_write_batch, files))
+            for future in futures:
+                future.result()
+
+            todo = planner.plan(items, sources, confluence.Page("", root))
+            tree = {
+                "root": root,
+                "pages": {
+                    title: {
+                        "parent": node.parent,
+                        "source": node.item.source if node.item else None,
+                        "file": f"pages/{names[title]}.html" if node.item else None,
+                        "labels": list(node.item.labels) if node.item else [],
+                        "attachments": list(node.item.attachments) if node.item else [],
+                    }
+                    for title, node in todo.nodes.items()
+                },
+            }
+            _write_batch(
+                [
+                    (staging / "tree.json", json.dumps(tree, indent=1, sort_keys=True)),
+                    (
+                        staging / "plan.json",
+                        json.dumps(changes(items, manifest), indent=1, sort_keys=True),
+                    ),
+                ]
+            )
+
+        # swap the snapshots: the old one is moved aside, then removed
+        previous = None
+        if directory.exists():
+            previous = Path(
+                tempfile.mkdtemp(dir=directory.parent, prefix=f".{directory.name}.")
+            )
+            os.replace(directory, previous / "old")
+        os.replace(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+    return {"pages": len(items), "files": len(items) + 2}
@@ -0,0 +1,177 @@
+"""per stage timers, counters and gauges
+
+The hot paths are wrapped in timer(name) blocks: when stats are enabled
+(STATS.enabled, see StatsArguments) each block is accounted under name,
+together with the slowest keys (source files) for that name.
+
+Work done in the process pool is timed with collect(): the timings for
+each file travel back with its result and are merged in the main
+process with STATS.merge.
+
+Counters add up, gauges (eg. the limiter concurrency limit, the running
+totals of a client) keep the last value set.
+
+Example:
+    STATS.enabled = True
+    with timer("load_doc", key=str(path)):
+        doc2lit.load_doc(path)
+    print(json.dumps(STATS.report()))
+"""
+import atexit
+import contextlib
+import heapq
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import cli
+
+
+log = logging.getLogger(__name__)
+
+
+class Stats:
+    """timers (count, total, max and slowest keys), counters and gauges
+
+    Args:
+        slowest: number of slowest keys tracked for each timer
+    """
+
+    def __init__(self, slowest: int = 10):
+        self.enabled = False
+        self.slowest = slowest
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = time.perf_counter()
+        self.timers: Dict[str, List[float]] = {}  # name -> [count, total, max]
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, Any] = {}
+        self.heaps: Dict[str, List[Tuple[float, str]]] = {}
+
+    def add(self, name: str, seconds: float, key: Optional[str] = None) -> None:
+        timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+        if key is not None and self.slowest:
+            heap = self.heaps.setdefault(name, [])
+            if len(heap) < self.slowest:
+                heapq.heappush(heap, (seconds, key))
+            elif seconds > heap[0][0]:
+                heapq.heapreplace(heap, (seconds, key))
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: Any) -> None:
+        self.gauges[name] = value
+
+    def merge(self, timings: Dict[str, float], key: Optional[str] = None) -> None:
+        """accounts timings (from collect) under key"""
+        for name, seconds in timings.items():
+            self.add(name, seconds, key)
+
+    def report(self) -> Dict[str, Any]:
+        """returns the stats as a json serializable dict"""
+        return {
+            "wall": time.perf_counter() - self.started,
+            "timers": {
+                name: {
+                    "count": int(count),
+                    "total": total,
+                    "mean": total / count if count else 0.0,
+                    "max": top,
+                }
+                for name, (count, total, top) in sorted(self.timers.items())
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "gauges": dict(sorted(self.gauges.items())),
+            "slowest": {
+                name: [
+                    {"key": key, "seconds": seconds}
+                    for seconds, key in sorted(heap, reverse=True)
+                ]
+                for name, heap in sorted(self.heaps.items())
+            },
+        }
+
+
+STATS = Stats()
+
+_collector = threading.local()
+
+
+@contextlib.contextmanager
+def timer(name: str, key: Optional[str] = None) -> Iterator[None]:
+    """times the block into the active collect() or into STATS (if enabled)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings = getattr(_collector, "timings", None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+        elif STATS.enabled:
+            STATS.add(name, elapsed, key)
+
+
+@contextlib.contextmanager
+def collect() -> Iterator[Dict[str, float]]:
+    """collects the timer() blocks run in the current thread into a dict"""
+    saved = getattr(_collector, "timings", None)
+    timings: Dict[str, float] = {}
+    _collector.timings = timings
+    try:
+        yield timings
+    finally:
+        _collector.timings = saved
+
+
+class StatsArguments(cli.Argument):
+    def __init__(self):
+        """Adds support for --stats|--profile run instrumentation
+
+        --stats writes the json report of STATS at exit, --profile dumps a
+        cProfile of the run (for pstats or snakeviz).
+
+        Example:
+
+            In the main script
+              p = cli.ArgumentParser()
+              p.add_argument(stats.StatsArguments)
+        """
+        super(StatsArguments, self).__init__({"stats", "profile", "slowest"})
+        self.profiler: Any = None
+
+    def add_arguments(self, parser, **kwargs):
+        parser.add_argument("--stats", help="write a json timings report here")
+        parser.add_argument("--profile", help="write a cProfile dump here")
+        parser.add_argument("--slowest", type=int, default=10, help="files per timer")
+
+    def process(self, options):
+        if not (options.stats or options.profile):
+            return
+        STATS.slowest = options.slowest
+        STATS.enabled = True
+        STATS.reset()
+        if options.profile:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        atexit.register(self.dump, options.stats, options.profile)
+
+    def dump(self, report: Optional[str], profile: Optional[str]) -> None:
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(profile)
+            log.info("profile written to %s", profile)
+        if report:
+            from pathlib import Path
+
+            Path(report).write_text(json.dumps(STATS.report(), indent=2))
+            log.info("stats written to %s", report)
@@ -0,0 +1,285 @@
+"""sqlite record of the extracted docs and of what has been published
+
+A Store is a drop in replacement for manifest.Manifest (same methods, and
+entries as a mapping) for large libraries: lookups are indexed, writes go
+into a transaction committed every `batch` writes or `interval` seconds and
+by save(), and the database runs in WAL mode so readers (eg. reports, other
+CI jobs) don't block the writer nor each other. The transaction is kept
+short: the write lock isn't held for a whole upload.
+
+Next to the pages it records the extracted docs (pipeline.iter_pages with
+a store): file stat and sha256, the Litterate fields and meta, so the
+other stages can query it instead of rescanning the sources. The doc of a
+source is dropped with its page (pop()).
+
+    docs   source, mtime_ns, size, sha256, title, summary, body, meta
+           (json), kind, rendered (time)
+    pages  source, id, version, title, digest, published (time)
+
+Example:
+    store = Store.load("build/publish.db")
+    if store.changed("script.py", title, body):
+        ...
+        store.update("script.py", page, title, body)
+    store.save()
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import (
+    Any, Dict, Iterable, Iterator, List, MutableMapping, Optional, Tuple, Union
+)
+
+from .batch import DocResult
+from .confluence import Page
+from .manifest import Entry, digest
+
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    source TEXT PRIMARY KEY,
+    mtime_ns INTEGER,
+    size INTEGER,
+    sha256 TEXT,
+    title TEXT,
+    summary TEXT,
+    body TEXT,
+    meta TEXT,
+    kind TEXT,
+    rendered REAL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    source TEXT PRIMARY KEY,
+    id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    published REAL
+);
+CREATE INDEX IF NOT EXISTS pages_id ON pages (id);
+CREATE INDEX IF NOT EXISTS pages_title ON pages (title);
+"""
+
+
+class _Entries(MutableMapping[str, Entry]):
+    "the pages table as a source -> Entry mapping"
+
+    def __init__(self, store: "Store"):
+        self.store = store
+
+    def __getitem__(self, source: str) -> Entry:
+        rows = self.store.query(
+            "SELECT id, version, title, digest FROM pages WHERE source = ?", (source,)
+        )
+        if not rows:
+            raise KeyError(source)
+        return Entry(*rows[0])
+
+    def __setitem__(self, source: str, entry: Entry) -> None:
+        self.store.write(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+            (source, entry.id, entry.version, entry.title, entry.digest, time.time()),
+        )
+
+    def __delitem__(self, source: str) -> None:
+        if source not in self:
+            raise KeyError(source)
+        self.store.write("DELETE FROM pages WHERE source = ?", (source,))
+
+    def __contains__(self, source: object) -> bool:
+        return bool(self.store.query("SELECT 1 FROM pages WHERE source = ?", (source,)))
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self.store.query("SELECT source FROM pages ORDER BY source")
+        return iter([source for source, in rows])
+
+    def __len__(self) -> int:
+        return self.store.query("SELECT COUNT(*) FROM pages")[0][0]
+
+    def items(self) -> List[Tuple[str, Entry]]:  # type: ignore
+        rows = self.store.query(
+            "SELECT source, id, version, title, digest FROM pages ORDER BY source"
+        )
+        return [(source, Entry(*row)) for source, *row in rows]
+
+    def values(self) -> List[Entry]:  # type: ignore
+        return [entry for _, entry in self.items()]
+
+
+class Store:
+    """the sqlite database in path
+
+    Args:
+        path: database file (created on demand)
+        batch: writes per transaction (save() commits the pending ones)
+        interval: max seconds a transaction is kept open by writes
+        timeout: seconds to wait for another writer
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        batch: int = 500,
+        interval: float = 1.0,
+        timeout: float = 30.0,
+    ):
+        self.path = Path(path)
+        self.batch = batch
+        self.interval = interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(
+            str(self.path), timeout=timeout, check_same_thread=False
+        )
+        self.lock = threading.RLock()
+        self.pending = 0
+        self.started = 0.0
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode = WAL")
+            self.db.execute("PRAGMA synchronous = NORMAL")
+            version = self.db.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise ValueError(f"{self.path}: unknown schema version {version}")
+            self.db.executescript(_SCHEMA)
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.db.commit()
+        self.entries = _Entries(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Store":
+        """opens the store in path (an empty one if path doesn't exist)"""
+        return cls(path)
+
+    def query(self, sql: str, params: Iterable[Any] = ()) -> List[Tuple]:
+        """the rows selected by sql"""
+        with self.lock:
+            return self.db.execute(sql, tuple(params)).fetchall()
+
+    def write(self, sql: str, params: Iterable[Any] = (), many: bool = False) -> None:
+        """runs an update, committing once batch writes are pending or the
+        transaction is interval seconds old"""
+        with self.lock:
+            if not self.pending:
+                self.started = time.monotonic()
+            if many:
+                rows = list(params)
+                self.db.executemany(sql, rows)
+                self.pending += len(rows)
+            else:
+                self.db.execute(sql, tuple(params))
+                self.pending += 1
+            if (
+                self.pending >= self.batch
+                or time.monotonic() - self.started >= self.interval
+            ):
+                self.save()
+
+    def save(self, path: Optional[Union[str, Path]] = None) -> None:
+        """commits the pending writes (path is only for Manifest compatibility)"""
+        if path is not None and Path(path) != self.path:
+            raise ValueError(f"a Store is saved in place ({self.path})")
+        with self.lock:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self) -> None:
+        self.save()
+        self.db.close()
+
+    # the manifest.Manifest interface
+    def get(self, source: str) -> Optional[Entry]:
+        return self.entries.get(source)
+
+    def changed(self, source: str, title: str, body: str) -> bool:
+        entry = self.entries.get(source)
+        return entry is None or entry.digest != digest(title, body)
+
+    def update(self, source: str, page: Page, title: str, body: str) -> None:
+        self.entries[source] = Entry(page.id, page.version, title, digest(title, body))
+
+    def pop(self, source: str) -> Optional[Entry]:
+        """drops the page of source, and its doc (the source is gone)"""
+        entry = self.entries.pop(source, None)
+        self.write("DELETE FROM docs WHERE source = ?", (source,))
+        return entry
+
+    def removed(self, sources: Iterable[str]) -> List[Tuple[str, Entry]]:
+        """returns the entries whose source is not in sources"""
+        sources = set(sources)
+        return [(k, v) for k, v in self.entries.items() if k not in sources]
+
+    def by_page(self, id: str) -> List[str]:
+        """the sources published to the page id"""
+        rows = self.query("SELECT source FROM pages WHERE id = ?", (id,))
+        return [source for source, in rows]
+
+    # the extracted docs
+    def record(self, results: Iterable[DocResult]) -> Iterator[DocResult]:
+        """stores the docs in results (see batch.render_docs) passing them on"""
+        sql = "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        rows = []
+        mtime: Optional[int]
+        size: Optional[int]
+        for result in results:
+            lit = result.lit
+            if lit is not None:
+                try:
+                    stat = result.path.stat()
+                    mtime, size = stat.st_mtime_ns, stat.st_size
+                except OSError:
+                    mtime = size = None
+                rows.append(
+                    (
+                        str(result.path),
+                        mtime,
+                        size,
+                        result.sha256,
+                        lit.title,
+                        lit.summary,
+                        lit.body,
+                        json.dumps(lit.meta),
+                        lit.kind.name if lit.kind else None,
+                        time.time(),
+                    )
+                )
+                if len(rows) >= self.batch:
+                    # a burst: committed before the docs go on to upload
+                    self.write(sql, rows, many=True)
+                    self.save()
+                    rows = []
+            yield result
+        if rows:
+            self.write(sql, rows, many=True)
+
+    def doc(self, source: str) -> Optional[Dict[str, Any]]:
+        """the recorded doc for source (a dict of the docs columns)"""
+        with self.lock:
+            cursor = self.db.execute(
+                "SELECT * FROM docs WHERE source = ?", (source,)
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        result = dict(zip([c[0] for c in cursor.description], row))
+        result["meta"] = json.loads(result["meta"])
+        return result
+
+    def report(self) -> Dict[str, int]:
+        """counts of the recorded docs and pages"""
+        return {
+            "docs": self.query("SELECT COUNT(*) FROM docs")[0][0],
+            "pages": len(self.entries),
+            "unpublished": self.query(
+                "SELECT COUNT(*) FROM docs"
+                " WHERE source NOT IN (SELECT source FROM pages)"
+            )[0][0],
+        }
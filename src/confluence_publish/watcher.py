@@ -0,0 +1,381 @@
+"""filesystem watchers and the incremental republish loop
+
+InotifyWatcher uses the linux inotify api (through ctypes, so there's no
+extra dependency), PollingWatcher compares stat snapshots every interval
+and works everywhere else. Both yield batches of changed paths, debounced:
+a batch is reported once no event came in for delay seconds, so an editor
+saving (or a checkout touching) many files triggers a single republish.
+
+Example:
+    with make_watcher(["scripts/"]) as watcher:
+        for changed in watcher:
+            print(sorted(changed))
+"""
+import abc
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple, Union
+
+from . import batch, confluence, doc2lit, publisher
+from .manifest import Manifest
+
+
+log = logging.getLogger(__name__)
+
+
+class Watcher(abc.ABC):
+    """reports the changed (modified, created or deleted) scripts in sources
+
+    Args:
+        sources: files, directories or globs (as batch.discover)
+        pattern: file pattern in directories
+        delay: debounce time, in seconds
+    """
+
+    def __init__(
+        self,
+        sources: Iterable[Union[str, Path]],
+        pattern: str = "*.py",
+        delay: float = 0.2,
+    ):
+        self.sources = [str(s) for s in sources]
+        self.pattern = pattern
+        self.delay = delay
+        # the sources as files, resolved so "./a.py" matches the a.py events
+        self.files = {Path(s).resolve() for s in self.sources}
+        self.names = {path.name for path in self.files}
+        # directory -> watched recursively
+        self.roots: Dict[Path, bool] = {}
+        for source in self.sources:
+            path = Path(source)
+            if path.is_dir():
+                self.roots[path] = True
+            elif path.exists():
+                self.roots.setdefault(path.parent, False)
+            else:
+                base = Path(batch.glob_base(source))
+                if base.is_dir():
+                    self.roots[base] = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self) -> Iterator[Set[Path]]:
+        while True:
+            changed = self.wait()
+            if changed:
+                yield changed
+
+    def close(self) -> None:
+        pass
+
+    def matches(self, path: Path) -> bool:
+        """True if path is (or would be) one of the sources scripts"""
+        if path.name in self.names and path.resolve() in self.files:
+            return True
+        text = str(path)
+        for source in self.sources:
+            base = Path(source)
+            if base in self.roots and self.roots[base] and base in path.parents:
+                if fnmatch.fnmatch(path.name, self.pattern):
+                    return True
+            elif fnmatch.fnmatch(text, source) or fnmatch.fnmatch(
+                text, source.replace("**/", "")
+            ):
+                return True
+        return False
+
+    def scan(self) -> Dict[Path, Tuple[int, int]]:
+        """stat of the current scripts, path -> (mtime_ns, size)"""
+        result = {}
+        for root, recursive in self.roots.items():
+            for path in root.rglob("*") if recursive else root.iterdir():
+                if not self.matches(path):
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                result[path] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    @abc.abstractmethod
+    def poll(self, timeout: Optional[float]) -> Set[Path]:
+        """returns the changes seen within timeout (None blocks until one)"""
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """returns the next (debounced) batch of changes
+
+        Args:
+            timeout: give up (returning an empty set) after timeout seconds
+        Returns:
+            set of Path, deleted ones don't exist anymore
+        """
+        changed = self.poll(timeout)
+        while changed:
+            more = self.poll(self.delay)
+            if not more:
+                break
+            changed |= more
+        return changed
+
+
+class PollingWatcher(Watcher):
+    """compares a stat snapshot of the sources every interval seconds"""
+
+    def __init__(self, sources, pattern="*.py", delay=0.2, interval: float = 1.0):
+        super().__init__(sources, pattern, delay)
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def poll(self, timeout: Optional[float]) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.scan()
+            changed = {
+                path
+                for path in set(current) | set(self.snapshot)
+                if current.get(path) != self.snapshot.get(path)
+            }
+            self.snapshot = current
+            if changed:
+                return changed
+            left = self.interval if deadline is None else deadline - time.monotonic()
+            if left <= 0:
+                return set()
+            time.sleep(min(self.interval, left))
+
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_IN_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_IN_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (then name)
+
+
+class InotifyWatcher(Watcher):
+    """linux inotify events (a watch for each directory below the roots)
+
+    Raises:
+        OSError: inotify is not available (or out of watches)
+    """
+
+    def __init__(self, sources, pattern="*.py", delay=0.2):
+        super().__init__(sources, pattern, delay)
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is linux only")
+        self.libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, Tuple[Path, bool]] = {}
+        try:
+            for root, recursive in self.roots.items():
+                self.add(root, recursive)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add(self, directory: Path, recursive: bool) -> Set[Path]:
+        """watches directory (and its subdirectories), returns the scripts found"""
+        found = set()
+        pending = [directory]
+        while pending:
+            path = pending.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), _IN_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in {errno.ENOENT, errno.ENOTDIR}:
+                    continue  # gone meanwhile
+                raise OSError(code, f"inotify_add_watch failed for {path}")
+            self.watches[wd] = (path, recursive)
+            if not recursive:
+                continue
+            try:
+                entries = list(os.scandir(path))
+            except OSError:
+                continue
+            for entry in entries:
+                child = path / entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(child)
+                elif self.matches(child):
+                    found.add(child)
+        return found
+
+    def read(self) -> Set[Path]:
+        changed: Set[Path] = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, size = _IN_EVENT.unpack_from(data, offset)
+            offset += _IN_EVENT.size
+            name = data[offset : offset + size].rstrip(b"\0")
+            offset += size
+            if mask & IN_Q_OVERFLOW:
+                log.warning("inotify queue overflow, rescanning")
+                changed |= set(self.scan())
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches or not name:
+                continue
+            directory, recursive = self.watches[wd]
+            path = directory / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # scripts may land in it before the watch is in place
+                    changed |= self.add(path, recursive)
+                continue
+            if self.matches(path):
+                changed.add(path)
+        return changed
+
+    def poll(self, timeout: Optional[float]) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], left)
+            if not ready:
+                return set()
+            changed = self.read()
+            if changed:
+                return changed
+
+
+def make_watcher(
+    sources: Iterable[Union[str, Path]],
+    pattern: str = "*.py",
+    delay: float = 0.2,
+    polling: bool = False,
+    interval: float = 1.0,
+) -> Watcher:
+    """returns an InotifyWatcher, or a PollingWatcher where it's not available"""
+    sources = list(sources)
+    if not polling:
+        try:
+            return InotifyWatcher(sources, pattern, delay)
+        except (OSError, AttributeError) as exc:
+            log.info("inotify unavailable (%s), polling every %ss", exc, interval)
+    return PollingWatcher(sources, pattern, delay, interval)
+
+
+async def run(
+    client: confluence.Client,
+    root: str,
+    watcher: Watcher,
+    manifest: Optional[Manifest] = None,
+    delete: bool = False,
+    kind: doc2lit.LitterateType = doc2lit.LitterateType.MD,
+    cachedir: Optional[Path] = None,
+    extras: Optional[Iterable[str]] = None,
+    batches: Optional[int] = None,
+) -> Dict[str, Any]:
+    """republishes the scripts reported by watcher, until cancelled
+
+    The root page and the tree index are looked up once, and the client
+    (with its connections) stays open; each batch of changes is extracted
+    and rendered in process (keeping the renderers and caches warm) and
+    only the changed pages are uploaded. The manifest is saved after each
+    batch when it has a path; without one an in memory manifest still
+    skips the saves that didn't change a page.
+
+    Args:
+        client: an open confluence.Client
+        root: title of the root page
+        watcher: the change source
+        manifest: the published pages record
+        delete: remove the pages of deleted scripts
+        batches: stop after this many batches (None runs forever)
+        (see batch.render_docs for the others)
+    Returns:
+        dict - statistics summed over the batches (the client and limiter
+            stats, running values, are the last ones)
+    """
+    import asyncio
+
+    loop = asyncio.get_event_loop()
+    manifest = manifest if manifest is not None else Manifest()
+    parent = await publisher.get_root(client, root)
+    index = await client.index(parent)
+    totals: Dict[str, Any] = {}
+    log.info(
+        "watching %i root(s) with %s", len(watcher.roots), type(watcher).__name__
+    )
+    while batches is None or batches > 0:
+        # a bounded wait, so the thread never outlives a cancellation for long
+        changed = await loop.run_in_executor(None, watcher.wait, 1.0)
+        if not changed:
+            continue
+        present = sorted(p for p in changed if p.is_file())
+        gone = sorted(str(p) for p in changed if not p.is_file())
+        results = batch.render_docs(
+            present,
+            kind=kind,
+            workers=0,
+            cachedir=cachedir,
+            extras=extras,
+            keep_raw=False,
+        )
+        stats = await publisher.upload(
+            client,
+            parent,
+            list(publisher.iter_pages(results)),
+            manifest=manifest,
+            index=index,
+            removed=gone if delete else (),
+        )
+        if manifest.path:
+            manifest.save()
+        log.info(
+            "%i change(s): %i published, %i unchanged, %i deleted, %i failed",
+            len(changed),
+            stats["published"],
+            stats["unchanged"],
+            stats["deleted"],
+            stats["failed"],
+        )
+        for key, value in stats.items():
+            if key not in client.stats and key not in client.limiter.stats:
+                totals[key] = totals.get(key, 0) + value
+        if batches is not None:
+            batches -= 1
+    totals.update(client.stats)
+    totals.update(client.limiter.stats)
+    return totals
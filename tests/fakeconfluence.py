@@ -0,0 +1,252 @@
+"""an in memory Confluence REST api server for tests
+
+Example:
+    async with FakeConfluence() as fake:
+        async with confluence.Client(fake.url, "SPACE") as client:
+            ...
+        assert fake.pages
+
+    # or, for code calling asyncio.run itself
+    with FakeConfluence().threaded() as fake:
+        main.publish(..., url=fake.url)
+"""
+import asyncio
+import contextlib
+import itertools
+import threading
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+class FakeConfluence:
+    def __init__(self, space: str = "SPACE"):
+        self.space = space
+        self.pages: Dict[str, Dict[str, Any]] = {}
+        self.requests: List[str] = []
+        # statuses (or (status, retry-after)) returned by the next requests
+        self.failures: List[Any] = []
+        # a rate limit: over quota requests in flight the server replies 429
+        # (with retry_after, if set), each request takes latency seconds
+        self.quota: Optional[int] = None
+        self.retry_after: Optional[float] = None
+        self.latency = 0.0
+        self.inflight = 0
+        self.peak = 0  # the most requests in flight (quota or not)
+        self.throttled = 0
+        self._ids = itertools.count(1000)
+
+        self.app = web.Application(middlewares=[self._middleware])
+        self.app.add_routes(
+            [
+                web.get("/rest/api/content", self.search),
+                web.post("/rest/api/content", self.create),
+                web.get("/rest/api/content/{id}", self.get),
+                web.get("/rest/api/content/{id}/descendant/page", self.descendants),
+                web.put("/rest/api/content/{id}", self.update),
+                web.delete("/rest/api/content/{id}", self.delete),
+                web.post("/rest/api/content/{id}/label", self.label),
+                web.get("/rest/api/content/{id}/child/attachment", self.attachments),
+                web.post("/rest/api/content/{id}/child/attachment", self.attach),
+                web.post(
+                    "/rest/api/content/{id}/child/attachment/{aid}/data", self.attach
+                ),
+            ]
+        )
+        self.server: Optional[TestServer] = None
+
+    async def __aenter__(self):
+        self.server = TestServer(self.app)
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.server.close()
+
+    @contextlib.contextmanager
+    def threaded(self):
+        "runs the server in a background thread"
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(self.__aenter__(), loop).result()
+        try:
+            yield self
+        finally:
+            asyncio.run_coroutine_threadsafe(self.__aexit__(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    @property
+    def url(self) -> str:
+        return str(self.server.make_url(""))
+
+    def add_page(self, title: str, body: str = "", parent: Optional[str] = None) -> str:
+        pid = str(next(self._ids))
+        self.pages[pid] = {
+            "id": pid,
+            "title": title,
+            "space": self.space,
+            "parent": parent,
+            "version": 1,
+            "body": body,
+            "attachments": {},
+            "labels": set(),
+        }
+        return pid
+
+    def by_title(self, title: str) -> Optional[Dict[str, Any]]:
+        for page in self.pages.values():
+            if page["title"] == title:
+                return page
+        return None
+
+    def _json(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": page["id"],
+            "type": "page",
+            "title": page["title"],
+            "version": {"number": page["version"]},
+            "ancestors": [{"id": page["parent"]}] if page["parent"] else [],
+            "body": {"storage": {"value": page["body"], "representation": "storage"}},
+        }
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.requests.append(f"{request.method} {request.path}")
+        if self.failures:
+            failure = self.failures.pop(0)
+            status, retry = failure if isinstance(failure, tuple) else (failure, None)
+            headers = {"Retry-After": str(retry)} if retry is not None else {}
+            return web.Response(status=status, headers=headers, text="failure")
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        try:
+            if self.quota is not None and self.inflight > self.quota:
+                self.throttled += 1
+                headers = {}
+                if self.retry_after is not None:
+                    headers["Retry-After"] = str(self.retry_after)
+                return web.Response(status=429, headers=headers, text="rate limited")
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return await handler(request)
+        finally:
+            self.inflight -= 1
+
+    async def search(self, request):
+        title = request.query.get("title")
+        results = [
+            self._json(page)
+            for page in self.pages.values()
+            if page["space"] == request.query.get("spaceKey")
+            and (title is None or page["title"] == title)
+        ]
+        return web.json_response({"results": results, "size": len(results)})
+
+    async def descendants(self, request):
+        children: Dict[Optional[str], List[str]] = {}
+        for page in self.pages.values():
+            children.setdefault(page["parent"], []).append(page["id"])
+        found = list(children.get(request.match_info["id"], []))
+        for pid in found:
+            found.extend(children.get(pid, []))
+
+        start = int(request.query.get("start", 0))
+        limit = min(int(request.query.get("limit", 25)), 500)
+        results = [self._json(self.pages[pid]) for pid in found[start : start + limit]]
+        links = {}
+        if start + limit < len(found):
+            query = dict(request.query, start=str(start + limit), limit=str(limit))
+            links["next"] = str(request.rel_url.with_query(query))
+        return web.json_response(
+            {
+                "results": results,
+                "start": start,
+                "limit": limit,
+                "size": len(results),
+                "_links": links,
+            }
+        )
+
+    async def get(self, request):
+        page = self.pages.get(request.match_info["id"])
+        if not page:
+            raise web.HTTPNotFound()
+        return web.json_response(self._json(page))
+
+    async def create(self, request):
+        data = await request.json()
+        if self.by_title(data["title"]):
+            raise web.HTTPBadRequest(text="a page with this title already exists")
+        ancestors = data.get("ancestors") or [{}]
+        pid = self.add_page(
+            data["title"], data["body"]["storage"]["value"], ancestors[-1].get("id")
+        )
+        return web.json_response(self._json(self.pages[pid]))
+
+    async def update(self, request):
+        page = self.pages.get(request.match_info["id"])
+        if not page:
+            raise web.HTTPNotFound()
+        data = await request.json()
+        if data["version"]["number"] != page["version"] + 1:
+            raise web.HTTPConflict(text="version mismatch")
+        page["version"] += 1
+        page["title"] = data["title"]
+        page["body"] = data["body"]["storage"]["value"]
+        if data.get("ancestors"):
+            page["parent"] = data["ancestors"][-1]["id"]
+        return web.json_response(self._json(page))
+
+    async def label(self, request):
+        page = self.pages.get(request.match_info["id"])
+        if not page:
+            raise web.HTTPNotFound()
+        page["labels"].update(label["name"] for label in await request.json())
+        results = [
+            {"prefix": "global", "name": name} for name in sorted(page["labels"])
+        ]
+        return web.json_response({"results": results, "size": len(results)})
+
+    async def attachments(self, request):
+        page = self.pages.get(request.match_info["id"])
+        if not page:
+            raise web.HTTPNotFound()
+        results = [
+            {"id": a["id"], "title": a["title"], "metadata": {"comment": a["comment"]}}
+            for a in page["attachments"].values()
+        ]
+        return web.json_response({"results": results, "size": len(results)})
+
+    async def attach(self, request):
+        page = self.pages.get(request.match_info["id"])
+        if not page:
+            raise web.HTTPNotFound()
+        if request.headers.get("X-Atlassian-Token") != "nocheck":
+            raise web.HTTPForbidden()
+        fields = {}
+        async for part in await request.multipart():
+            fields[part.name] = (part.filename, await part.read())
+        filename, data = fields["file"]
+        existing = page["attachments"].get(filename)
+        if "aid" in request.match_info:
+            if not existing or existing["id"] != request.match_info["aid"]:
+                raise web.HTTPNotFound()
+        elif existing:
+            raise web.HTTPBadRequest(text="attachment already exists")
+        attachment = page["attachments"][filename] = {
+            "id": existing["id"] if existing else f"att{next(self._ids)}",
+            "title": filename,
+            "comment": fields.get("comment", ("", b""))[1].decode(),
+            "data": bytes(data),
+        }
+        reply = {"id": attachment["id"], "title": filename}
+        return web.json_response(reply if existing else {"results": [reply]})
+
+    async def delete(self, request):
+        if not self.pages.pop(request.match_info["id"], None):
+            raise web.HTTPNotFound()
+        return web.Response(status=204)
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+
+from confluence_publish import attachments, confluence, publisher
+from fakeconfluence import FakeConfluence
+
+
+def test_find_assets(tmp_path):
+    (tmp_path / "diagram.png").write_bytes(b"png")
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "table.csv").write_text("a,b")
+    (tmp_path / "other.py").write_text("")
+
+    body = (
+        '<p><img src="diagram.png" alt="a diagram" /></p>\n'
+        '<p><img src="missing.png" /> <img src="http://example.com/x.png" /></p>\n'
+        '<p>see <a href="data/table.csv">the <em>table</em></a>,'
+        ' <a href="other.py">other</a> and <a href="#anchor">here</a></p>\n'
+        '<p><img src="diagram.png" /></p>\n'
+    )
+    body, assets = attachments.find_assets(body, tmp_path)
+    assert assets == [tmp_path / "diagram.png", tmp_path / "data" / "table.csv"]
+    assert body == (
+        '<p><ac:image><ri:attachment ri:filename="diagram.png" /></ac:image></p>\n'
+        '<p><img src="missing.png" /> <img src="http://example.com/x.png" /></p>\n'
+        '<p>see <ac:link><ri:attachment ri:filename="table.csv" />'
+        "<ac:plain-text-link-body><![CDATA[the table]]></ac:plain-text-link-body>"
+        '</ac:link>, <a href="other.py">other</a> and <a href="#anchor">here</a></p>\n'
+        '<p><ac:image><ri:attachment ri:filename="diagram.png" /></ac:image></p>\n'
+    )
+
+
+def test_find_assets_outside(tmp_path):
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    (tmp_path / "secret.txt").write_text("secret")
+    (lib / "link.txt").symlink_to(tmp_path / "secret.txt")
+    secret = str(tmp_path / "secret.txt")
+
+    for src in ["../secret.txt", "sub/../../secret.txt", "link.txt", secret]:
+        body = f'<p><a href="{src}">x</a> <img src="{src}" /></p>'
+        assert attachments.find_assets(body, lib) == (body, [])
+    # an absolute path even with the slash escaped
+    body = f'<p><img src="&#47;{secret[1:]}" /></p>'
+    assert attachments.find_assets(body, lib) == (body, [])
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / "blob.bin"
+    data = bytes(range(256)) * 5000
+    path.write_bytes(data)
+    assert attachments.file_digest(path) == hashlib.sha256(data).hexdigest()
+
+    (tmp_path / "empty").write_bytes(b"")
+    assert attachments.file_digest(tmp_path / "empty") == hashlib.sha256().hexdigest()
+
+    async def read():
+        return [chunk async for chunk in attachments.chunks(path, size=100_000)]
+
+    chunks = asyncio.run(read())
+    assert [len(c) for c in chunks] == [100_000] * 12 + [80_000]
+    assert b"".join(chunks) == data
+
+
+def test_upload_attachments(tmp_path):
+    from confluence_publish.manifest import Manifest
+
+    image = tmp_path / "image.png"
+    image.write_bytes(b"\x89PNG" * 100_000)
+    item = publisher.PageItem("a.py", "a", "<p>body</p>", (str(image),))
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE") as client:
+                stats = await publisher.upload(client, "root", [item])
+                assert stats["attachments"] == 1
+                stored = fake.by_title("a")["attachments"]["image.png"]
+                assert stored["data"] == image.read_bytes()
+
+                # same content: nothing uploaded
+                stats = await publisher.upload(client, "root", [item])
+                assert (stats["attachments"], stats["attachments_unchanged"]) == (0, 1)
+
+                # a changed asset is uploaded (as a new version), even when the
+                # manifest says the page body didn't change
+                manifest = Manifest()
+                await publisher.upload(client, "root", [item], manifest=manifest)
+                image.write_bytes(b"changed")
+                stats = await publisher.upload(
+                    client, "root", [item], manifest=manifest
+                )
+                assert stats["attachments"] == 1
+                digest = hashlib.sha256(b"changed").hexdigest()
+                assert fake.by_title("a")["attachments"]["image.png"] == dict(
+                    stored, data=b"changed", comment=f"sha256:{digest}"
+                )
+
+    asyncio.run(main())
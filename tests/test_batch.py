@@ -0,0 +1,43 @@
+import pytest
+
+from confluence_publish import batch
+
+
+@pytest.fixture()
+def library(tmp_path):
+    for index in range(40):
+        path = tmp_path / f"group{index % 3}" / f"script{index:02}.py"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(f'"""doc {index}"""\n')
+    (tmp_path / "group1" / "broken.py").write_text('"""doc\n')
+    (tmp_path / "group1" / "notes.txt").write_text("not a script")
+    return tmp_path
+
+
+def test_discover(library):
+    paths = list(batch.discover([library]))
+    assert len(paths) == 41
+    assert paths == sorted(paths)
+
+    paths = list(batch.discover([library / "group0", f"{library}/**/script0*.py"]))
+    assert len(paths) == 14 + 6
+    assert len(set(paths)) == len(paths)
+
+    assert list(batch.discover([library / "missing"])) == []
+    assert batch.glob_base("a/b/**/*.py") == "a/b"
+    assert batch.glob_base("*.py") == "."
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_load_docs(library, workers):
+    paths = list(batch.discover([library]))
+    results = list(batch.load_docs(paths, workers=workers, chunksize=3))
+
+    assert [r.path for r in results] == paths
+
+    failed = [r for r in results if r.error]
+    assert [r.path.name for r in failed] == ["broken.py"]
+    assert failed[0].error.startswith("SyntaxError")
+
+    docs = {r.path.name: r.doc for r in results if not r.error}
+    assert docs["script07.py"] == "doc 7"
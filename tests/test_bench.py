@@ -0,0 +1,34 @@
+import json
+
+from confluence_publish import bench, doc2lit
+
+
+def test_make_doc():
+    doc = bench.make_doc(10_000, meta=8, seed=1)
+    assert doc == bench.make_doc(10_000, meta=8, seed=1)
+    assert 10_000 <= len(doc) < 12_000
+
+    meta, text = doc2lit.popmeta(doc)
+    assert len(meta) == 8
+    assert text.startswith("Document title\n")
+    assert doc2lit.get_doc(bench.make_script(doc)) == doc.strip()
+
+    lit = doc2lit.rst2lit(bench.make_doc(2000, kind=doc2lit.LitterateType.RST))
+    assert lit.title == "Document title"
+
+
+def test_main(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(bench, "TIERS", {"small": (512, 2, 3), "medium": (2048, 4, 2)})
+    args = ["--repeat", "1", "-b", "popmeta", "-b", "md2lit", "-t", "small"]
+
+    assert bench.main([*args, "--save", str(tmp_path / "base.json")]) == 0
+    baseline = json.loads((tmp_path / "base.json").read_text())
+    assert set(baseline) == {"popmeta/small", "md2lit/small"}
+    assert baseline["popmeta/small"]["docs"] == 3
+    assert baseline["popmeta/small"]["docs_per_s"] > 0
+    assert "popmeta/small" in capsys.readouterr().out
+
+    baseline["md2lit/small"]["docs_per_s"] *= 1000
+    (tmp_path / "base.json").write_text(json.dumps(baseline))
+    assert bench.main([*args, "--baseline", str(tmp_path / "base.json")]) == 1
+    assert "REGRESSION md2lit/small" in capsys.readouterr().err
@@ -0,0 +1,86 @@
+import os
+import time
+
+from confluence_publish import batch, cache, doc2lit
+
+
+def test_key():
+    key = cache.Cache.key(b"abc", doc2lit.LitterateType.MD)
+    assert key == cache.Cache.key(b"abc", doc2lit.LitterateType.MD)
+    assert key != cache.Cache.key(b"abd", doc2lit.LitterateType.MD)
+    assert key != cache.Cache.key(b"abc", doc2lit.LitterateType.RST)
+
+
+def test_get_put(tmp_path):
+    store = cache.Cache(tmp_path / "cache")
+    lit = doc2lit.Litterate(
+        title="a title",
+        body="<p>hello</p>",
+        meta={"a": "b"},
+        kind=doc2lit.LitterateType.MD,
+    )
+    key = store.key(b"content", doc2lit.LitterateType.MD)
+    assert store.get(key) is None
+
+    store.put(key, lit)
+    assert store.get(key) == lit
+    assert [p.name for p in (tmp_path / "cache").rglob("*")] == [key[:2], f"{key}.json"]
+
+
+def test_evict(tmp_path):
+    store = cache.Cache(tmp_path, maxsize=10_000, maxage=3600)
+    keys = [store.key(str(i).encode(), doc2lit.LitterateType.MD) for i in range(20)]
+    now = time.time()
+    for index, key in enumerate(keys):
+        store.put(key, doc2lit.Litterate(body="x" * 1000))
+        os.utime(store._entry(key), (now - index, now - index))
+    os.utime(store._entry(keys[5]), (now - 7200, now - 7200))
+
+    # keys[5] is expired, keys[10:] are the least recently used over maxsize
+    assert store.evict() == 11
+    assert [k for k in keys if store.get(k)] == [*keys[:5], *keys[6:10]]
+
+
+def test_render_docs_cached(tmp_path, monkeypatch):
+    for index in range(3):
+        (tmp_path / f"script{index}.py").write_text(
+            f'"""== endmeta ==\n## doc {index}"""'
+        )
+    paths = sorted(tmp_path.glob("*.py"))
+
+    first = list(batch.render_docs(paths, workers=0, cachedir=tmp_path / "cache"))
+    assert [r.lit.body for r in first] == [f"<h2>doc {i}</h2>\n" for i in range(3)]
+
+    def fail(*args):
+        raise RuntimeError("should not render")
+
+    monkeypatch.setattr(doc2lit, "render", fail)
+    second = list(batch.render_docs(paths, workers=0, cachedir=tmp_path / "cache"))
+    assert [r.lit for r in second] == [r.lit for r in first]
+
+    # the raw text is dropped from the results, not from the cache
+    compact = list(
+        batch.render_docs(paths, workers=0, cachedir=tmp_path / "cache", keep_raw=False)
+    )
+    assert [(r.doc, r.lit.raw) for r in compact] == [("", "")] * 3
+    again = list(batch.render_docs(paths, workers=0, cachedir=tmp_path / "cache"))
+    assert again[0].lit.raw == "## doc 0"
+
+    (tmp_path / "script1.py").write_text('"""changed"""')
+    third = list(batch.render_docs(paths, workers=0, cachedir=tmp_path / "cache"))
+    assert [bool(r.error) for r in third] == [False, True, False]
+
+
+def test_render_docs_encoding(tmp_path):
+    "the coding cookie is honored with and without the cache"
+    script = tmp_path / "latin.py"
+    script.write_bytes(
+        b'# -*- coding: latin-1 -*-\r\n"""== endmeta ==\r\n# caf\xe9\r\n"""\r\n'
+    )
+    assert doc2lit.load_doc(script) == "== endmeta ==\n# caf\xe9"
+
+    for _ in range(2):
+        [result] = batch.render_docs([script], workers=0, cachedir=tmp_path / "cache")
+        assert result.error is None
+        assert result.lit.body == "<h1>caf\xe9</h1>\n"
+    assert result.cached
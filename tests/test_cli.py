@@ -13,8 +13,108 @@ def test_cli_help(scripter):
 def test_subparsers(scripter):
     from confluence_publish.main import parse_args
 
-    options = parse_args(["publish"])
+    options = parse_args(["publish", "root"])
     assert options.commit is None
+    assert options.root == "root"
 
-    options = parse_args(["publish", "--commit"])
+    options = parse_args(["publish", "--commit", "root", "a.py", "b.py"])
     assert options.commit is True
+    assert options.sources == ["a.py", "b.py"]
+
+
+# cumulative -X importtime of confluence_publish.main, in microseconds (it's
+# about 50ms on a laptop: this leaves room for slow CI machines)
+STARTUP_BUDGET = 150_000
+HEAVY_MODULES = {"aiohttp", "asyncio", "docutils", "markdown2", "multiprocessing"}
+
+
+def importtime(args):
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    env = dict(os.environ)
+    src = str(Path(__file__).parent.parent / "src")
+    env["PYTHONPATH"] = os.pathsep.join(p for p in [src, env.get("PYTHONPATH")] if p)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def test_startup_budget():
+    modules = importtime(["-c", "import confluence_publish.main"])
+    assert not HEAVY_MODULES & set(modules)
+    assert modules["confluence_publish.main"] < STARTUP_BUDGET
+
+
+@pytest.mark.parametrize(
+    "args", [["--help"], ["publish", "--help"], ["publish", "root"]]
+)
+def test_startup_lazy(args):
+    modules = importtime(["-m", "confluence_publish.main", *args])
+    assert not HEAVY_MODULES & set(modules)
+
+
+def test_config_layers(tmp_path):
+    try:
+        import tomllib  # noqa: F401
+    except ImportError:
+        pytest.importorskip("tomli")
+    (tmp_path / "system.json").write_text(
+        '{"foo": "system", "bar": "system", "section": {"a": 1, "b": {"c": 2}}}'
+    )
+    (tmp_path / "user.toml").write_text(
+        'bar = "user"\nmy-flag = "on"\n[section.b]\nc = 3\n'
+    )
+    (tmp_path / "project.json").write_text('{"foo": "project"}')
+
+    def parse(args):
+        p = cli.ArgumentParser()
+        p.add_argument(
+            cli.ConfigArgument,
+            layers=[
+                tmp_path / "system.json",
+                tmp_path / "user.toml",
+                tmp_path / "missing.json",
+            ],
+        )
+        p.add_argument("--foo")
+        p.add_argument("--bar")
+        p.add_argument("--my-flag")
+        p.add_argument("--a", type=int)
+        p.add_argument("--c", type=int)
+        return p.parse_args(args)
+
+    options = parse([])
+    assert (options.foo, options.bar, options.my_flag) == ("system", "user", "on")
+    assert not hasattr(options, "config")
+
+    options = parse(["-c", str(tmp_path / "project.json"), "--bar", "cli"])
+    assert (options.foo, options.bar) == ("project", "cli")
+
+    options = parse(["-k", "section.b"])
+    assert (options.foo, options.c) == (None, 3)
+
+    # parsed files and merges are cached until a file changes
+    hits = cli._merge.cache_info().hits
+    parse(["-k", "section.b"])
+    assert cli._merge.cache_info().hits == hits + 1
+    loaded = cli.load_config(tmp_path / "system.json")
+    assert cli.load_config(tmp_path / "system.json") is loaded
+    (tmp_path / "system.json").write_text('{"foo": "changed!"}')
+    assert parse([]).foo == "changed!"
+
+    with pytest.raises(SystemExit):
+        parse(["-c", str(tmp_path / "missing.json")])
@@ -1,6 +1,6 @@
 import pytest
 
-from confluence_publish import doc2lit
+from confluence_publish import bench, doc2lit
 
 
 def test_getdoc(datadir):
@@ -110,5 +110,336 @@ def test_md2lit(datadir):
 
 
 def test_rst2lit(datadir):
-    src = datadir / "sample-script-with-rst.py"
-    doc2lit.rst2lit(src.read_text())
\ No newline at end of file
+    txt = doc2lit.load_doc(datadir / "sample-script-with-rst.py")
+    lit = doc2lit.rst2lit(txt)
+
+    assert lit.kind == doc2lit.LitterateType.RST
+    assert set(lit.meta) == {"author", "title", "multiline"}
+    assert lit.title == "Sample"
+    assert lit.summary == "This is an example of rst script published in confluence."
+    assert lit.body == """\
+<p>This is an example of rst script published in confluence.</p>
+"""
+
+
+def test_rst2lit_reuse():
+    publisher = doc2lit.get_rst_publisher()
+    first = doc2lit.rst2lit("== endmeta ==\nFirst\n=====\n\nsome *text*\non two lines")
+    second = doc2lit.rst2lit("== endmeta ==\n* no title\n* here")
+    assert doc2lit.get_rst_publisher() is publisher
+
+    assert (first.title, first.summary) == ("First", "some text on two lines")
+    assert first.body == "<p>some <em>text</em>\non two lines</p>\n"
+    assert (second.title, second.summary) == ("", "no title")
+    assert "<li>here</li>" in second.body
+
+
+GETDOC_CASES = [
+    "",
+    "# a comment only\n",
+    "x = 1\n",
+    "'''single'''",
+    "#!/usr/bin/env python\n# -*- coding: latin-1 -*-\n\n'''after comments'''\n",
+    "'''doc'''  # trailing comment\nimport os\n",
+    "r'''raw \\n doc'''\n",
+    "u'unicode doc'\n",
+    "b'bytes are not a doc'\n",
+    "f'fstrings are not a doc'\n",
+    "'implicit' 'concatenation'\n",
+    "'continued' \\\n  'concatenation'\n",
+    "('parenthesized doc')\n",
+    "'not a doc'.strip()\n",
+    "'doc'; x = 1\n",
+    "from __future__ import annotations\n'''not a doc'''\n",
+    "'''doc'''\nfrom __future__ import annotations\n",
+    "'''\n    indented\n      lines\n    '''\n",
+    "'\\N{BULLET} escapes \\x41'\n",
+    "@decorator\ndef f():\n    '''not a module doc'''\n",
+    "...\n",
+]
+
+
+@pytest.mark.parametrize("txt", GETDOC_CASES)
+def test_getdoc_differential(txt):
+    import ast
+
+    assert doc2lit.get_doc(txt) == (ast.get_docstring(ast.parse(txt)) or "")
+
+
+@pytest.mark.parametrize("rest", ["  x = 1\n", "def f(:\n", "x = (\n"])
+def test_getdoc_syntax_errors(rest):
+    "only the first statement is parsed: errors past the docstring go unnoticed"
+    import ast
+
+    for doc in ["'''doc'''\n", "# comment\n'doc'  # comment\n"]:
+        with pytest.raises(SyntaxError):
+            ast.parse(doc + rest)
+        assert doc2lit.get_doc(doc + rest) == "doc"
+
+    # but not in the docstring statement itself
+    for txt in ["  '''doc'''\n", "'''doc''' x\n", "'''doc\n"]:
+        with pytest.raises(SyntaxError):
+            doc2lit.get_doc(txt)
+
+
+def test_getdoc_differential_corpus():
+    "compares the fast path with ast.get_docstring on the stdlib sources"
+    import ast
+    import sysconfig
+    from pathlib import Path
+
+    checked = 0
+    stdlib = Path(sysconfig.get_paths()["stdlib"])
+    for path in sorted(stdlib.glob("*.py"))[:300]:
+        try:
+            txt = path.read_text(encoding="utf-8")
+            expected = ast.get_docstring(ast.parse(txt)) or ""
+        except (SyntaxError, UnicodeDecodeError, ValueError):
+            continue
+        assert doc2lit.get_doc(txt) == expected, path
+        checked += 1
+    assert checked > 50
+
+
+@pytest.mark.manual
+def test_getdoc_benchmark():
+    import timeit
+
+    txt = '"""' + "a docstring line\n" * 50 + '"""\n'
+    txt += "".join(
+        f"def func{i}(a, b):\n    return a + b * {i}\n\n" for i in range(5000)
+    )
+
+    fast = min(timeit.repeat(lambda: doc2lit.get_doc(txt), number=10, repeat=3))
+    slow = min(timeit.repeat(lambda: doc2lit._ast_doc(txt), number=10, repeat=3))
+    print(f"get_doc: fast {fast / 10 * 1e3:.3f}ms, ast {slow / 10 * 1e3:.3f}ms"
+          f" ({slow / fast:.0f}x)")
+    assert fast * 10 < slow
+
+
+def _popmeta_lines(txt, tag="== endmeta =="):
+    "reference (line by line) implementation of popmeta(parse=False)"
+    lines = txt.split("\n")
+    for index, line in enumerate(lines):
+        if line.strip() == tag:
+            meta = "\n".join(lines[:index]) if index else None
+            return meta, "\n".join(lines[index + 1:])
+    return txt, ""
+
+
+@pytest.mark.parametrize("txt", [
+    "",
+    "== endmeta ==",
+    "== endmeta ==\n",
+    "== endmeta ==\ntext\n== endmeta ==\nmore",
+    "a: b\n== endmeta ==",
+    "a: b\n  == endmeta ==  \r\ntext",
+    "a: b\nc: d\n\n== endmeta ==\n\ntext\n",
+    "no tag at all\njust meta",
+    "a: b\nx== endmeta ==\n== endmeta ==x\ntext",
+])
+def test_popmeta_split(txt):
+    assert doc2lit.popmeta(txt, parse=False) == _popmeta_lines(txt)
+
+
+def test_popmeta_large():
+    body = "| a | b |\n" * 200_000
+    meta, text = doc2lit.popmeta("title: big\n== endmeta ==\n" + body)
+    assert meta == {"title": "big"}
+    assert text == body
+
+
+def test_parse_meta():
+    meta = doc2lit.parse_meta("""
+---
+title: a title
+empty:
+folded: >
+  first
+    second
+
+  third
+url: http://example.com:8080
+not a key value line
+""")
+    assert meta == {
+        "title": "a title",
+        "empty": "",
+        "folded": "first\n    second\n\n  third",
+        "url": "http://example.com:8080",
+    }
+    meta["title"] = "changed"
+    assert doc2lit.parse_meta("title: a title")["title"] == "a title"
+
+    # a large section (a doc without the endmeta tag) isn't kept in the cache
+    doc2lit._parse_meta.cache_clear()
+    big = "title: big\n" + "some text\n" * 1000
+    assert doc2lit.parse_meta(big) == {"title": "big"}
+    assert doc2lit._parse_meta.cache_info().currsize == 0
+
+
+def test_get_markdown():
+    import threading
+
+    md = doc2lit.get_markdown()
+    assert md is doc2lit.get_markdown(["metadata"])
+    assert md is not doc2lit.get_markdown(["metadata", "tables"])
+    assert "tables" in doc2lit.get_markdown(["tables", "metadata", "tables"]).extras
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(doc2lit.get_markdown()))
+    thread.start()
+    thread.join()
+    assert other[0] is not md
+
+
+def test_md2lit_extras():
+    txt = "== endmeta ==\n| a | b |\n|---|---|\n| 1 | 2 |\n"
+    assert "<table>" not in doc2lit.md2lit(txt).body
+    assert "<table>" in doc2lit.md2lit(txt, extras=["tables"]).body
+    # the pooled instance doesn't leak state between documents
+    lit = doc2lit.md2lit("== endmeta ==\nintro\n\n[x][a]\n\n[a]: http://x\n")
+    assert "href" in lit.body
+    assert doc2lit.md2lit("== endmeta ==\n[x][a]").body == "<p>[x][a]</p>\n"
+
+
+@pytest.mark.manual
+def test_md2lit_benchmark():
+    import time
+    from markdown2 import Markdown
+
+    docs = [
+        f"title: doc {i}\n== endmeta ==\n## Doc {i}\n\nsome *text*\n"
+        for i in range(10_000)
+    ]
+
+    start = time.perf_counter()
+    for txt in docs:
+        meta, text = doc2lit.popmeta(txt)
+        Markdown(extras=["metadata"]).convert(text)
+    fresh = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for txt in docs:
+        doc2lit.md2lit(txt)
+    pooled = time.perf_counter() - start
+
+    print(f"md2lit: fresh {fresh / len(docs) * 1e6:.1f}us/doc,"
+          f" pooled {pooled / len(docs) * 1e6:.1f}us/doc")
+
+
+def test_litterate_compact():
+    import pickle
+    import tracemalloc
+
+    lit = doc2lit.Litterate("a title", meta={"labels": "x"})
+    assert not hasattr(lit, "__dict__")
+    assert pickle.loads(pickle.dumps(lit)) == lit
+
+    frozen = lit.freeze()
+    assert pickle.loads(pickle.dumps(frozen)) == frozen
+    with pytest.raises(AttributeError):
+        frozen.title = "another"
+
+    # meta keys are shared between docs
+    first, second = (doc2lit.parse_meta(f"author: {i}\n") for i in range(2))
+    assert next(iter(first)) is next(iter(second))
+
+    def build(keep_raw):
+        tracemalloc.start()
+        lits = []
+        for i in range(10_000):
+            txt = f"title: {i}\nauthor: me\nlabels: a, b\n== endmeta ==\n" + "x" * 512
+            meta, raw = doc2lit.popmeta(txt)
+            body = f"{i}" + "y" * 512
+            lits.append(
+                doc2lit.Litterate(f"{i}", "", body, raw if keep_raw else "", meta)
+            )
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size / len(lits)
+
+    # 512 chars body and raw, 3 meta keys: 1.1KB/doc without raw, 1.6KB with
+    # it (a plain dataclass with uninterned keys takes 1.9KB)
+    compact, full = build(False), build(True)
+    assert compact < 1200
+    assert full < 1750
+
+
+# a labelled corpus of doc strings (the meta is popped before classify)
+FORMATS_CORPUS = [
+    ("md", "## Usage\n\nRun `ping.py host` to check a host.\n"),
+    ("md", "Checks hosts.\n\n```\nping.py -c 3 host\n```\n"),
+    ("md", "See [the docs](http://example.com/docs) for details.\n"),
+    ("md", "Options\n=======\n\n* `-c` count\n* `-v` verbose\n"),
+    ("md", "| option | meaning |\n|--------|---------|\n| -c | count |\n"),
+    ("md", "# Title\n\nSome **bold** text and a [link][docs].\n\n[docs]: http://x\n"),
+    ("md", "> a quote\n\nand `inline` code\n"),
+    ("md", "Dumps a db.\n\n~~~sh\ndump.py db > out.sql\n~~~\n"),
+    ("md", "### Notes\n- one\n- two\n\n![diagram](img/diagram.png)\n"),
+    ("md", "Usage: `tool.py [-h] file`\n\nConverts `file` in place.\n"),
+    ("md", "Title\n-----\n\nRead the [guide](guide.md).\n"),
+    ("md", "#### Example\n\n    indented code\n"),
+    ("md", "Loads data (see `load()` and `dump()`).\n"),
+    ("md", "A plain paragraph\nwithout any markup at all.\n"),
+    ("rst", "Usage\n~~~~~\n\nRun it.\n"),
+    ("rst", "=====\nTitle\n=====\n\nText.\n"),
+    ("rst", "Checks hosts.\n\n.. code-block:: sh\n\n    ping.py host\n"),
+    ("rst", "See `the docs <http://example.com>`_ for details.\n"),
+    ("rst", "Converts data.\n\n:param path: the file\n:returns: the data\n"),
+    ("rst", "Calls :func:`load` then :class:`Dumper`.\n"),
+    ("rst", "Example::\n\n    dump.py db\n"),
+    ("rst", ".. note::\n\n   Needs root.\n"),
+    ("rst", "Options\n-------\n\n``-c``\n    count\n\n``-v``\n    verbose\n"),
+    ("rst", ".. _usage:\n\nUsage\n^^^^^\n\nRun it.\n"),
+    ("rst", "Title\n*****\n\nSome *emphasis* and ``code``.\n"),
+    ("rst", "Dumps a db (see :ref:`usage`).\n"),
+    ("rst", "Section\n=======\n\n.. image:: img/diagram.png\n"),
+    ("rst", "Notes\n\"\"\"\"\"\n\n* one\n* two\n"),
+]
+
+
+def test_classify_corpus(datadir):
+    corpus = [
+        (doc2lit.LitterateType[kind.upper()], doc) for kind, doc in FORMATS_CORPUS
+    ]
+    for name, kind in [
+        ("markdown", doc2lit.LitterateType.MD), ("rst", doc2lit.LitterateType.RST)
+    ]:
+        txt = doc2lit.load_doc(datadir / f"sample-script-with-{name}.py")
+        meta, text = doc2lit.popmeta(txt)
+        corpus.append((kind, text))
+        corpus.extend(
+            (kind, bench.make_doc(2000, kind=kind, seed=seed)) for seed in range(10)
+        )
+
+    wrong = [doc for kind, doc in corpus if doc2lit.classify(doc) != kind]
+    assert len(wrong) / len(corpus) <= 0.05, wrong
+
+
+def test_detect():
+    md, rst = doc2lit.LitterateType.MD, doc2lit.LitterateType.RST
+    assert doc2lit.detect("== endmeta ==\nplain text\n") == md
+    assert doc2lit.detect("== endmeta ==\nplain text\n", default=rst) == rst
+    assert doc2lit.detect("== endmeta ==\n.. note::\n\n   x\n") == rst
+    # without the tag the whole doc is classified
+    assert doc2lit.detect(".. note::\n\n   x\n") == rst
+    assert doc2lit.detect("format: md\n.. note::\n\n   x\n") == md
+    # the meta wins over the content
+    assert doc2lit.detect("format: md\n== endmeta ==\n.. note::\n\n   x\n") == md
+    assert doc2lit.detect("format: RST\n== endmeta ==\n## x\n") == rst
+    # an unknown format falls back to detection
+    assert doc2lit.detect("format: asciidoc\n== endmeta ==\n.. note::\n\n   x\n") == rst
+    # only the head is looked at
+    assert doc2lit.classify("x\n" * doc2lit.DETECT_SIZE + ".. note::\n") == md
+    # as is the head of a doc without the tag there (meta included)
+    txt = "a: b\n" * 2000 + "format: md\n== endmeta ==\n## x\n"
+    assert doc2lit.detect(txt, default=rst) == rst
+    assert doc2lit.detect("format: rst\n" + "a: b\n" * 2000 + "== endmeta ==\n") == rst
+
+    lit = doc2lit.render(
+        "== endmeta ==\nTitle\n~~~~~\n\nText.\n", doc2lit.LitterateType.AUTO
+    )
+    assert (lit.kind, lit.title) == (rst, "Title")
+    lit = doc2lit.render("== endmeta ==\n## Title\n", doc2lit.LitterateType.AUTO)
+    assert (lit.kind, lit.body) == (md, "<h2>Title</h2>\n")
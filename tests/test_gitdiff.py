@@ -0,0 +1,139 @@
+import asyncio
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from confluence_publish import confluence, gitdiff, pipeline
+from confluence_publish.manifest import Manifest
+from fakeconfluence import FakeConfluence
+
+
+pytestmark = pytest.mark.skipif(not shutil.which("git"), reason="git is missing")
+
+
+def git(*args):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def script(path, title):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f'"""title: {title}\n== endmeta ==\n# {title}\n"""')
+
+
+@pytest.fixture()
+def repo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    git("init", "-q")
+    for name in ["a", "b", "c", "e"]:
+        script(Path("lib") / f"{name}.py", name)
+    script(Path("other") / "x.py", "x")
+    Path("lib/notes.txt").write_text("notes")
+    git("add", ".")
+    git("commit", "-q", "-m", "base")
+
+    script(Path("lib") / "a.py", "a changed")
+    Path("lib/sub").mkdir()
+    git("mv", "lib/b.py", "lib/sub/b.py")
+    git("rm", "-q", "lib/c.py")
+    script(Path("lib") / "d.py", "d")
+    script(Path("other") / "x.py", "x changed")
+    Path("lib/notes.txt").write_text("more notes")
+    git("add", ".")
+    git("commit", "-q", "-m", "change")
+    return tmp_path
+
+
+def test_diff(repo):
+    changes = gitdiff.diff("HEAD~1..HEAD")
+    assert {(c.status, c.path.name, c.old and c.old.name) for c in changes} == {
+        ("M", "a.py", None),
+        ("R", "b.py", "b.py"),
+        ("D", "c.py", None),
+        ("A", "d.py", None),
+        ("M", "x.py", None),
+        ("M", "notes.txt", None),
+    }
+    with pytest.raises(gitdiff.GitError):
+        gitdiff.diff("nowhere..HEAD")
+
+
+def test_affected(repo):
+    paths, removed = gitdiff.affected("HEAD~1..HEAD", ["lib"])
+    assert paths == [Path("lib/a.py"), Path("lib/d.py"), Path("lib/sub/b.py")]
+    assert removed == ["lib/b.py", "lib/c.py"]
+
+    # named as batch.discover does, for globs and files too
+    assert gitdiff.affected("HEAD~1..HEAD", ["lib/**/*.py"])[0] == paths
+    assert gitdiff.affected("HEAD~1..HEAD", [repo / "other" / "x.py"]) == (
+        [repo / "other" / "x.py"], []
+    )
+
+    # a single revision compares with the working tree
+    script(Path("lib") / "d.py", "d again")
+    assert gitdiff.affected("HEAD", ["lib", "other"]) == ([Path("lib/d.py")], [])
+
+
+def test_publish_changes(repo):
+    manifest = Manifest(repo / "manifest.json")
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE") as client:
+                git("checkout", "-q", "HEAD~1")
+                await pipeline.run(
+                    client, "root", ["lib"], workers=0, manifest=manifest
+                )
+                assert sorted(manifest.entries) == [
+                    "lib/a.py", "lib/b.py", "lib/c.py", "lib/e.py"
+                ]
+
+                git("checkout", "-q", "-")
+                paths, removed = gitdiff.affected("HEAD~1..HEAD", ["lib"])
+                stats = await pipeline.run(
+                    client,
+                    "root",
+                    ["lib"],
+                    workers=0,
+                    paths=paths,
+                    manifest=manifest,
+                    removed=removed,
+                )
+            assert (stats["published"], stats["deleted"]) == (3, 1)
+            assert fake.by_title("a changed") and fake.by_title("d")
+            assert fake.by_title("c") is None
+            assert fake.by_title("b")  # renamed, not removed
+
+    asyncio.run(main())
+    assert sorted(manifest.entries) == [
+        "lib/a.py", "lib/d.py", "lib/e.py", "lib/sub/b.py"
+    ]
+
+
+def test_publish_changes_delete(repo):
+    "--delete with --changes only removes the scripts removed in the range"
+    from confluence_publish import main
+
+    options = dict(commit=True, sources=["lib"], workers=0, space="SPACE", delete=True)
+    with FakeConfluence().threaded() as fake:
+        git("checkout", "-q", "HEAD~1")
+        main.publish("root", url=fake.url, manifest="manifest.json", **options)
+        git("checkout", "-q", "-")
+        main.publish(
+            "root",
+            url=fake.url,
+            manifest="manifest.json",
+            changes="HEAD~1..HEAD",
+            **options,
+        )
+        assert fake.by_title("c") is None
+        assert fake.by_title("e") and fake.by_title("b")
+        assert fake.by_title("a changed") and fake.by_title("d")
+
+    entries = Manifest.load(repo / "manifest.json").entries
+    assert sorted(entries) == ["lib/a.py", "lib/d.py", "lib/e.py", "lib/sub/b.py"]
@@ -0,0 +1,147 @@
+import asyncio
+import dataclasses as dc
+
+import pytest
+
+from confluence_publish import confluence, publisher
+from confluence_publish.journal import Journal, reconcile, replay
+from confluence_publish.manifest import Entry, Manifest, digest
+from fakeconfluence import FakeConfluence
+
+
+def test_replay(tmp_path):
+    path = tmp_path / "publish.journal"
+    with Journal(path, sync_every=10, sync_interval=60) as journal:
+        for index in range(25):
+            journal.done(f"{index}.py", confluence.Page(str(index), "t", 2), "t", "b")
+        assert journal.stats == {"lines": 25, "syncs": 2}
+        journal.begin("1.py", Entry("1", 2, "t", "x"), "t", "new")
+        journal.begin("2.py", Entry("2", 2, "t", "x"), "t", "new", final=False)
+        journal.done("2.py", confluence.Page("2", "t", 3), "t", "new")
+        journal.deleted("3.py")
+    assert journal.stats["syncs"] == 3
+    # a killed run leaves a line cut short
+    with open(path, "ab") as fp:
+        fp.write(b'{"op":"done","sou')
+
+    manifest = Manifest(entries={"3.py": Entry("3", 1, "t", "x")})
+    pending = replay(path, manifest)
+    assert list(pending) == ["1.py"]
+    assert pending["1.py"]["version"] == 2
+    assert pending["1.py"]["digest"] == digest("t", "new")
+    assert len(manifest.entries) == 24 and "3.py" not in manifest.entries
+    assert manifest.get("2.py") == Entry("2", 3, "t", digest("t", "new"))
+    assert not manifest.changed("0.py", "t", "b")
+
+    assert replay(tmp_path / "missing.journal", manifest) == {}
+    # without append the journal starts over
+    Journal(path).close()
+    assert path.read_bytes() == b""
+
+
+def test_resume(tmp_path):
+    path = tmp_path / "publish.journal"
+    pages = [
+        publisher.PageItem(f"{i}.py", f"page {i}", f"<p>{i}</p>") for i in range(20)
+    ]
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE") as client:
+                # a run killed after 10 pages, its manifest never saved
+                with Journal(path) as journal:
+                    await publisher.upload(
+                        client, "root", pages[:10], manifest=Manifest(), journal=journal
+                    )
+                    record = Manifest()
+                    replay(path, record)
+                    # the update of page 0 was sent, not the one of page 1
+                    for index in [0, 1]:
+                        pages[index] = pages[index]._replace(body="<p>new</p>")
+                        entry = record.get(f"{index}.py")
+                        journal.begin(
+                            f"{index}.py", entry, f"page {index}", "<p>new</p>"
+                        )
+                    page = fake.pages[record.get("0.py").id]
+                    page.update(version=2, body="<p>new</p>")
+
+                manifest = Manifest()
+                pending = replay(path, manifest)
+                assert sorted(pending) == ["0.py", "1.py"]
+                result = await reconcile(client, manifest, pending)
+                assert result == {"landed": 1, "unsent": 1, "gone": 0}
+                assert manifest.get("0.py").version == 2
+
+                fake.requests.clear()
+                with Journal(path, append=True) as journal:
+                    stats = await publisher.upload(
+                        client, "root", pages, manifest=manifest, journal=journal
+                    )
+            counts = (stats["published"], stats["unchanged"], stats["failed"])
+            assert counts == (11, 9, 0)
+            # page 1 updated once, with the right version number
+            assert [r for r in fake.requests if r.startswith("PUT")] == [
+                f"PUT /rest/api/content/{manifest.get('1.py').id}"
+            ]
+            assert fake.by_title("page 1")["version"] == 2
+            assert fake.by_title("page 0")["version"] == 2
+            assert len(fake.pages) == 21
+
+        # the journal has the whole record (the landed update is checked again)
+        record = Manifest()
+        assert list(replay(path, record)) == ["0.py"]
+        assert record.entries.keys() == manifest.entries.keys()
+        assert record.get("1.py") == manifest.get("1.py")
+
+    asyncio.run(main())
+
+
+def test_publish_resume(tmp_path):
+    from confluence_publish import main
+
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    for name in ["a", "b", "c"]:
+        (lib / f"{name}.py").write_text(f'"""== endmeta ==\n# {name}\n"""')
+    manifest = tmp_path / "manifest.json"
+    journal = tmp_path / "manifest.json.journal"
+    options = dict(commit=True, sources=[lib], workers=0, space="SPACE")
+
+    with FakeConfluence().threaded() as fake:
+        main.publish("root", manifest=str(manifest), url=fake.url, **options)
+        assert not journal.exists()
+        entries = Manifest.load(manifest).entries
+
+        # killed before the manifest was saved, after 2 pages
+        manifest.unlink()
+        with Journal(journal) as checkpoint:
+            for source in sorted(entries)[:2]:
+                record = dc.asdict(entries[source])
+                checkpoint.write(dict(op="done", source=source, **record))
+        (lib / "c.py").write_text('"""== endmeta ==\n# c changed\n"""')
+        fake.requests.clear()
+        main.publish(
+            "root", manifest=str(manifest), resume=True, url=fake.url, **options
+        )
+        assert [r for r in fake.requests if r.startswith(("PUT", "POST"))] == [
+            f"PUT /rest/api/content/{entries[str(lib / 'c.py')].id}"
+        ]
+        assert not journal.exists()
+        assert Manifest.load(manifest).entries.keys() == entries.keys()
+
+
+def test_publish_no_manifest(tmp_path, monkeypatch):
+    from confluence_publish import main
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.py").write_text('"""== endmeta ==\n# a\n"""')
+    options = dict(commit=True, sources=[tmp_path / "a.py"], workers=0, space="SPACE")
+
+    with FakeConfluence().threaded() as fake:
+        fake.failures = [400]
+        with pytest.raises(confluence.ConfluenceError):
+            main.publish("root", url=fake.url, **options)
+        # no manifest nor --journal: nothing is left behind
+        assert list(tmp_path.iterdir()) == [tmp_path / "a.py"]
+        with pytest.raises(SystemExit):
+            main.publish("root", url=fake.url, resume=True, **options)
@@ -0,0 +1,123 @@
+import asyncio
+
+from confluence_publish import confluence, publisher
+from confluence_publish.limiter import AdaptiveLimiter
+from fakeconfluence import FakeConfluence
+
+
+def test_increase():
+    async def main():
+        limiter = AdaptiveLimiter(2, max_limit=4)
+        for _ in range(20):
+            tokens = [await limiter.acquire() for _ in range(int(limiter.limit))]
+            for token in tokens:
+                await limiter.release(token)
+        assert limiter.limit == 4
+        assert limiter.stats == {
+            "limit": 4, "limit_min": 2, "throttled": 0, "decreases": 0, "paused": 0.0
+        }
+
+        # a slot freed but not in use doesn't grow the limit
+        limiter = AdaptiveLimiter(4, max_limit=8)
+        for _ in range(20):
+            await limiter.release(await limiter.acquire())
+        assert limiter.limit == 4
+
+    asyncio.run(main())
+
+
+def test_decrease():
+    async def main():
+        limiter = AdaptiveLimiter(8, min_limit=3)
+        tokens = [await limiter.acquire() for _ in range(8)]
+        # a round of throttled replies decreases once
+        for token in tokens:
+            await limiter.release(token, throttled=True)
+        assert (limiter.limit, limiter.stats["throttled"]) == (4, 8)
+        await limiter.release(await limiter.acquire(), throttled=True)
+        assert limiter.limit == 3  # not below min_limit
+        assert limiter.stats["decreases"] == 2
+        assert limiter.stats["limit_min"] == 3
+
+        # errors are neutral
+        await limiter.release(await limiter.acquire(), neutral=True)
+        assert limiter.limit == 3
+
+        # latency over latency_factor times the best one is throttling
+        loop = asyncio.get_event_loop()
+        limiter = AdaptiveLimiter(8, latency_floor=0.01)
+        await limiter.release(await limiter.acquire())
+        _, epoch = await limiter.acquire()
+        await limiter.release((loop.time() - 1.0, epoch))
+        assert limiter.limit == 4
+        assert limiter.stats["throttled"] == 0
+
+    asyncio.run(main())
+
+
+def test_pause():
+    async def main():
+        loop = asyncio.get_event_loop()
+        limiter = AdaptiveLimiter(4)
+        token = await limiter.acquire()
+        other = await limiter.acquire()
+        await limiter.release(token, throttled=True, retry_after=0.1)
+        start = loop.time()
+        await limiter.release(await limiter.acquire())
+        assert loop.time() - start >= 0.09
+        await limiter.release(other)
+        assert 0.09 <= limiter.stats["paused"] < 0.2
+
+    asyncio.run(main())
+
+
+def test_upload_quota():
+    async def main():
+        async with FakeConfluence() as fake:
+            fake.quota = 3
+            fake.retry_after = 0.01
+            fake.latency = 0.005
+            pages = [
+                publisher.PageItem(f"{i}.py", f"page {i}", f"<p>{i}</p>")
+                for i in range(40)
+            ]
+            async with confluence.Client(
+                fake.url, "SPACE", concurrency=8, max_concurrency=12, backoff=0.001
+            ) as client:
+                stats = await publisher.upload(client, "root", pages, prefetch=False)
+            assert (stats["published"], stats["failed"]) == (40, 0)
+            assert len(fake.pages) == 41
+            assert stats["throttled"] == fake.throttled > 0
+            assert stats["decreases"] > 0
+            assert stats["limit_min"] <= 3
+            assert stats["paused"] > 0
+            # the limit converged on the quota: far fewer 429s than requests
+            assert stats["throttled"] < stats["requests"] / 2
+
+    asyncio.run(main())
+
+
+def test_upload_gauges():
+    "the limiter and client stats are running values, not summed over uploads"
+    from confluence_publish.stats import STATS
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE", concurrency=4) as client:
+                for index in range(3):
+                    pages = [publisher.PageItem(f"{index}.py", f"page {index}", "")]
+                    stats = await publisher.upload(client, "root", pages)
+        return stats
+
+    STATS.reset()
+    STATS.enabled = True
+    try:
+        stats = asyncio.run(main())
+        report = STATS.report()
+    finally:
+        STATS.enabled = False
+        STATS.reset()
+    assert report["counters"]["published"] == 3
+    assert report["gauges"]["limit"] == stats["limit"] == 4
+    assert report["gauges"]["requests"] == stats["requests"]
+    assert "limit" not in report["counters"]
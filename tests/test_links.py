@@ -0,0 +1,67 @@
+import logging
+
+from confluence_publish import links, main
+from confluence_publish.manifest import Entry, Manifest
+from confluence_publish.publisher import PageItem
+
+
+def test_resolve(tmp_path, caplog):
+    manifest = Manifest()
+    manifest.entries["lib/db/old.py"] = Entry("9", 1, "old page", "")
+    items = [
+        PageItem(
+            "lib/net/ping.py",
+            "ping",
+            '<p><a href="trace.py#usage">the <em>trace</em></a></p>',
+        ),
+        PageItem("lib/net/trace.py", "trace", '<a href="../db/old.py">old</a>'),
+        PageItem(
+            "lib/db/dump.py",
+            "dump & load",
+            '<a href="ping.py">ping</a> <a href="missing.py">x</a>'
+            ' <a href="http://x/a.py">remote</a> <a href="notes.txt">notes</a>',
+        ),
+    ]
+    with caplog.at_level(logging.WARNING):
+        result = links.resolve(items, manifest)
+
+    assert result[0].body == (
+        '<p><ac:link ac:anchor="usage"><ri:page ri:content-title="trace" />'
+        "<ac:plain-text-link-body><![CDATA[the trace]]></ac:plain-text-link-body>"
+        "</ac:link></p>"
+    )
+    # relative paths, the manifest for the pages not rendered in the run
+    assert 'ri:content-title="old page"' in result[1].body
+    # a bare file name matches the one script with that name
+    assert result[2].body.startswith('<ac:link><ri:page ri:content-title="ping" />')
+    assert result[2].body.endswith(
+        '<a href="missing.py">x</a> <a href="http://x/a.py">remote</a>'
+        ' <a href="notes.txt">notes</a>'
+    )
+    # reported once for all the pages
+    assert [r.message for r in caplog.records] == [
+        "1 unresolved link(s): lib/db/dump.py -> missing.py"
+    ]
+
+
+def test_ambiguous():
+    index = links.LinkIndex.build(
+        [PageItem("a/x.py", "a x", ""), PageItem("b/x.py", "b x", "")]
+    )
+    assert index.lookup("x.py", "a/y.py") == "a x"
+    assert index.lookup("x.py", "c/y.py") is None
+
+
+def test_publish_links(tmp_path):
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    (lib / "a.py").write_text('"""== endmeta ==\nsee [b](b.py)\n"""')
+    (lib / "b.py").write_text('"""title: the b page\n== endmeta ==\n# B\n"""')
+    site = tmp_path / "site"
+
+    main.publish("root", None, [lib], workers=0, snapshot=str(site), links=True)
+    assert (site / "pages" / "a.html").read_text() == (
+        '<p>see <ac:link><ri:page ri:content-title="the b page" />'
+        "<ac:plain-text-link-body><![CDATA[b]]></ac:plain-text-link-body>"
+        "</ac:link></p>\n"
+    )
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from confluence_publish import confluence, pipeline
+from fakeconfluence import FakeConfluence
+
+
+def test_feed_backpressure():
+    produced = []
+
+    def items():
+        for index in range(100):
+            produced.append(index)
+            yield index
+
+    async def main():
+        lead = 0
+        async for item in pipeline.feed(items(), maxsize=5):
+            await asyncio.sleep(0.001)
+            lead = max(lead, len(produced) - item)
+        return lead
+
+    # the queue holds 5 items, plus one blocked in put and one being yielded
+    assert asyncio.run(main()) <= 5 + 2
+    assert len(produced) == 100
+
+
+def test_feed_errors():
+    def items():
+        yield 1
+        raise ValueError("boom")
+
+    async def main():
+        return [item async for item in pipeline.feed(items())]
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(main())
+
+
+def test_feed_stop():
+    produced = []
+
+    def items():
+        for index in range(1000):
+            produced.append(index)
+            yield index
+
+    async def main():
+        async for item in pipeline.feed(items(), maxsize=2):
+            if item == 10:
+                break
+
+    asyncio.run(main())
+    assert len(produced) < 20
+
+
+def test_run(tmp_path):
+    for index in range(30):
+        (tmp_path / f"script{index}.py").write_text(
+            f'"""title: script {index}\n== endmeta ==\n# Script {index}\n"""'
+        )
+    (tmp_path / "broken.py").write_text('"""')
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE", concurrency=3) as client:
+                stats = await pipeline.run(
+                    client, "root", [tmp_path], workers=2, chunksize=4, buffer=4
+                )
+            assert (stats["published"], stats["failed"]) == (30, 0)
+            assert fake.by_title("script 12")["body"] == "<h1>Script 12</h1>\n"
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("tree", [False, True])
+def test_run_delete_failed(tmp_path, tree):
+    "a script failing to render keeps its page with delete"
+    from confluence_publish.manifest import Manifest
+
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    for name in ["a", "b", "c"]:
+        (lib / f"{name}.py").write_text(f'"""== endmeta ==\n# {name}\n"""')
+    manifest = Manifest(tmp_path / "manifest.json")
+
+    async def run(client):
+        return await pipeline.run(
+            client, "root", [lib], workers=0, tree=tree, manifest=manifest, delete=True
+        )
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE") as client:
+                assert (await run(client))["published"] == 3
+                (lib / "b.py").write_bytes(b'"""== endmeta ==\n# b \xff\n"""')
+                (lib / "c.py").unlink()
+                stats = await run(client)
+            assert stats["deleted"] == 1
+            assert fake.by_title("b") and fake.by_title("c") is None
+            assert sorted(manifest.entries) == [str(lib / "a.py"), str(lib / "b.py")]
+
+    asyncio.run(main())
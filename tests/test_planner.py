@@ -0,0 +1,140 @@
+import asyncio
+from pathlib import Path
+
+from confluence_publish import confluence, pipeline, planner
+from confluence_publish.manifest import Manifest
+from confluence_publish.publisher import PageItem
+from fakeconfluence import FakeConfluence
+
+
+ROOT = confluence.Page("1", "root")
+
+
+def items(base, *specs):
+    "(path, title, parent) -> PageItem"
+    return [
+        PageItem(str(base / path), title, f"<p>{title}</p>", (), parent)
+        for path, title, parent in specs
+    ]
+
+
+def test_plan(tmp_path):
+    (tmp_path / "lib").mkdir()
+    pages = items(
+        tmp_path / "lib",
+        ("top.py", "top", ""),
+        ("net/ping.py", "ping", ""),
+        ("net/ssh/scp.py", "scp", ""),
+        ("db/dump.py", "dump", "ping"),  # meta parent
+        ("db/load.py", "load", "nowhere"),  # unknown parent
+        ("a.py", "a", "b"),  # a cycle
+        ("b.py", "b", "a"),
+    )
+    todo = planner.plan(pages, [tmp_path / "lib"], ROOT)
+
+    assert todo.children() == {
+        "": ["top", "net", "db", "a"],
+        "net": ["ping", "net/ssh"],
+        "net/ssh": ["scp"],
+        "ping": ["dump"],
+        "db": ["load"],
+        "a": ["b"],
+    }
+    assert {op.action for op in todo.ops} == {planner.CREATE}
+    levels = [sorted(op.node.title for op in level) for level in todo.levels()]
+    assert levels == [
+        ["a", "db", "net", "top"],
+        ["b", "load", "net/ssh", "ping"],
+        ["dump", "scp"],
+    ]
+    assert todo.nodes["net"].body == planner.DIRECTORY_BODY
+
+
+def test_plan_existing(tmp_path):
+    (tmp_path / "lib").mkdir()
+    pages = items(
+        tmp_path / "lib",
+        ("net/ping.py", "ping", ""),
+        ("net/trace.py", "trace", ""),
+        ("db/dump.py", "dump", ""),
+    )
+    index = confluence.PageIndex(
+        [
+            ROOT,
+            confluence.Page("2", "net", parent="1"),
+            confluence.Page("3", "ping", parent="2"),
+            confluence.Page("4", "trace", parent="1"),  # in the wrong place
+            confluence.Page("5", "dump", parent="1"),  # db is missing
+        ]
+    )
+    manifest = Manifest()
+    manifest.update(pages[0].source, index.get("ping"), "ping", pages[0].signature)
+
+    todo = planner.plan(pages, [tmp_path / "lib"], ROOT, index, manifest)
+    assert [(op.action, op.node.title, op.after) for op in todo.ops] == [
+        ("create", "db", None),
+        ("move", "trace", None),
+        ("move", "dump", "db"),
+    ]
+
+
+def test_publish(tmp_path):
+    lib = tmp_path / "lib"
+    for path, meta in [
+        ("top.py", "labels: a, b"),
+        ("net/ping.py", ""),
+        ("net/ssh/scp.py", ""),
+        ("db/dump.py", "parent: ping"),
+    ]:
+        (lib / path).parent.mkdir(parents=True, exist_ok=True)
+        (lib / path).write_text(f'"""{meta}\n== endmeta ==\n# {Path(path).stem}\n"""')
+    manifest = Manifest(tmp_path / "manifest.json")
+
+    async def publish(fake):
+        async with confluence.Client(fake.url, "SPACE", concurrency=2) as client:
+            return await pipeline.run(
+                client, "root", [lib], workers=0, tree=True, manifest=manifest
+            )
+
+    def parent(fake, title):
+        return fake.pages[fake.by_title(title)["parent"]]["title"]
+
+    async def main():
+        async with FakeConfluence() as fake:
+            stats = await publish(fake)
+            assert (stats["create"], stats["published"], stats["failed"]) == (7, 4, 0)
+            assert parent(fake, "scp") == "net/ssh"
+            assert parent(fake, "net/ssh") == "net"
+            assert parent(fake, "dump") == "ping"
+            assert fake.by_title("top")["labels"] == {"a", "b"}
+
+            stats = await publish(fake)
+            assert (stats["unchanged"], stats["requests"]) == (4, 2)
+
+            (lib / "net" / "ping.py").rename(lib / "db" / "ping.py")
+            stats = await publish(fake)
+            assert (stats["move"], stats["update"], stats["create"]) == (1, 0, 0)
+            assert parent(fake, "ping") == "db"
+
+    asyncio.run(main())
+
+
+def test_apply_errors(tmp_path):
+    "any error fails its op and the ones below it, not the others"
+    lib = tmp_path / "lib"
+    pages = [
+        PageItem(str(lib / "net" / "ping.py"), "ping", "<p>ping</p>"),
+        PageItem(str(lib / "net" / "scp.py"), "scp", "", (str(tmp_path / "x.png"),)),
+        PageItem(str(lib / "db" / "dump.py"), "dump", "<p>dump</p>"),
+        PageItem(str(lib / "db" / "load.py"), "load", "", parent="scp"),
+    ]
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE", concurrency=2) as client:
+                stats = await planner.publish(client, "root", pages, [lib])
+            assert (stats["published"], stats["failed"]) == (2, 2)
+            assert fake.by_title("ping") and fake.by_title("dump")
+            assert fake.by_title("load") is None
+
+    asyncio.run(asyncio.wait_for(main(), 10))
@@ -0,0 +1,216 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from confluence_publish import confluence, publisher
+from fakeconfluence import FakeConfluence
+
+
+def test_retry_after():
+    assert confluence.retry_after(None) is None
+    assert confluence.retry_after("3") == 3.0
+    assert confluence.retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert confluence.retry_after("garbage") is None
+    # without a zone the date is in UTC
+    assert confluence.retry_after("Wed, 21 Oct 2015 07:28:00") == 0.0
+    when = datetime.now(timezone.utc) + timedelta(seconds=60)
+    assert 50 < confluence.retry_after(when.strftime("%a, %d %b %Y %H:%M:%S")) <= 60
+
+
+def test_client_retries():
+    async def main():
+        async with FakeConfluence() as fake:
+            fake.add_page("a page")
+            fake.failures = [503, (429, 0), 502]
+            async with confluence.Client(fake.url, "SPACE", backoff=0.001) as client:
+                page = await client.find_page("a page")
+                assert client.stats == {"requests": 4, "retries": 3}
+            assert page == confluence.Page(page.id, "a page", 1)
+
+            fake.failures = [503] * 3
+            async with confluence.Client(
+                fake.url, "SPACE", retries=2, backoff=0.001
+            ) as client:
+                with pytest.raises(confluence.ConfluenceError) as exc:
+                    await client.find_page("a page")
+                assert exc.value.status == 503
+
+            async with confluence.Client(fake.url, "SPACE") as client:
+                with pytest.raises(confluence.ConfluenceError) as exc:
+                    await client.create_page("a page", "")
+                assert exc.value.status == 400
+                assert client.stats["retries"] == 0
+
+                # a POST may have been processed: only refused ones are retried
+                fake.failures = [500]
+                with pytest.raises(confluence.ConfluenceError) as exc:
+                    await client.create_page("new page", "")
+                assert exc.value.status == 500
+                assert client.stats["retries"] == 0
+                fake.failures = [(429, 0), 503]
+                client.backoff = 0.001
+                assert await client.create_page("new page", "")
+                assert client.stats["retries"] == 2
+
+    asyncio.run(main())
+
+
+def test_upload():
+    async def main():
+        async with FakeConfluence() as fake:
+            fake.add_page("existing", "old")
+            pages = [
+                publisher.PageItem(f"{i}.py", f"page {i}", f"<p>{i}</p>")
+                for i in range(50)
+            ]
+            pages.append(publisher.PageItem("existing.py", "existing", "new"))
+            async with confluence.Client(fake.url, "SPACE", concurrency=4) as client:
+                stats = await publisher.upload(client, "root", pages)
+            assert stats["published"] == 51
+            assert stats["failed"] == 0
+
+            root = fake.by_title("root")
+            assert root["parent"] is None
+            assert len(fake.pages) == 52
+            assert fake.by_title("page 7")["body"] == "<p>7</p>"
+            assert fake.by_title("page 7")["parent"] == root["id"]
+            assert fake.by_title("existing")["version"] == 2
+            assert fake.by_title("existing")["parent"] == root["id"]
+
+    asyncio.run(main())
+
+
+def test_upload_errors(tmp_path):
+    "any error fails its page only, not the upload"
+
+    async def main():
+        async with FakeConfluence() as fake:
+            pages = [
+                publisher.PageItem(f"{i}.py", f"page {i}", f"<p>{i}</p>")
+                for i in range(10)
+            ]
+            pages[3] = pages[3]._replace(attachments=(str(tmp_path / "missing.png"),))
+            async with confluence.Client(fake.url, "SPACE", concurrency=2) as client:
+                stats = await publisher.upload(client, "root", pages)
+            assert (stats["published"], stats["failed"]) == (9, 1)
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+
+
+def test_publish(datadir):
+    from confluence_publish import main
+
+    with FakeConfluence().threaded() as fake:
+        main.publish(
+            "root",
+            commit=True,
+            sources=[datadir / "sample-script-with-markdown.py"],
+            workers=0,
+            url=fake.url,
+            space="SPACE",
+        )
+        page = fake.by_title("a title")
+        assert page["parent"] == fake.by_title("root")["id"]
+        assert page["body"] == "<h2>Sample</h2>\n\n<p>This is an example of md script" \
+            " published in confluence.</p>\n"
+
+
+@pytest.mark.parametrize("name", ["manifest.json", "manifest.db"])
+def test_upload_manifest(tmp_path, name):
+    from confluence_publish.manifest import load
+
+    def items(**bodies):
+        return [publisher.PageItem(f"{k}.py", k, v) for k, v in bodies.items()]
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE") as client:
+                manifest = load(tmp_path / name)
+                stats = await publisher.upload(
+                    client,
+                    "root",
+                    items(a="1", b="2", c="3"),
+                    manifest=manifest,
+                    prefetch=False,
+                )
+                assert stats["published"] == 3
+                manifest.save()
+
+                # nothing changed: only the root lookup hits the server
+                fake.requests.clear()
+                manifest = load(tmp_path / name)
+                stats = await publisher.upload(
+                    client,
+                    "root",
+                    items(a="1", b="2", c="3"),
+                    manifest=manifest,
+                    prefetch=False,
+                )
+                assert (stats["published"], stats["unchanged"]) == (0, 3)
+                assert fake.requests == ["GET /rest/api/content"]
+
+                # b changed (updated in place), c is gone, a was edited remotely
+                ids = {k: fake.by_title(k)["id"] for k in "abc"}
+                fake.by_title("a")["version"] = 5
+                fake.requests.clear()
+                stats = await publisher.upload(
+                    client,
+                    "root",
+                    items(a="10", b="20"),
+                    manifest=manifest,
+                    delete=True,
+                    prefetch=False,
+                )
+                assert (stats["published"], stats["deleted"]) == (2, 1)
+                assert sorted(fake.requests) == sorted([
+                    "GET /rest/api/content",
+                    f"PUT /rest/api/content/{ids['a']}",
+                    "GET /rest/api/content",
+                    f"PUT /rest/api/content/{ids['a']}",
+                    f"PUT /rest/api/content/{ids['b']}",
+                    f"DELETE /rest/api/content/{ids['c']}",
+                ])
+                assert fake.by_title("c") is None
+                assert fake.by_title("a")["version"] == 6
+                assert sorted(manifest.entries) == ["a.py", "b.py"]
+                assert manifest.get("a.py").version == 6
+
+    asyncio.run(main())
+
+
+def test_upload_prefetch():
+    async def main():
+        async with FakeConfluence() as fake:
+            root = fake.add_page("root")
+            for index in range(20):
+                group = fake.add_page(f"group {index}", parent=root)
+                for page in range(1000):
+                    fake.add_page(f"page {index}.{page}", parent=group)
+            fake.add_page("elsewhere")
+
+            async with confluence.Client(fake.url, "SPACE") as client:
+                index = await client.index(confluence.Page(root, "root"))
+                assert len(index) == 20_021
+                assert index.get("page 3.7").version == 1
+
+                pages = [
+                    publisher.PageItem(f"{i}.py", f"page 0.{i}", "updated")
+                    for i in range(0, 1000, 10)
+                ]
+                pages += [
+                    publisher.PageItem(f"new{i}.py", f"new {i}", "") for i in range(50)
+                ]
+                pages.append(publisher.PageItem("x.py", "elsewhere", "moved"))
+                fake.requests.clear()
+                stats = await publisher.upload(client, "root", pages)
+
+            assert (stats["published"], stats["failed"]) == (151, 0)
+            gets = [r for r in fake.requests if r.startswith("GET")]
+            # root lookup, bulk listing, the "elsewhere" title clash lookup
+            assert len(gets) == 1 + 20_020 // 200 + 1 + 1
+            assert fake.by_title("page 0.10")["version"] == 2
+            assert fake.by_title("new 3")["parent"] == root
+            assert fake.by_title("elsewhere")["parent"] == root
+
+    asyncio.run(main())
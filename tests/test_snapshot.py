@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from confluence_publish import confluence, main, snapshot
+from confluence_publish.manifest import Manifest
+from confluence_publish.publisher import PageItem
+
+
+def test_slug():
+    assert snapshot.slug("A page: title/1") == "A-page-title-1"
+    assert snapshot.slug("../..") == "page"
+
+
+def test_publish_snapshot(tmp_path):
+    lib = tmp_path / "lib"
+    (lib / "net").mkdir(parents=True)
+    (lib / "top.py").write_text('"""labels: x\n== endmeta ==\n# Top\n"""')
+    (lib / "net" / "ping.py").write_text('"""title: ping\n== endmeta ==\n# Ping\n"""')
+    (lib / "net" / "other.py").write_text('"""title: ping\n== endmeta ==\n# Other\n"""')
+    site = tmp_path / "build" / "site"
+
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.update(str(lib / "gone.py"), confluence.Page("1", "gone"), "gone", "")
+    manifest.save()
+
+    main.publish(
+        "root", None, [lib], workers=0, snapshot=str(site), manifest=str(manifest.path)
+    )
+    assert sorted(p.name for p in (site / "pages").iterdir()) == [
+        "ping-1.html", "ping.html", "top.html"
+    ]
+    assert (site / "pages" / "top.html").read_text() == "<h1>Top</h1>\n"
+    tree = json.loads((site / "tree.json").read_text())
+    assert tree["pages"]["net"]["parent"] == ""
+    assert tree["pages"]["top"]["labels"] == ["x"]
+    assert tree["pages"]["top"]["file"] == "pages/top.html"
+    plan = json.loads((site / "plan.json").read_text())
+    assert len(plan["create"]) == 3
+    assert plan["delete"] == [str(lib / "gone.py")]
+
+    # the previous snapshot is replaced, nothing is left behind
+    (lib / "net" / "other.py").unlink()
+    main.publish("root", None, [lib], workers=0, snapshot=str(site))
+    names = sorted(p.name for p in (site / "pages").iterdir())
+    assert names == ["ping.html", "top.html"]
+    assert [p.name for p in site.parent.iterdir()] == ["site"]
+
+
+def test_write_failure(tmp_path):
+    site = tmp_path / "site"
+    snapshot.write(site, [PageItem("a.py", "a", "<p>a</p>")], [], "root")
+
+    def pages():
+        yield PageItem("b.py", "b", "<p>b</p>")
+        raise RuntimeError("render failed")
+
+    with pytest.raises(RuntimeError):
+        snapshot.write(site, pages(), [], "root")
+    assert [p.name for p in tmp_path.iterdir()] == ["site"]
+    assert [p.name for p in (site / "pages").iterdir()] == ["a.html"]
+
+
+def test_write_not_snapshot(tmp_path):
+    site = tmp_path / "docs"
+    site.mkdir()
+    (site / "notes.txt").write_text("keep me")
+    pages = [PageItem("a.py", "a", "<p>a</p>")]
+
+    with pytest.raises(ValueError):
+        snapshot.write(site, pages, [], "root")
+    with pytest.raises(SystemExit):
+        main.publish("root", None, [], workers=0, snapshot=str(site))
+    (tmp_path / "file").write_text("a file")
+    with pytest.raises(ValueError):
+        snapshot.write(tmp_path / "file", pages, [], "root")
+    assert (site / "notes.txt").read_text() == "keep me"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["docs", "file"]
+
+    # an empty directory is fine
+    (site / "notes.txt").unlink()
+    snapshot.write(site, pages, [], "root")
+    assert (site / "tree.json").is_file()
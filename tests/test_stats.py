@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from confluence_publish import batch, doc2lit, main, stats
+
+
+@pytest.fixture()
+def enabled():
+    stats.STATS.reset()
+    stats.STATS.enabled = True
+    try:
+        yield stats.STATS
+    finally:
+        stats.STATS.enabled = False
+        stats.STATS.reset()
+
+
+def test_timer_disabled():
+    stats.STATS.reset()
+    with stats.timer("noop"):
+        pass
+    assert stats.STATS.timers == {}
+
+
+def test_timer_collect(enabled):
+    with stats.collect() as timings:
+        with stats.timer("a"):
+            pass
+        with stats.timer("a"):
+            pass
+    assert list(timings) == ["a"]
+    assert enabled.timers == {}  # collected, not accounted
+
+    enabled.merge(timings, "file.py")
+    with stats.timer("b", "other.py"):
+        pass
+    report = enabled.report()
+    assert report["timers"]["a"]["count"] == 1
+    assert report["timers"]["b"]["count"] == 1
+    assert report["slowest"]["a"] == [{"key": "file.py", "seconds": timings["a"]}]
+    json.dumps(report)
+
+
+def test_slowest():
+    result = stats.Stats(slowest=3)
+    for index in range(10):
+        result.add("render", float(index), f"file{index}.py")
+    result.count("files", 10)
+    report = result.report()
+    assert [s["key"] for s in report["slowest"]["render"]] == [
+        "file9.py", "file8.py", "file7.py"
+    ]
+    assert report["timers"]["render"] == {
+        "count": 10, "total": 45.0, "mean": 4.5, "max": 9.0
+    }
+    assert report["counters"] == {"files": 10}
+
+
+def test_render_docs(tmp_path, enabled):
+    for index in range(3):
+        (tmp_path / f"script{index}.py").write_text(
+            f'"""title: {index}\n== endmeta ==\n# Script {index}\n"""'
+        )
+    (tmp_path / "broken.py").write_text('"""')
+    paths = sorted(tmp_path.glob("*.py"))
+
+    for _ in range(2):
+        results = list(
+            batch.render_docs(
+                paths, doc2lit.LitterateType.MD, workers=2, cachedir=tmp_path / "cache"
+            )
+        )
+    assert results[-1].cached
+    report = enabled.report()
+    assert report["counters"] == {"cache_hits": 3, "errors": 2, "files": 8}
+    assert report["timers"]["md2lit"]["count"] == 3
+    assert report["timers"]["read"]["count"] == 8
+    assert len(report["slowest"]["md2lit"]) == 3
+
+
+def test_stats_arguments(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr(stats.atexit, "register", lambda *a: registered.append(a))
+    report = tmp_path / "stats.json"
+    options = main.parse_args(
+        ["publish", "--stats", str(report), "--slowest", "2", "root"]
+    )
+    try:
+        assert not hasattr(options, "stats")
+        assert stats.STATS.enabled
+        assert stats.STATS.slowest == 2
+        with stats.timer("load_doc", "a.py"):
+            pass
+        func, *args = registered[0]
+        func(*args)
+    finally:
+        stats.STATS.enabled = False
+        stats.STATS.slowest = 10
+    data = json.loads(report.read_text())
+    assert data["timers"]["load_doc"]["count"] == 1
@@ -0,0 +1,108 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from confluence_publish import confluence, manifest, pipeline
+from confluence_publish.store import Store
+from fakeconfluence import FakeConfluence
+
+
+def test_manifest_interface(tmp_path):
+    store = manifest.load(tmp_path / "publish.db")
+    assert isinstance(store, Store)
+    assert isinstance(manifest.load(tmp_path / "manifest.json"), manifest.Manifest)
+
+    store.update("a.py", confluence.Page("1", "a", 2), "a", "<p>a</p>")
+    store.update("b.py", confluence.Page("1", "a", 2), "a", "<p>a</p>")  # renamed
+    store.update("c.py", confluence.Page("3", "c", 1), "c", "<p>c</p>")
+    entry = manifest.Entry("1", 2, "a", manifest.digest("a", "<p>a</p>"))
+    assert store.get("a.py") == entry
+    assert not store.changed("a.py", "a", "<p>a</p>")
+    assert store.changed("a.py", "a", "<p>A</p>")
+    assert store.changed("x.py", "x", "")
+    assert store.by_page("1") == ["a.py", "b.py"]
+    assert [source for source, _ in store.removed(["a.py"])] == ["b.py", "c.py"]
+    assert store.pop("c.py").id == "3"
+    assert store.pop("c.py") is None
+    assert "c.py" not in store.entries and len(store.entries) == 2
+
+    # not visible to others until saved
+    reader = sqlite3.connect(str(tmp_path / "publish.db"))
+    assert reader.execute("SELECT COUNT(*) FROM pages").fetchone()[0] == 0
+    store.save()
+    assert reader.execute("SELECT COUNT(*) FROM pages").fetchone()[0] == 2
+    assert reader.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    store.close()
+    assert sorted(Store.load(tmp_path / "publish.db").entries) == ["a.py", "b.py"]
+
+
+def test_batched_writes(tmp_path):
+    store = Store(tmp_path / "publish.db", batch=10)
+    reader = Store(tmp_path / "publish.db")
+    for index in range(25):
+        store.update(f"{index}.py", confluence.Page(str(index), f"{index}"), "t", "b")
+        # a reader doesn't wait for the writer transaction
+        assert len(reader.entries) == index + 1 - (index + 1) % 10
+    store.save()
+    assert len(reader.entries) == 25
+
+    # nor for a transaction kept open between bursts of writes
+    store = Store(tmp_path / "publish.db", interval=0.05)
+    store.update("a.py", confluence.Page("a", "a"), "a", "b")
+    time.sleep(0.1)
+    store.update("b.py", confluence.Page("b", "b"), "b", "b")
+    assert len(reader.entries) == 27
+    store.close()
+
+    with pytest.raises(ValueError):
+        store.save(tmp_path / "elsewhere.db")
+
+
+def test_record_docs(tmp_path):
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    for name in ["a", "b"]:
+        (lib / f"{name}.py").write_text(f'"""labels: x\n== endmeta ==\n# {name}\n"""')
+    store = Store(tmp_path / "publish.db")
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE") as client:
+                return await pipeline.run(
+                    client, "root", [lib], workers=0, manifest=store
+                )
+
+    assert asyncio.run(main())["published"] == 2
+    store.save()
+
+    doc = store.doc(str(lib / "a.py"))
+    assert (doc["body"], doc["meta"]) == ("<h1>a</h1>\n", {"labels": "x"})
+    assert doc["kind"] == "MD"
+    assert len(doc["sha256"]) == 64
+    assert store.report() == {"docs": 2, "pages": 2, "unpublished": 0}
+
+    # the doc of a removed source goes with its page
+    (lib / "b.py").unlink()
+
+    async def remove(refused=False):
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE") as client:
+                if refused:
+
+                    async def delete_page(page):
+                        raise confluence.ConfluenceError("refused", 403)
+
+                    client.delete_page = delete_page
+                return await pipeline.run(
+                    client, "root", [lib], workers=0, manifest=store, delete=True
+                )
+
+    # but not when the page can't be deleted
+    assert asyncio.run(remove(refused=True))["failed"] == 1
+    assert store.doc(str(lib / "b.py")) is not None
+    assert str(lib / "b.py") in store.entries
+    assert asyncio.run(remove())["deleted"] == 1
+    assert store.doc(str(lib / "b.py")) is None
+    assert store.report() == {"docs": 1, "pages": 1, "unpublished": 0}
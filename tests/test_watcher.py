@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import pytest
+
+from confluence_publish import confluence, watcher
+from confluence_publish.manifest import Manifest
+from fakeconfluence import FakeConfluence
+
+
+def script(path, title):
+    path.write_text(f'"""title: {title}\n== endmeta ==\n# {title}\n"""')
+    return path
+
+
+def test_matches(tmp_path):
+    (tmp_path / "lib").mkdir()
+    single = script(tmp_path / "single.py", "single")
+    sources = [tmp_path / "lib", single, f"{tmp_path}/other/**/*.py"]
+    (tmp_path / "other").mkdir()
+
+    changes = watcher.PollingWatcher(sources)
+    assert changes.roots == {
+        tmp_path / "lib": True, tmp_path: False, tmp_path / "other": True
+    }
+    assert changes.matches(tmp_path / "lib" / "a" / "b.py")
+    assert not changes.matches(tmp_path / "lib" / "b.txt")
+    assert changes.matches(single)
+    assert not changes.matches(tmp_path / "another.py")
+    assert changes.matches(tmp_path / "other" / "x.py")
+    assert changes.matches(tmp_path / "other" / "a" / "x.py")
+
+
+@pytest.fixture(params=["polling", "inotify"])
+def make(request):
+    def make(sources):
+        if request.param == "polling":
+            return watcher.PollingWatcher(sources, delay=0.1, interval=0.02)
+        try:
+            return watcher.InotifyWatcher(sources, delay=0.1)
+        except (OSError, AttributeError) as exc:
+            pytest.skip(f"no inotify: {exc}")
+
+    return make
+
+
+def test_watcher_relative(tmp_path, monkeypatch, make):
+    monkeypatch.chdir(tmp_path)
+    first = script(tmp_path / "a.py", "a")
+    script(tmp_path / "b.py", "b")
+    with make(["./a.py"]) as changes:
+        assert changes.matches(first) and changes.matches(first.relative_to(tmp_path))
+        assert not changes.matches(tmp_path / "b.py")
+        assert changes.wait(0.1) == set()
+
+        time.sleep(0.01)  # a different mtime for polling
+        script(first, "changed")
+        script(tmp_path / "b.py", "changed")
+        assert [p.name for p in changes.wait(2)] == ["a.py"]
+
+
+def test_watcher(tmp_path, make):
+    first = script(tmp_path / "first.py", "first")
+    with make([tmp_path]) as changes:
+        assert changes.wait(0.1) == set()
+
+        time.sleep(0.01)  # a different mtime for polling
+        script(first, "changed")
+        second = script(tmp_path / "second.py", "second")
+        (tmp_path / "notes.txt").write_text("ignored")
+        assert changes.wait(2) == {first, second}
+
+        (tmp_path / "sub").mkdir()
+        third = script(tmp_path / "sub" / "third.py", "third")
+        first.unlink()
+        assert changes.wait(2) == {first, third}
+        assert changes.wait(0.1) == set()
+
+
+class Scripted(watcher.Watcher):
+    """reports the given batches (callables are run first)"""
+
+    def __init__(self, batches):
+        super().__init__([])
+        self.batches = list(batches)
+
+    def poll(self, timeout):
+        item = self.batches.pop(0) if self.batches else set()
+        return item() if callable(item) else item
+
+    def wait(self, timeout=None):
+        return self.poll(timeout)  # a batch each, not debounced
+
+
+def test_run(tmp_path):
+    first = script(tmp_path / "first.py", "first")
+    second = script(tmp_path / "second.py", "second")
+    renamed = tmp_path / "renamed.py"
+
+    def rename():
+        first.rename(renamed)
+        return {first, renamed}
+
+    def delete():
+        second.unlink()
+        return {second}
+
+    # published, unchanged, nothing (timeout), renamed, deleted
+    changes = Scripted([{first, second}, {first}, set(), rename, delete])
+
+    async def main():
+        async with FakeConfluence() as fake:
+            async with confluence.Client(fake.url, "SPACE") as client:
+                manifest = Manifest(tmp_path / "manifest.json")
+                stats = await watcher.run(
+                    client, "root", changes, manifest, delete=True, batches=4
+                )
+            counts = (stats["published"], stats["unchanged"], stats["deleted"])
+            assert counts == (3, 1, 1)
+            # the renamed script updates its page, the old source doesn't remove it
+            assert fake.by_title("first")["body"] == "<h1>first</h1>\n"
+            assert fake.by_title("second") is None
+
+    asyncio.run(main())
+    saved = Manifest.load(tmp_path / "manifest.json")
+    assert list(saved.entries) == [str(renamed)]
+
+
+def test_make_watcher(tmp_path):
+    changes = watcher.make_watcher([tmp_path], polling=True)
+    assert isinstance(changes, watcher.PollingWatcher)